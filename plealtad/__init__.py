@@ -5,4 +5,13 @@ logging.getLogger('odoo.addons.plealtad').setLevel(logging.WARNING)
 
 from . import models
 from . import controllers
-from . import tools
\ No newline at end of file
+from . import tools
+
+def _plealtad_post_init(env):
+    """Prepara los datos derivados de los partners existentes al instalar"""
+    env['res.partner']._backfill_phone_normalized()
+    env['res.partner']._backfill_email_key()
+    env['res.partner']._report_email_collisions()
+    env['loyalty.ledger.summary'].rebuild_all()
+    env['loyalty.point.lot'].rebuild_all()
+    env['loyalty.balance.checkpoint'].create_checkpoints()
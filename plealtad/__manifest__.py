@@ -1,6 +1,6 @@
 {
     'name': 'Programa de Lealtad',
-    'version': '17.0.2.1',
+    'version': '17.0.2.7',
     'category': 'Website',
     'summary': 'Sistema de programa de lealtad para clientes',
     'sequence': 1,
@@ -11,6 +11,7 @@
         'base',
         'website',
         'website_sale',
+        'sale',
         'auth_signup',
         'loyalty',
         'portal',
@@ -19,6 +20,7 @@
         'security/security_groups.xml',
         'security/ir.model.access.csv',
         'data/loyalty_program_data.xml',
+        'data/ir_cron_data.xml',
         'views/res_partner_views.xml',
         'views/register_templates.xml',
         'views/login_templates.xml',
@@ -37,7 +39,8 @@
             'plealtad/static/src/scss/loyalty_style.scss',
         ]
     },
+    'post_init_hook': '_plealtad_post_init',
     'application': True,
     'installable': True,
     'auto_install': False,
-}
\ No newline at end of file
+}
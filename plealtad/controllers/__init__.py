@@ -1,3 +1,6 @@
 from . import portal
 from . import register
 from . import login
+
+from . import export
+from . import metrics
\ No newline at end of file
@@ -0,0 +1,58 @@
+import logging
+from odoo import http, api, fields, _
+from odoo.http import request, content_disposition
+from odoo.modules.registry import Registry
+from werkzeug.exceptions import BadRequest
+
+_logger = logging.getLogger(__name__)
+
+
+def stream_history_csv(partner_id, date_from=None, date_to=None, sudo=False):
+    """
+    Respuesta HTTP con el historial de un partner en CSV, enviada por partes.
+
+    El cuerpo se genera después de que Odoo cierra el cursor de la petición,
+    por lo que el generador abre su propio cursor sobre la misma base.
+
+    Args:
+        partner_id (int): ID del cliente
+        date_from (str, optional): Fecha inicial (AAAA-MM-DD)
+        date_to (str, optional): Fecha final (AAAA-MM-DD)
+        sudo (bool): Leer el historial como superusuario
+
+    Returns:
+        Response: Descarga CSV con transferencia por partes
+    """
+    try:
+        date_from = fields.Datetime.to_datetime(date_from) if date_from else None
+        date_to = fields.Datetime.to_datetime(date_to) if date_to else None
+    except ValueError:
+        raise BadRequest(_('Fecha inválida.'))
+
+    dbname = request.env.cr.dbname
+    uid = request.env.uid
+    context = dict(request.env.context)
+
+    def generate():
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            history = env['loyalty.history'].sudo() if sudo else env['loyalty.history']
+            yield from history.export_history_csv(partner_id, date_from, date_to)
+
+    return request.make_response(generate(), headers=[
+        ('Content-Type', 'text/csv; charset=utf-8'),
+        ('Content-Disposition', content_disposition(f'historial_lealtad_{partner_id}.csv')),
+        ('Cache-Control', 'no-store'),
+    ])
+
+
+class LoyaltyHistoryExport(http.Controller):
+    """Descarga del historial de lealtad desde el backend."""
+
+    @http.route('/plealtad/history/export/<int:partner_id>', type='http', auth='user')
+    def export_history(self, partner_id, date_from=None, date_to=None, **kw):
+        """Exporta el historial de un cliente respetando los permisos del usuario."""
+        request.env['loyalty.history'].check_access_rights('read')
+        request.env['res.partner'].browse(partner_id).check_access_rule('read')
+        _logger.info(f'Exportación de historial de lealtad del partner {partner_id}')
+        return stream_history_csv(partner_id, date_from, date_to)
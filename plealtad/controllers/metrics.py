@@ -0,0 +1,31 @@
+from odoo import http
+from odoo.http import request
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class LoyaltyMetrics(http.Controller):
+    """Métricas del programa de lealtad en formato de Prometheus."""
+
+    @http.route('/plealtad/metrics', type='http', auth='public', methods=['GET'], sitemap=False)
+    def metrics(self, token=None, **kw):
+        """
+        Publica contadores e histogramas de todos los workers.
+
+        Requiere el token ``plealtad.metrics_token`` (parámetro ``token`` o
+        cabecera ``Authorization: Bearer``) o una sesión de administrador de
+        lealtad.
+        """
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if not token and authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):].strip()
+
+        Metric = request.env['loyalty.metric']
+        if not Metric.check_scrape_access(token):
+            return request.make_response('Forbidden', status=403)
+
+        return request.make_response(Metric.sudo().render_prometheus(), headers=[
+            ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('Cache-Control', 'no-store'),
+        ])
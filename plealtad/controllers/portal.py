@@ -1,86 +1,65 @@
 import logging
-from odoo import http, _
+from odoo import http
 from odoo.http import request
+from odoo.tools import lazy
 from odoo.addons.portal.controllers.portal import CustomerPortal
+from odoo.addons.plealtad.controllers.export import stream_history_csv
 
 _logger = logging.getLogger(__name__)
 
 class LoyaltyPortal(CustomerPortal):
 
     def _prepare_portal_layout_values(self):
-        """Añade valores del programa de lealtad al layout del portal"""
+        """
+        Añade valores del programa de lealtad al layout del portal.
+
+        Los valores son perezosos: sólo consultan el resumen de lealtad del
+        partner si una plantilla llega a leerlos, de modo que las páginas de
+        pedidos, facturas o direcciones no pagan su costo.
+        """
         values = super()._prepare_portal_layout_values()
         partner = request.env.user.partner_id
-        
-        try:
-            _logger.info(f'Preparando valores de lealtad para partner: {partner.name}')
-            
-            # Determinamos qué campos usar basándonos en su disponibilidad
-            loyalty_points = (
-                getattr(partner, 'loy_points', None) or 
-                getattr(partner, 'loyalty_points', 0)
-            )
-            
-            is_active = (
-                getattr(partner, 'loy_active', False) or 
-                getattr(partner, 'is_loyalty_active', False)
-            )
-            
-            values.update({
-                'loyalty_points': loyalty_points,
-                'is_loyalty_active': is_active,
-                'loyalty_program': partner.loyalty_program_id,
-                'page_name': 'loyalty'
-            })
-            
-            _logger.info(f'Valores de lealtad preparados: Puntos={loyalty_points}, Activo={is_active}')
-            
-        except Exception as e:
-            _logger.error(f'Error al preparar valores del portal: {str(e)}')
-            values.update({
-                'loyalty_points': 0,
-                'is_loyalty_active': False,
-                'loyalty_program': False,
-                'page_name': 'loyalty'
-            })
-            
+        snapshot = lazy(partner._get_loyalty_snapshot)
+
+        values.update({
+            'loyalty_points': lazy(lambda: snapshot['points']),
+            'is_loyalty_active': lazy(lambda: snapshot['is_active']),
+            'loyalty_program': lazy(
+                lambda: request.env['loyalty.program'].sudo().browse(snapshot['program_id'])
+            ),
+            'page_name': 'loyalty'
+        })
         return values
 
     @http.route(['/my/loyalty'], type='http', auth='user', website=True)
     def portal_loyalty(self, **kw):
         try:
-            _logger.info('Acceso al dashboard de lealtad')
+            _logger.debug('Acceso al dashboard de lealtad')
             values = self._prepare_portal_layout_values()
             
             partner = request.env.user.partner_id
             
-            # Verificación más robusta del estado de lealtad
-            is_active = (
-                partner.is_loyalty_active or 
-                (partner.loyalty_program_id and partner.loyalty_program_id.active)
-            )
-            
-            _logger.info(f'Estado de lealtad para {partner.name}: {is_active}')
+            # Resumen en caché: sin búsquedas mientras no cambien tarjetas ni historial
+            snapshot = partner._get_loyalty_snapshot()
+            is_active = snapshot['is_active']
             
             # Si no está activo, activar automáticamente
             if not is_active:
                 try:
                     partner.sudo().activate_loyalty_program()
+                    snapshot = partner._get_loyalty_snapshot()
                     is_active = True
                     _logger.info(f'Programa de lealtad activado automáticamente para {partner.name}')
                 except Exception as e:
                     _logger.error(f'Error al activar programa de lealtad: {str(e)}')
             
-            # Obtener información del programa de lealtad
-            loyalty_card = request.env['loyalty.card'].sudo().search([
-                ('partner_id', '=', partner.id)
-            ], limit=1)
-            
             # Valores específicos de lealtad
             values.update({
-                'loyalty_card': loyalty_card,
-                'loyalty_points': loyalty_card.points if loyalty_card else 0,
-                'loyalty_program': partner.loyalty_program_id,
+                'loyalty_card': request.env['loyalty.card'].sudo().browse(snapshot['card_id']),
+                'loyalty_points': snapshot['points'],
+                'loyalty_program': request.env['loyalty.program'].sudo().browse(snapshot['program_id']),
+                'loyalty_program_name': snapshot['program_name'],
+                'loyalty_expiration_date': snapshot['expiration_date'],
                 'is_loyalty_active': is_active
             })
             
@@ -96,4 +75,25 @@ class LoyaltyPortal(CustomerPortal):
             return request.render('plealtad.loyalty_error', {
                 'error_message': 'No se pudo acceder al dashboard de lealtad. Por favor, contacte con soporte.',
                 'redirect_url': '/plealtad/login'
-            })
\ No newline at end of file
+            })
+
+    @http.route(['/my/loyalty/history'], type='http', auth='user', website=True)
+    def portal_loyalty_history(self, after=None, before=None, **kw):
+        """Historial de movimientos paginado por cursor (fecha, id)."""
+        values = self._prepare_portal_layout_values()
+        partner = request.env.user.partner_id
+
+        page = partner.sudo().get_transaction_history_page(after=after, before=before)
+        values.update({
+            'transactions': page['records'],
+            'next_cursor': page['next_cursor'],
+            'prev_cursor': page['prev_cursor'],
+            'page_name': 'loyalty_history',
+        })
+        return request.render('plealtad.loyalty_history', values)
+
+    @http.route(['/my/loyalty/history/export'], type='http', auth='user', website=True)
+    def portal_loyalty_history_export(self, date_from=None, date_to=None, **kw):
+        """Descarga en CSV del historial completo del usuario."""
+        partner = request.env.user.partner_id
+        return stream_history_csv(partner.id, date_from, date_to, sudo=True)
\ No newline at end of file
@@ -3,10 +3,14 @@ from odoo import http, _, SUPERUSER_ID
 from odoo.http import request
 from odoo.exceptions import ValidationError
 from odoo.addons.auth_signup.controllers.main import AuthSignupHome
+from odoo.addons.plealtad.models.res_partner import normalize_email
 import werkzeug
 
 _logger = logging.getLogger(__name__)
 
+# Segundos que navegadores y proxies conservan la lista de estados
+STATES_MAX_AGE = 86400
+
 class LoyaltyRegister(AuthSignupHome):
     """Controlador para el registro de usuarios en el programa de lealtad."""
     
@@ -16,7 +20,7 @@ class LoyaltyRegister(AuthSignupHome):
         qcontext.update({
             'loyalty_program': True,
             'email_domains': ['gmail.com', 'outlook.com', 'hotmail.com', 'icloud.com'],
-            'countries': request.env['res.country'].sudo().search([]),
+            'countries': self._get_countries(),
         })
         return qcontext
 
@@ -39,7 +43,7 @@ class LoyaltyRegister(AuthSignupHome):
             if result['success']:
                 # Enviar correo de bienvenida
                 template = request.env.ref('plealtad.email_template_loyalty_welcome')
-                template.sudo().send_mail(partner.id, force_send=True)
+                request.env['loyalty.mail.outbox'].sudo().enqueue(template, partner.id)
                 
                 return request.render('plealtad.verification_success', {
                     'message': result['message']
@@ -68,7 +72,7 @@ class LoyaltyRegister(AuthSignupHome):
                 'error': kw.get('error', ''),
                 'has_error': bool(kw.get('error', '')),
                 'email_domains': ['gmail.com', 'outlook.com', 'hotmail.com', 'icloud.com'],
-                'countries': request.env['res.country'].sudo().search([]),
+                'countries': self._get_countries(),
                 'values': kw
             }
             
@@ -111,7 +115,9 @@ class LoyaltyRegister(AuthSignupHome):
 
             # Enviar correo de verificación
             template = request.env.ref('plealtad.email_template_loyalty_verification')
-            template.sudo().with_context(base_url=request.env['ir.config_parameter'].sudo().get_param('web.base.url')).send_mail(partner.id, force_send=True)
+            request.env['loyalty.mail.outbox'].sudo().enqueue(template, partner.id, {
+                'base_url': request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+            })
 
             # Log de éxito
             logger.log_event(
@@ -179,7 +185,7 @@ class LoyaltyRegister(AuthSignupHome):
 
         # Validar duplicados
         email = f"{post.get('email_prefix')}@{post.get('email_domain')}"
-        if request.env['res.partner'].sudo().search_count([('email', '=', email)]):
+        if request.env['res.partner'].sudo()._email_exists(email):
             logger.log_event(
                 'register',
                 'Error de validación',
@@ -188,21 +194,19 @@ class LoyaltyRegister(AuthSignupHome):
             )
             raise ValidationError(_('Este correo electrónico ya está registrado.'))
 
+        # Validar duplicados de teléfono
         phone = post.get('phone')
-    def _validate_registration_data(self, post):
-       """Valida los datos del formulario de registro.""" 
-       logger = request.env['loyalty.logger'].sudo()
-
-       # Validar duplicados de teléfono 
-       phone = post.get('phone')
-       if phone and request.env['res.partner'].sudo().search_count([('phone', '=', phone)]):
-           logger.log_event(
-               'register',
-               'Error de validación',
-               level='warning',
-               details=f'Teléfono duplicado: {phone}'
-           )
-           raise ValidationError(_('Este número de teléfono ya está registrado.'))
+        phone_normalized = request.env['res.partner'].sudo()._normalize_phone(phone)
+        if phone_normalized and request.env['res.partner'].sudo().search_count([
+            ('phone_normalized', '=', phone_normalized)
+        ], limit=1):
+            logger.log_event(
+                'register',
+                'Error de validación',
+                level='warning',
+                details=f'Teléfono duplicado: {phone}'
+            )
+            raise ValidationError(_('Este número de teléfono ya está registrado.'))
 
     def _handle_registration_error(self, post, error_message):
        """Maneja los errores durante el registro y prepara la respuesta."""
@@ -210,19 +214,21 @@ class LoyaltyRegister(AuthSignupHome):
            'error': error_message,
            'email_domains': ['gmail.com', 'outlook.com', 'hotmail.com', 'icloud.com'],
            'values': post,
-           'countries': request.env['res.country'].sudo().search([])
+           'countries': self._get_countries()
        }
        if post.get('country_id'):
            values['states'] = self._get_country_states(post['country_id'])
        return request.render('plealtad.register_template', values)
 
+    def _get_countries(self):
+       """Obtiene los países (id, name, code) desde el catálogo en caché del proceso."""
+       return request.env['res.country'].sudo()._get_cached_countries()
+
     def _get_country_states(self, country_id):
-       """Obtiene los estados/provincias de un país."""
+       """Obtiene los estados/provincias (id, name, code) de un país desde la caché."""
        if not country_id:
            return []
-       return request.env['res.country.state'].sudo().search([
-           ('country_id', '=', int(country_id))
-       ])
+       return request.env['res.country'].sudo()._get_cached_states(country_id)
 
     @http.route('/plealtad/get_states', type='json', auth='public')
     def get_states(self, country_id):
@@ -230,18 +236,41 @@ class LoyaltyRegister(AuthSignupHome):
        if not country_id:
            return []
            
-       states = self._get_country_states(country_id)
+       states = request.env['res.country'].sudo()._get_cached_states(country_id)
        return [{
-           'id': state.id,
-           'name': state.name
+           'id': state['id'],
+           'name': state['name']
        } for state in states]
 
+    @http.route('/plealtad/states/<int:country_id>', type='http', auth='public',
+                methods=['GET'], website=True, sitemap=False)
+    def get_states_http(self, country_id, **kw):
+       """
+       Variante GET de get_states cacheable por navegadores y proxies.
+
+       El ETag depende de la versión del catálogo y del idioma, que en rutas
+       website forma parte de la URL (p. ej. /es_MX/plealtad/states/156).
+       """
+       Country = request.env['res.country'].sudo()
+       etag = f'{Country._get_country_catalog_version()}-{request.env.lang}-{country_id}'
+       headers = [
+           ('ETag', f'"{etag}"'),
+           ('Cache-Control', f'public, max-age={STATES_MAX_AGE}'),
+       ]
+       if request.httprequest.if_none_match.contains(etag):
+           return request.make_response('', headers=headers, status=304)
+
+       states = Country._get_cached_states(country_id)
+       return request.make_json_response([{
+           'id': state['id'],
+           'name': state['name']
+       } for state in states], headers=headers)
+
     @http.route('/plealtad/check_email', type='json', auth='public')
     def check_email(self, email):
        """Endpoint JSON para verificar disponibilidad de email."""
-       exists = request.env['res.partner'].sudo().search_count([
-           ('email', '=', email)
-       ]) > 0
+       # El filtro en memoria responde sin consultar la base si no existe
+       exists = request.env['res.partner'].sudo()._is_contact_registered(email=email)
        
        return {
            'available': not exists,
@@ -251,9 +280,7 @@ class LoyaltyRegister(AuthSignupHome):
     @http.route('/plealtad/check_phone', type='json', auth='public')
     def check_phone(self, phone):
        """Endpoint JSON para verificar disponibilidad de teléfono."""
-       exists = request.env['res.partner'].sudo().search_count([
-           ('phone', '=', phone)
-       ]) > 0
+       exists = request.env['res.partner'].sudo()._is_contact_registered(phone=phone)
        
        return {
            'available': not exists,
@@ -264,7 +291,7 @@ class LoyaltyRegister(AuthSignupHome):
     def resend_verification(self, email):
        """Endpoint para reenviar correo de verificación."""
        partner = request.env['res.partner'].sudo().search([
-           ('email', '=', email),
+           ('email_key', '=', normalize_email(email)),
            ('is_loyalty_active', '=', False),
            ('verification_token_used', '=', False)
        ], limit=1)
@@ -284,9 +311,9 @@ class LoyaltyRegister(AuthSignupHome):
 
        # Reenviar correo
        template = request.env.ref('plealtad.email_template_loyalty_verification')
-       template.sudo().with_context(
-           base_url=request.env['ir.config_parameter'].sudo().get_param('web.base.url')
-       ).send_mail(partner.id, force_send=True)
+       request.env['loyalty.mail.outbox'].sudo().enqueue(template, partner.id, {
+           'base_url': request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+       })
 
        return {
            'success': True,
@@ -312,6 +339,6 @@ class LoyaltyRegister(AuthSignupHome):
     def _send_welcome_email(self, partner):
        """Envía el correo de bienvenida al programa de lealtad."""
        template = request.env.ref('plealtad.email_template_loyalty_welcome')
-       template.sudo().with_context(
-           base_url=request.env['ir.config_parameter'].sudo().get_param('web.base.url')
-       ).send_mail(partner.id, force_send=True)
\ No newline at end of file
+       request.env['loyalty.mail.outbox'].sudo().enqueue(template, partner.id, {
+           'base_url': request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+       })
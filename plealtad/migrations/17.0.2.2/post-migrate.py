@@ -0,0 +1,10 @@
+import logging
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+def migrate(cr, version):
+    """Rellena por lotes el teléfono normalizado de los partners existentes"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    total = env['res.partner']._backfill_phone_normalized()
+    _logger.info(f'Teléfonos normalizados durante la migración: {total}')
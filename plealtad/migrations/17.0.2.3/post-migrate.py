@@ -0,0 +1,17 @@
+import logging
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+def migrate(cr, version):
+    """
+    Rellena por lotes el correo normalizado de los partners existentes.
+
+    Los correos que sólo difieren en mayúsculas o espacios no detienen la
+    actualización: se reportan en el log y en loyalty.logger para depurarlos
+    manualmente.
+    """
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    total = env['res.partner']._backfill_email_key()
+    collisions = env['res.partner']._report_email_collisions()
+    _logger.info(f'Correos normalizados durante la migración: {total}, colisiones: {len(collisions)}')
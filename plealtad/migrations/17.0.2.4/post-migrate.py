@@ -0,0 +1,10 @@
+import logging
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+def migrate(cr, version):
+    """Construye los resúmenes de lealtad a partir del historial existente"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    total = env['loyalty.ledger.summary'].rebuild_all()
+    _logger.info(f'Resúmenes de lealtad construidos durante la migración: {total} partners')
@@ -0,0 +1,10 @@
+import logging
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+def migrate(cr, version):
+    """Genera el primer punto de control de balance a partir del historial existente"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    periods = env['loyalty.balance.checkpoint'].create_checkpoints()
+    _logger.info(f'Puntos de control de balance generados durante la migración: {periods} periodos')
@@ -0,0 +1,12 @@
+import logging
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+def migrate(cr, version):
+    """Reporta los movimientos duplicados por referencia de orden del historial existente"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    duplicates = env['loyalty.history'].report_duplicate_references()
+    if not duplicates:
+        env['loyalty.history']._create_order_reference_index()
+    _logger.info(f'Movimientos duplicados por referencia de orden: {len(duplicates)}')
\ No newline at end of file
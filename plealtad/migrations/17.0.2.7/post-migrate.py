@@ -0,0 +1,19 @@
+import logging
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+def migrate(cr, version):
+    """Genera los lotes de puntos a partir del historial existente"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    total = env['loyalty.point.lot'].rebuild_all()
+    # La fecha de expiración ya no se calcula a partir de la última actualización
+    cr.execute("""
+        UPDATE res_partner p
+           SET points_expiration_date = NULL
+         WHERE points_expiration_date IS NOT NULL
+           AND NOT EXISTS (
+               SELECT 1 FROM loyalty_point_lot l WHERE l.partner_id = p.id AND l.remaining > 0
+           )
+    """)
+    _logger.info(f'Lotes de puntos generados durante la migración: {total} partners')
\ No newline at end of file
@@ -1,4 +1,17 @@
 from . import res_partner
 from . import field_logger
 from . import loyalty_logger
-from . import loyalty_history
\ No newline at end of file
+from . import loyalty_history
+from . import loyalty_mail_outbox
+from . import loyalty_ledger_summary
+from . import loyalty_logger_daily
+from . import loyalty_card
+from . import loyalty_program
+from . import res_country
+from . import res_country_state
+from . import loyalty_balance_checkpoint
+from . import loyalty_order_queue
+from . import sale_order
+from . import loyalty_point_lot
+from . import loyalty_metric
+from . import ir_http
\ No newline at end of file
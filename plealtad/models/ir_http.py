@@ -0,0 +1,38 @@
+from odoo import models
+from odoo.http import request
+from odoo.addons.plealtad.tools.metrics import METRICS
+from werkzeug.exceptions import HTTPException
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Rutas cuyas peticiones se miden
+METRICS_ROUTE_PREFIXES = ('/plealtad/', '/my/loyalty')
+
+class IrHttp(models.AbstractModel):
+    _inherit = 'ir.http'
+
+    @classmethod
+    def _dispatch(cls, endpoint):
+        """Mide las peticiones a las rutas de lealtad, etiquetadas por ruta"""
+        routes = getattr(endpoint, 'routing', {}).get('routes') or []
+        route = next((r for r in routes if r.startswith(METRICS_ROUTE_PREFIXES)), None)
+        if not route:
+            return super()._dispatch(endpoint)
+
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = super()._dispatch(endpoint)
+            status = getattr(response, 'status_code', 200)
+            return response
+        except HTTPException as e:
+            status = e.code
+            raise
+        finally:
+            # La ruta (no la URL) mantiene acotado el número de series
+            METRICS.inc(request.db, 'plealtad_http_requests_total', {'route': route, 'status': status})
+            METRICS.observe(request.db, 'plealtad_http_request_duration_seconds',
+                            time.perf_counter() - started, {'route': route})
+            METRICS.maybe_flush(request.db)
@@ -0,0 +1,318 @@
+from odoo import models, fields, api
+from dateutil.relativedelta import relativedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Periodos mensuales con puntos de control generados
+CHECKPOINT_FIRST_PERIOD_PARAM = 'plealtad.balance_checkpoint_first_period'
+CHECKPOINT_LAST_PERIOD_PARAM = 'plealtad.balance_checkpoint_last_period'
+
+# Bloqueo que ordena la generación de periodos y el recálculo por movimientos
+CHECKPOINT_LOCK = 'plealtad.balance_checkpoint'
+
+class LoyaltyBalanceCheckpoint(models.Model):
+    """
+    Balance de puntos de cada partner al inicio de cada mes.
+
+    Un punto de control con fecha D guarda la suma de los movimientos con
+    fecha anterior a D. El balance a una fecha X es el último punto de
+    control anterior a X más la suma de los movimientos entre ambos, por lo
+    que sólo se recorre, como mucho, un mes de historial.
+
+    Los movimientos con fecha pasada recalculan en la misma transacción los
+    puntos de control posteriores del partner. La generación de un periodo
+    toma un bloqueo exclusivo y el recálculo uno compartido, y ambos leen los
+    periodos ya bajo el bloqueo: un movimiento concurrente con el cambio de
+    mes queda incluido en el periodo nuevo o lo recalcula.
+    """
+    _name = 'loyalty.balance.checkpoint'
+    _description = 'Punto de Control de Balance de Lealtad'
+    _order = 'date desc, partner_id'
+
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Cliente',
+        required=True,
+        ondelete='cascade'
+    )
+
+    date = fields.Datetime(
+        string='Fecha de Corte',
+        required=True,
+        index=True,
+        help='El balance incluye los movimientos anteriores a esta fecha'
+    )
+
+    points_balance = fields.Float(string='Balance de Puntos', readonly=True)
+
+    _sql_constraints = [
+        ('partner_date_uniq', 'unique(partner_id, date)',
+         'Sólo puede existir un punto de control por cliente y fecha.'),
+    ]
+
+    # =========================================================================
+    # Periodos
+    # =========================================================================
+    @api.model
+    def _get_periods(self):
+        """
+        Obtiene el primer y el último periodo con puntos de control.
+
+        Returns:
+            tuple: (primer periodo, último periodo) o (None, None)
+        """
+        # Lectura directa: la caché de parámetros de otro worker puede estar atrasada
+        self.env['ir.config_parameter'].flush_model(['key', 'value'])
+        self.env.cr.execute("""
+            SELECT key, value
+              FROM ir_config_parameter
+             WHERE key IN %s
+        """, ((CHECKPOINT_FIRST_PERIOD_PARAM, CHECKPOINT_LAST_PERIOD_PARAM),))
+        values = dict(self.env.cr.fetchall())
+        first = values.get(CHECKPOINT_FIRST_PERIOD_PARAM)
+        last = values.get(CHECKPOINT_LAST_PERIOD_PARAM)
+        if not first or not last:
+            return None, None
+        return fields.Datetime.to_datetime(first), fields.Datetime.to_datetime(last)
+
+    @api.model
+    def _lock_periods(self, shared=False):
+        """
+        Toma el bloqueo de los periodos hasta el final de la transacción.
+
+        Args:
+            shared (bool): Bloqueo compartido, para recalcular puntos de control
+        """
+        function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+        self.env.cr.execute(f"SELECT {function}(hashtext(%s))", (CHECKPOINT_LOCK,))
+
+    @api.model
+    def _month_start(self, date):
+        """Inicio del mes (UTC) de una fecha"""
+        return date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    # =========================================================================
+    # Generación
+    # =========================================================================
+    @api.model
+    def create_checkpoints(self, until=None, commit=False):
+        """
+        Genera los puntos de control mensuales pendientes hasta ``until``.
+
+        Cada periodo se calcula a partir del anterior más los movimientos del
+        mes; el primero recorre el historial completo.
+
+        Args:
+            until (datetime, optional): Fecha límite; por defecto y como
+                máximo, el mes en curso
+            commit (bool): Confirmar la transacción después de cada periodo
+
+        Returns:
+            int: Número de periodos generados
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        # Nunca se generan periodos futuros (ver ``_refresh_partners``)
+        current = self._month_start(fields.Datetime.now())
+        target = min(self._month_start(until), current) if until else current
+
+        self.env['loyalty.history'].flush_model()
+        generated = 0
+        while True:
+            # Los periodos se leen bajo el bloqueo: la transacción anterior
+            # pudo confirmarse después de la lectura de otro proceso
+            self._lock_periods()
+            first, last = self._get_periods()
+            period = last + relativedelta(months=1) if last else target
+            if period > target:
+                break
+            self.env.cr.execute("""
+                INSERT INTO loyalty_balance_checkpoint (
+                    partner_id, date, points_balance,
+                    create_uid, create_date, write_uid, write_date
+                )
+                SELECT partner_id, %(period)s, SUM(points),
+                       %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+                  FROM (
+                      SELECT partner_id, points_balance AS points
+                        FROM loyalty_balance_checkpoint
+                       WHERE date = %(previous)s
+                   UNION ALL
+                      SELECT partner_id,
+                             CASE
+                                 WHEN transaction_type = 'earn' THEN points
+                                 WHEN transaction_type IN ('redeem', 'expire') THEN -points
+                                 ELSE 0
+                             END
+                        FROM loyalty_history
+                       WHERE date < %(period)s
+                         AND (%(previous)s IS NULL OR date >= %(previous)s)
+                  ) movements
+              GROUP BY partner_id
+                    ON CONFLICT (partner_id, date) DO UPDATE SET
+                       points_balance = EXCLUDED.points_balance,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+            """, {'period': period, 'previous': last, 'uid': self.env.uid})
+            count = self.env.cr.rowcount
+
+            if not first:
+                first = period
+                params.set_param(CHECKPOINT_FIRST_PERIOD_PARAM, fields.Datetime.to_string(first))
+            params.set_param(CHECKPOINT_LAST_PERIOD_PARAM, fields.Datetime.to_string(period))
+            generated += 1
+            if commit:
+                self.env.cr.commit()
+            _logger.info(f'Puntos de control de balance al {period}: {count} partners')
+
+        self.invalidate_model()
+        return generated
+
+    @api.model
+    def _cron_create_checkpoints(self):
+        """Método para cron de puntos de control mensuales"""
+        try:
+            self.create_checkpoints(commit=True)
+        except Exception as e:
+            _logger.error(f'Error en cron de puntos de control de balance: {str(e)}')
+
+    @api.model
+    def _refresh_partners(self, starts):
+        """
+        Recalcula en una sola sentencia los puntos de control afectados por
+        movimientos con fecha anterior al último periodo.
+
+        Args:
+            starts (dict): {partner_id: (fecha, id)} primer movimiento afectado
+        """
+        # No hay periodos posteriores al mes en curso: los movimientos del mes
+        # no afectan ningún punto de control y no toman el bloqueo
+        current = self._month_start(fields.Datetime.now())
+        if not starts or min(date for date, _record_id in starts.values()) >= current:
+            return
+
+        self._lock_periods(shared=True)
+        first, last = self._get_periods()
+        if not last:
+            return
+
+        partner_ids, periods = [], []
+        for partner_id, (date, _record_id) in starts.items():
+            if date < last:
+                partner_ids.append(partner_id)
+                periods.append(max(self._month_start(date) + relativedelta(months=1), first))
+        if not partner_ids:
+            return
+
+        self.env.cr.execute("""
+            INSERT INTO loyalty_balance_checkpoint (
+                partner_id, date, points_balance,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT s.partner_id, p.date, COALESCE(b.balance, 0),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%(partner_ids)s::int[], %(periods)s::timestamp[]) AS s(partner_id, period)
+        CROSS JOIN LATERAL generate_series(s.period, %(last)s::timestamp, interval '1 month') AS p(date)
+         LEFT JOIN LATERAL (
+                SELECT SUM(CASE
+                           WHEN h.transaction_type = 'earn' THEN h.points
+                           WHEN h.transaction_type IN ('redeem', 'expire') THEN -h.points
+                           ELSE 0
+                       END) AS balance
+                  FROM loyalty_history h
+                 WHERE h.partner_id = s.partner_id
+                   AND h.date < p.date
+               ) b ON TRUE
+          ORDER BY s.partner_id, p.date
+                ON CONFLICT (partner_id, date) DO UPDATE SET
+                   points_balance = EXCLUDED.points_balance,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, {
+            'partner_ids': partner_ids,
+            'periods': periods,
+            'last': last,
+            'uid': self.env.uid,
+        })
+        self.invalidate_model()
+
+    # =========================================================================
+    # Consultas
+    # =========================================================================
+    @api.model
+    def get_partner_balance(self, partner_id, date):
+        """
+        Balance de un partner a una fecha: último punto de control anterior
+        más la suma de los movimientos posteriores hasta la fecha.
+
+        Args:
+            partner_id (int): ID del cliente
+            date (datetime): Fecha de consulta (inclusive)
+
+        Returns:
+            float: Balance de puntos
+        """
+        self.env['loyalty.history'].flush_model()
+        self.env.cr.execute("""
+            WITH checkpoint AS (
+                SELECT date, points_balance
+                  FROM loyalty_balance_checkpoint
+                 WHERE partner_id = %(partner_id)s
+                   AND date <= %(date)s
+              ORDER BY date DESC
+                 LIMIT 1
+            )
+            SELECT COALESCE((SELECT points_balance FROM checkpoint), 0)
+                 + COALESCE(SUM(CASE
+                       WHEN h.transaction_type = 'earn' THEN h.points
+                       WHEN h.transaction_type IN ('redeem', 'expire') THEN -h.points
+                       ELSE 0
+                   END), 0)
+              FROM loyalty_history h
+             WHERE h.partner_id = %(partner_id)s
+               AND h.date <= %(date)s
+               AND h.date >= COALESCE((SELECT date FROM checkpoint), '-infinity')
+        """, {'partner_id': partner_id, 'date': date})
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def get_balances_as_of(self, date):
+        """
+        Balance de todos los partners con movimientos a una fecha.
+
+        Usa los puntos de control del último periodo anterior a la fecha y
+        suma sólo los movimientos posteriores a ese periodo.
+
+        Args:
+            date (datetime): Fecha de consulta (inclusive)
+
+        Returns:
+            dict: {partner_id: balance}
+        """
+        self.check_access_rights('read')
+        self.env['loyalty.history'].flush_model()
+        first, last = self._get_periods()
+        period = None
+        if first and date >= first:
+            period = min(self._month_start(date), last)
+
+        self.env.cr.execute("""
+            SELECT partner_id, SUM(points)
+              FROM (
+                  SELECT partner_id, points_balance AS points
+                    FROM loyalty_balance_checkpoint
+                   WHERE date = %(period)s
+               UNION ALL
+                  SELECT partner_id,
+                         CASE
+                             WHEN transaction_type = 'earn' THEN points
+                             WHEN transaction_type IN ('redeem', 'expire') THEN -points
+                             ELSE 0
+                         END
+                    FROM loyalty_history
+                   WHERE date <= %(date)s
+                     AND (%(period)s IS NULL OR date >= %(period)s)
+              ) movements
+          GROUP BY partner_id
+        """, {'period': period, 'date': date})
+        return dict(self.env.cr.fetchall())
@@ -0,0 +1,53 @@
+from odoo import models, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Campos de la tarjeta que forman parte del resumen de lealtad del partner
+SNAPSHOT_FIELDS = {'partner_id', 'program_id', 'points', 'active'}
+
+class LoyaltyCard(models.Model):
+    _inherit = 'loyalty.card'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        cards = super().create(vals_list)
+        self.env['res.partner']._schedule_loyalty_sync(cards.partner_id.ids)
+        return cards
+
+    def write(self, vals):
+        changed = self._filter_changed(vals)
+        if not changed:
+            return super().write(vals)
+        partner_ids = changed.partner_id.ids
+        result = super().write(vals)
+        self.env['res.partner']._schedule_loyalty_sync(partner_ids + changed.partner_id.ids)
+        return result
+
+    def unlink(self):
+        partner_ids = self.partner_id.ids
+        result = super().unlink()
+        self.env['res.partner']._schedule_loyalty_sync(partner_ids)
+        return result
+
+    def _filter_changed(self, vals):
+        """
+        Filtra las tarjetas en las que ``vals`` cambia algún campo del resumen.
+
+        Una importación que reescribe los mismos puntos no invalida el resumen
+        de los partners.
+
+        Args:
+            vals (dict): Valores a escribir
+
+        Returns:
+            loyalty.card: Tarjetas con algún valor distinto
+        """
+        fields_list = [self._fields[fname] for fname in SNAPSHOT_FIELDS.intersection(vals)]
+        if not fields_list:
+            return self.browse()
+        new_values = [(field, field.convert_to_cache(vals[field.name], self)) for field in fields_list]
+        return self.filtered(lambda card: any(
+            field.convert_to_cache(card[field.name], card) != value
+            for field, value in new_values
+        ))
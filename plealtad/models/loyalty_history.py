@@ -1,15 +1,39 @@
 # loyalty_history.py
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import SQL, index_exists
+from datetime import datetime
+import csv
+import io
 import logging
+import uuid
 
 _logger = logging.getLogger(__name__)
 
+# Campos que alteran el balance acumulado de un movimiento
+BALANCE_FIELDS = {'partner_id', 'date', 'points', 'transaction_type'}
+
+# Campos que alteran el resumen materializado por partner y programa
+SUMMARY_FIELDS = {'partner_id', 'card_id', 'points', 'transaction_type', 'amount'}
+
+# Paginación por cursor (fecha, id) del historial
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 200
+HISTORY_CURSOR_FORMAT = '%Y%m%d%H%M%S'
+
+# Exportación del historial a CSV
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_HEADER = ['fecha', 'tipo', 'puntos', 'motivo', 'referencia', 'balance']
+
+# Unicidad de movimientos por referencia de orden
+ORDER_REFERENCE_INDEX = 'loyalty_history_order_reference_uniq'
+DUPLICATE_REPORT_CHUNK_SIZE = 5000
+
 class LoyaltyHistory(models.Model):
     _name = 'loyalty.history'
     _description = 'Historial de Programa de Lealtad'
-    _order = 'date desc'
+    _order = 'date desc, id desc'
 
     # Campos básicos
     partner_id = fields.Many2one(
@@ -62,11 +86,10 @@ class LoyaltyHistory(models.Model):
         help='Descripción o motivo de la transacción'
     )
 
-    # Campos computados
+    # Balance acumulado, mantenido de forma incremental
     points_balance = fields.Float(
         string='Balance de Puntos',
-        compute='_compute_points_balance',
-        store=True,
+        readonly=True,
         help='Balance de puntos después de la transacción'
     )
 
@@ -77,37 +100,303 @@ class LoyaltyHistory(models.Model):
         default=lambda self: self.env.company
     )
 
-    # Métodos computados
-    @api.depends('partner_id', 'date', 'points', 'transaction_type')
-    def _compute_points_balance(self):
-        """Calcula el balance de puntos después de cada transacción"""
+    def init(self):
+        """Índice para recorrer el historial de un partner en orden cronológico"""
+        tools.create_index(
+            self._cr,
+            'loyalty_history_partner_date_id_idx',
+            self._table,
+            ['partner_id', 'date DESC', 'id DESC']
+        )
+        self._create_order_reference_index()
+
+    def _create_order_reference_index(self):
+        """
+        Crea el índice único parcial (partner, referencia, tipo).
+
+        Si el historial ya contiene duplicados el índice no se crea; deben
+        revisarse con ``report_duplicate_references`` y corregirse antes de
+        volver a llamar a este método.
+
+        Returns:
+            bool: True si el índice existe
+        """
+        cr = self._cr
+        if index_exists(cr, ORDER_REFERENCE_INDEX):
+            return True
+        cr.execute("""
+            SELECT 1
+              FROM loyalty_history
+             WHERE order_reference IS NOT NULL AND order_reference != ''
+          GROUP BY partner_id, order_reference, transaction_type
+            HAVING COUNT(*) > 1
+             LIMIT 1
+        """)
+        if cr.fetchone():
+            _logger.warning(
+                f'No se creó {ORDER_REFERENCE_INDEX}: hay movimientos duplicados por referencia de orden. '
+                f'Revisar con loyalty.history.report_duplicate_references()'
+            )
+            return False
+        cr.execute(f"""
+            CREATE UNIQUE INDEX {ORDER_REFERENCE_INDEX}
+                ON loyalty_history (partner_id, order_reference, transaction_type)
+             WHERE order_reference IS NOT NULL AND order_reference != ''
+        """)
+        return True
+
+    # Mantenimiento del balance acumulado
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._apply_ledger_changes()
+        return records
+
+    def _apply_ledger_changes(self):
+        """
+        Propaga movimientos recién insertados al balance acumulado, los puntos
+        de control, los resúmenes, los lotes y los partners.
+        """
+        starts = self._balance_starts()
+        self._update_points_balance(starts)
+        self.env['loyalty.balance.checkpoint']._refresh_partners(starts)
+        self.env['loyalty.ledger.summary']._apply_history(self.ids)
+        self.env['loyalty.point.lot']._apply_earn(self.ids)
+        debits = {}
+        for record in self:
+            if record.transaction_type in ('redeem', 'expire'):
+                debits[record.partner_id.id] = debits.get(record.partner_id.id, 0.0) + record.points
+        self.env['loyalty.point.lot']._consume(debits)
+        self.env['res.partner']._schedule_loyalty_sync(self.partner_id.ids, last_update=True)
+
+    def write(self, vals):
+        if not BALANCE_FIELDS.union(SUMMARY_FIELDS).intersection(vals):
+            return super().write(vals)
+        starts = self._balance_starts()
+        partner_ids = set(self.partner_id.ids)
+        result = super().write(vals)
+        for partner_id, start in self._balance_starts().items():
+            starts[partner_id] = min(starts.get(partner_id, start), start)
+        self._update_points_balance(starts)
+        self.env['loyalty.balance.checkpoint']._refresh_partners(starts)
+        partner_ids |= set(self.partner_id.ids)
+        self.env['loyalty.ledger.summary']._rebuild_partners(partner_ids)
+        self.env['loyalty.point.lot']._rebuild_partners(partner_ids)
+        self.env['res.partner']._schedule_loyalty_sync(partner_ids, last_update=True)
+        return result
+
+    def unlink(self):
+        starts = self._balance_starts()
+        result = super().unlink()
+        self._update_points_balance(starts)
+        self.env['loyalty.balance.checkpoint']._refresh_partners(starts)
+        self.env['loyalty.ledger.summary']._rebuild_partners(list(starts))
+        self.env['loyalty.point.lot']._rebuild_partners(list(starts))
+        self.env['res.partner']._schedule_loyalty_sync(list(starts), last_update=True)
+        return result
+
+    def _balance_starts(self):
+        """
+        Obtiene el primer movimiento afectado de cada partner del recordset.
+
+        Returns:
+            dict: {partner_id: (fecha, id)} del movimiento más antiguo
+        """
+        starts = {}
         for record in self:
-            try:
-                # Obtener transacciones anteriores
-                previous_transactions = self.search([
-                    ('partner_id', '=', record.partner_id.id),
-                    ('date', '<=', record.date),
-                    ('id', '!=', record.id)
-                ], order='date desc')
-
-                balance = 0
-                for trans in previous_transactions:
-                    if trans.transaction_type == 'earn':
-                        balance += trans.points
-                    elif trans.transaction_type in ['redeem', 'expire']:
-                        balance -= trans.points
-
-                # Agregar transacción actual
-                if record.transaction_type == 'earn':
-                    balance += record.points
-                elif record.transaction_type in ['redeem', 'expire']:
-                    balance -= record.points
-
-                record.points_balance = balance
-
-            except Exception as e:
-                _logger.error(f'Error al calcular balance de puntos: {str(e)}')
-                record.points_balance = 0
+            key = (record.date, record.id)
+            partner_id = record.partner_id.id
+            if partner_id not in starts or key < starts[partner_id]:
+                starts[partner_id] = key
+        return starts
+
+    @api.model
+    def _update_points_balance(self, starts):
+        """
+        Recalcula el balance acumulado a partir del movimiento indicado.
+
+        Cada movimiento toma el balance del movimiento anterior del partner más
+        su propio delta, de modo que un registro nuevo sólo actualiza su fila y
+        un movimiento con fecha pasada sólo actualiza las filas posteriores.
+        Todos los partners se recalculan en una sola sentencia.
+
+        Args:
+            starts (dict): {partner_id: (fecha, id)} primer movimiento afectado
+        """
+        if not starts:
+            return
+        self.flush_model()
+        partner_ids = list(starts)
+        self.env.cr.execute("""
+            WITH starts AS (
+                SELECT s.partner_id, s.date, s.id, COALESCE(o.points_balance, 0) AS opening
+                  FROM unnest(%(partner_ids)s::int[], %(dates)s::timestamp[], %(ids)s::int[])
+                       AS s(partner_id, date, id)
+             LEFT JOIN LATERAL (
+                    SELECT p.points_balance
+                      FROM loyalty_history p
+                     WHERE p.partner_id = s.partner_id
+                       AND (p.date, p.id) < (s.date, s.id)
+                  ORDER BY p.date DESC, p.id DESC
+                     LIMIT 1
+                   ) o ON TRUE
+            ), running AS (
+                SELECT l.id,
+                       s.opening + SUM(CASE
+                           WHEN l.transaction_type = 'earn' THEN l.points
+                           WHEN l.transaction_type IN ('redeem', 'expire') THEN -l.points
+                           ELSE 0
+                       END) OVER (PARTITION BY l.partner_id ORDER BY l.date, l.id) AS balance
+                  FROM starts s
+                  JOIN loyalty_history l
+                    ON l.partner_id = s.partner_id
+                   AND (l.date, l.id) >= (s.date, s.id)
+            )
+            UPDATE loyalty_history h
+               SET points_balance = r.balance
+              FROM running r
+             WHERE h.id = r.id
+               AND h.points_balance IS DISTINCT FROM r.balance
+        """, {
+            'partner_ids': partner_ids,
+            'dates': [starts[partner_id][0] for partner_id in partner_ids],
+            'ids': [starts[partner_id][1] for partner_id in partner_ids],
+        })
+        self.invalidate_model(['points_balance'])
+
+    @api.model
+    def _existing_references(self, keys):
+        """
+        Obtiene cuáles movimientos ya existen por referencia de orden.
+
+        Args:
+            keys (iterable): Tuplas (partner_id, referencia, tipo)
+
+        Returns:
+            set: Las tuplas que ya tienen un movimiento registrado
+        """
+        keys = [key for key in keys if key[1]]
+        if not keys:
+            return set()
+        self.flush_model(['partner_id', 'order_reference', 'transaction_type'])
+        partner_ids, references, types = zip(*keys)
+        self.env.cr.execute("""
+            SELECT h.partner_id, h.order_reference, h.transaction_type
+              FROM loyalty_history h
+              JOIN unnest(%s::int[], %s::varchar[], %s::varchar[]) AS k(partner_id, order_reference, transaction_type)
+                ON h.partner_id = k.partner_id
+               AND h.order_reference = k.order_reference
+               AND h.transaction_type = k.transaction_type
+        """, (list(partner_ids), list(references), list(types)))
+        return set(self.env.cr.fetchall())
+
+    @api.model
+    def _insert_or_skip(self, vals_list):
+        """
+        Inserta movimientos con un solo INSERT y omite los que repiten
+        (partner, referencia, tipo) de un movimiento ya registrado.
+
+        El índice ``ORDER_REFERENCE_INDEX`` resuelve la repetición: si dos
+        transacciones registran la misma referencia, la segunda espera a la
+        primera y omite la fila en vez de fallar. Los movimientos insertados
+        no se propagan; el llamador aplica ``_apply_ledger_changes`` después
+        de mover las tarjetas.
+
+        Args:
+            vals_list (list): Diccionarios con ``partner_id``, ``card_id``,
+                ``points``, ``transaction_type``, ``date`` y, opcionales,
+                ``reason`` y ``order_reference``
+
+        Returns:
+            loyalty.history: Movimientos insertados
+        """
+        self.check_access_rights('create')
+        if not vals_list:
+            return self.browse()
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO loyalty_history (
+                partner_id, card_id, points, transaction_type, reason, order_reference, date,
+                company_id, create_uid, create_date, write_uid, write_date
+            )
+            SELECT v.partner_id, v.card_id, v.points, v.transaction_type, v.reason, v.order_reference, v.date,
+                   %(company_id)s, %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(
+                       %(partner_ids)s::int[], %(card_ids)s::int[], %(points)s::float[],
+                       %(types)s::varchar[], %(reasons)s::varchar[], %(references)s::varchar[],
+                       %(dates)s::timestamp[]
+                   ) AS v(partner_id, card_id, points, transaction_type, reason, order_reference, date)
+          ORDER BY v.partner_id
+                ON CONFLICT DO NOTHING
+         RETURNING id
+        """, {
+            'partner_ids': [vals['partner_id'] for vals in vals_list],
+            'card_ids': [vals['card_id'] for vals in vals_list],
+            'points': [vals['points'] for vals in vals_list],
+            'types': [vals['transaction_type'] for vals in vals_list],
+            'reasons': [vals.get('reason') or None for vals in vals_list],
+            'references': [vals.get('order_reference') or None for vals in vals_list],
+            'dates': [vals['date'] for vals in vals_list],
+            'company_id': self.env.company.id,
+            'uid': self.env.uid,
+        })
+        return self.browse(sorted(row[0] for row in self.env.cr.fetchall()))
+
+    @api.model
+    def report_duplicate_references(self, chunk_size=DUPLICATE_REPORT_CHUNK_SIZE):
+        """
+        Reporta los movimientos repetidos por (partner, referencia, tipo) del
+        historial existente, recorriendo los partners por bloques.
+
+        Args:
+            chunk_size (int): Partners por bloque
+
+        Returns:
+            list: Tuplas (partner_id, referencia, tipo, [ids]) por duplicado
+        """
+        cr = self.env.cr
+        self.flush_model()
+        duplicates = []
+        last_id = 0
+        while True:
+            cr.execute("""
+                SELECT DISTINCT partner_id
+                  FROM loyalty_history
+                 WHERE partner_id > %s
+              ORDER BY partner_id
+                 LIMIT %s
+            """, (last_id, chunk_size))
+            partner_ids = [row[0] for row in cr.fetchall()]
+            if not partner_ids:
+                break
+
+            cr.execute("""
+                SELECT partner_id, order_reference, transaction_type, array_agg(id ORDER BY id)
+                  FROM loyalty_history
+                 WHERE partner_id = ANY(%s)
+                   AND order_reference IS NOT NULL AND order_reference != ''
+              GROUP BY partner_id, order_reference, transaction_type
+                HAVING COUNT(*) > 1
+              ORDER BY partner_id
+            """, (partner_ids,))
+            duplicates.extend(cr.fetchall())
+            last_id = partner_ids[-1]
+            _logger.info(f'Duplicados por referencia revisados hasta el partner {last_id}: {len(duplicates)}')
+
+        if duplicates:
+            details = '\n'.join(
+                f'{partner_id} / {reference} / {transaction_type}: {ids}'
+                for partner_id, reference, transaction_type, ids in duplicates
+            )
+            _logger.warning(f'Movimientos duplicados por referencia de orden: {len(duplicates)}\n{details}')
+            self.env['loyalty.logger'].sudo().log_event(
+                'warning',
+                'Movimientos duplicados por referencia de orden',
+                level='warning',
+                details=details,
+                source='loyalty.history'
+            )
+        return duplicates
 
     # Validaciones
     @api.constrains('points')
@@ -138,33 +427,212 @@ class LoyaltyHistory(models.Model):
     @api.model
     def get_partner_balance(self, partner_id, date=None):
         """Obtiene el balance de puntos de un cliente en una fecha específica"""
-        domain = [('partner_id', '=', partner_id)]
         if date:
-            domain.append(('date', '<=', date))
+            # Último punto de control más los movimientos posteriores
+            return self.env['loyalty.balance.checkpoint'].get_partner_balance(
+                partner_id, fields.Datetime.to_datetime(date)
+            )
 
-        transactions = self.search(domain)
-        balance = 0
-        for trans in transactions:
-            if trans.transaction_type == 'earn':
-                balance += trans.points
-            elif trans.transaction_type in ['redeem', 'expire']:
-                balance -= trans.points
-        return balance
+        last_transaction = self.search([('partner_id', '=', partner_id)], order='date desc, id desc', limit=1)
+        return last_transaction.points_balance if last_transaction else 0
 
-    def export_history(self, partner_id, date_from=None, date_to=None):
-        """Exporta el historial de transacciones de un cliente"""
+    @api.model
+    def get_balances_as_of(self, date):
+        """
+        Obtiene el balance de todos los clientes a una fecha.
+
+        Args:
+            date (datetime): Fecha de consulta (inclusive)
+
+        Returns:
+            dict: {partner_id: balance}
+        """
+        return self.env['loyalty.balance.checkpoint'].get_balances_as_of(
+            fields.Datetime.to_datetime(date)
+        )
+
+    @api.model
+    def _encode_history_cursor(self, record):
+        """Cursor opaco de un movimiento para la paginación por (fecha, id)"""
+        return f'{record.date.strftime(HISTORY_CURSOR_FORMAT)}-{record.id}'
+
+    @api.model
+    def _decode_history_cursor(self, cursor):
+        """
+        Decodifica un cursor de paginación.
+
+        Returns:
+            tuple: (fecha, id), o None si el cursor está vacío o es inválido
+        """
+        try:
+            date, record_id = cursor.split('-')
+            return datetime.strptime(date, HISTORY_CURSOR_FORMAT), int(record_id)
+        except (AttributeError, ValueError):
+            return None
+
+    @api.model
+    def get_history_page(self, partner_id, limit=HISTORY_PAGE_SIZE, after=None, before=None):
+        """
+        Obtiene una página del historial de un partner, de la más reciente a la
+        más antigua, paginando por (fecha, id) en lugar de OFFSET.
+
+        Cada página recorre el índice (partner_id, date desc, id desc) desde
+        el cursor, por lo que la página N cuesta lo mismo que la primera.
+
+        Args:
+            partner_id (int): ID del cliente
+            limit (int): Movimientos por página
+            after (str, optional): Cursor del último movimiento de la página
+                anterior; devuelve los movimientos más antiguos
+            before (str, optional): Cursor del primer movimiento de la página
+                siguiente; devuelve los movimientos más recientes
+
+        Returns:
+            dict: Movimientos de la página y cursores 'next_cursor' y
+                'prev_cursor' (False si no hay más páginas)
+        """
+        self.check_access_rights('read')
+        limit = max(1, min(int(limit or HISTORY_PAGE_SIZE), HISTORY_MAX_PAGE_SIZE))
+        after_key = self._decode_history_cursor(after)
+        before_key = self._decode_history_cursor(before) if not after_key else None
+
+        self.flush_model(['partner_id', 'date'])
+        if before_key:
+            # Hacia atrás: recorrer el índice en orden ascendente e invertir
+            self.env.cr.execute("""
+                SELECT id
+                  FROM loyalty_history
+                 WHERE partner_id = %s
+                   AND (date, id) > (%s, %s)
+              ORDER BY date ASC, id ASC
+                 LIMIT %s
+            """, (partner_id, before_key[0], before_key[1], limit + 1))
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            has_more = len(ids) > limit
+            ids = ids[:limit][::-1]
+            has_newer, has_older = has_more, True
+        else:
+            where, params = '', [partner_id]
+            if after_key:
+                where = 'AND (date, id) < (%s, %s)'
+                params += [after_key[0], after_key[1]]
+            self.env.cr.execute(f"""
+                SELECT id
+                  FROM loyalty_history
+                 WHERE partner_id = %s
+                   {where}
+              ORDER BY date DESC, id DESC
+                 LIMIT %s
+            """, params + [limit + 1])
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            has_older = len(ids) > limit
+            ids = ids[:limit]
+            has_newer = bool(after_key)
+
+        records = self.browse(ids)
+        return {
+            'records': records,
+            'next_cursor': self._encode_history_cursor(records[-1]) if has_older and records else False,
+            'prev_cursor': self._encode_history_cursor(records[0]) if has_newer and records else False,
+        }
+
+    @api.model
+    def _iter_history_rows(self, partner_id, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Recorre el historial de un partner con un cursor del lado del servidor,
+        trayendo ``chunk_size`` filas a la vez. Respeta las reglas de registro
+        del usuario.
+
+        Args:
+            partner_id (int): ID del cliente
+            date_from (datetime, optional): Fecha inicial
+            date_to (datetime, optional): Fecha final
+            chunk_size (int): Filas por lectura
+
+        Yields:
+            tuple: (fecha, tipo, puntos, motivo, referencia, balance)
+        """
+        self.check_access_rights('read')
+        self.flush_model()
         domain = [('partner_id', '=', partner_id)]
         if date_from:
             domain.append(('date', '>=', date_from))
         if date_to:
             domain.append(('date', '<=', date_to))
+        # ``_search`` aplica las reglas de registro del usuario
+        query = self._search(domain, order='date DESC, id DESC')
+
+        cr = self.env.cr
+        cursor_name = f'loyalty_history_export_{uuid.uuid4().hex}'
+        cr.execute(SQL(
+            "DECLARE %s NO SCROLL CURSOR FOR %s",
+            SQL.identifier(cursor_name),
+            query.select(*(
+                SQL.identifier(self._table, column)
+                for column in ('date', 'transaction_type', 'points', 'reason', 'order_reference', 'points_balance')
+            )),
+        ))
+        try:
+            while True:
+                cr.execute(f'FETCH FORWARD %s FROM {cursor_name}', (chunk_size,))
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            if not cr.closed:
+                cr.execute(f'CLOSE {cursor_name}')
 
-        transactions = self.search(domain, order='date desc')
+    def export_history(self, partner_id, date_from=None, date_to=None):
+        """Exporta el historial de transacciones de un cliente"""
+        transaction_types = dict(self._fields['transaction_type']._description_selection(self.env))
         return [{
-            'fecha': t.date,
-            'tipo': dict(t._fields['transaction_type'].selection).get(t.transaction_type),
-            'puntos': t.points,
-            'motivo': t.reason,
-            'referencia': t.order_reference,
-            'balance': t.points_balance
-        } for t in transactions]
\ No newline at end of file
+            'fecha': date,
+            'tipo': transaction_types.get(transaction_type),
+            'puntos': points,
+            'motivo': reason,
+            'referencia': order_reference,
+            'balance': points_balance
+        } for date, transaction_type, points, reason, order_reference, points_balance
+            in self._iter_history_rows(partner_id, date_from, date_to)]
+
+    def export_history_csv(self, partner_id, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Exporta el historial de un cliente como CSV generado de forma perezosa.
+
+        La memoria usada no depende del número de movimientos: se lee y se
+        escribe un bloque de ``chunk_size`` filas a la vez.
+
+        Args:
+            partner_id (int): ID del cliente
+            date_from (datetime, optional): Fecha inicial
+            date_to (datetime, optional): Fecha final
+            chunk_size (int): Filas por bloque
+
+        Yields:
+            bytes: Bloques del archivo CSV en UTF-8
+        """
+        transaction_types = dict(self._fields['transaction_type']._description_selection(self.env))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_HEADER)
+
+        pending = 0
+        for date, transaction_type, points, reason, order_reference, points_balance \
+                in self._iter_history_rows(partner_id, date_from, date_to, chunk_size):
+            writer.writerow([
+                fields.Datetime.to_string(date),
+                transaction_types.get(transaction_type, transaction_type),
+                points,
+                reason or '',
+                order_reference or '',
+                points_balance,
+            ])
+            pending += 1
+            if pending >= chunk_size:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+
+        yield buffer.getvalue().encode('utf-8')
@@ -0,0 +1,181 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = 5000
+
+class LoyaltyLedgerSummary(models.Model):
+    """
+    Resumen materializado del historial de lealtad por partner y programa.
+
+    Se actualiza en la misma transacción que cada movimiento de
+    ``loyalty.history``, de modo que los totales se leen de una sola fila
+    en lugar de recorrer el historial completo.
+    """
+    _name = 'loyalty.ledger.summary'
+    _description = 'Resumen de Historial de Lealtad'
+    _order = 'partner_id, program_id'
+
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Cliente',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    program_id = fields.Many2one(
+        'loyalty.program',
+        string='Programa de Lealtad',
+        ondelete='cascade'
+    )
+
+    points_earned = fields.Float(string='Puntos Ganados', readonly=True)
+    points_redeemed = fields.Float(string='Puntos Redimidos', readonly=True)
+    points_expired = fields.Float(string='Puntos Expirados', readonly=True)
+    discount_amount = fields.Float(string='Descuentos Aplicados', readonly=True)
+    points_balance = fields.Float(string='Balance de Puntos', readonly=True)
+
+    def init(self):
+        """Índice único por partner y programa usado por las actualizaciones"""
+        self._cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS loyalty_ledger_summary_partner_program_uniq
+                ON loyalty_ledger_summary (partner_id, COALESCE(program_id, 0))
+        """)
+
+    @api.model
+    def _apply_history(self, history_ids):
+        """
+        Suma movimientos recién creados a los resúmenes de sus partners.
+
+        Args:
+            history_ids (list): IDs de ``loyalty.history`` a acumular
+        """
+        if not history_ids:
+            return
+        self.env['loyalty.history'].flush_model()
+        self.env.cr.execute("""
+            INSERT INTO loyalty_ledger_summary AS s (
+                partner_id, program_id,
+                points_earned, points_redeemed, points_expired, discount_amount, points_balance,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT h.partner_id, c.program_id,
+                   SUM(CASE WHEN h.transaction_type = 'earn' THEN h.points ELSE 0 END),
+                   SUM(CASE WHEN h.transaction_type = 'redeem' THEN h.points ELSE 0 END),
+                   SUM(CASE WHEN h.transaction_type = 'expire' THEN h.points ELSE 0 END),
+                   SUM(CASE WHEN h.transaction_type = 'discount' THEN COALESCE(h.amount, 0) ELSE 0 END),
+                   SUM(CASE
+                       WHEN h.transaction_type = 'earn' THEN h.points
+                       WHEN h.transaction_type IN ('redeem', 'expire') THEN -h.points
+                       ELSE 0
+                   END),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM loyalty_history h
+         LEFT JOIN loyalty_card c ON c.id = h.card_id
+             WHERE h.id = ANY(%(history_ids)s)
+          GROUP BY h.partner_id, c.program_id
+            ON CONFLICT (partner_id, COALESCE(program_id, 0)) DO UPDATE SET
+                points_earned = s.points_earned + EXCLUDED.points_earned,
+                points_redeemed = s.points_redeemed + EXCLUDED.points_redeemed,
+                points_expired = s.points_expired + EXCLUDED.points_expired,
+                discount_amount = s.discount_amount + EXCLUDED.discount_amount,
+                points_balance = s.points_balance + EXCLUDED.points_balance,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, {'history_ids': list(history_ids), 'uid': self.env.uid})
+        self.invalidate_model()
+        self.env['res.partner'].invalidate_model(['total_points_earned', 'total_points_redeemed'])
+
+    @api.model
+    def _rebuild_partners(self, partner_ids):
+        """
+        Reconstruye desde el historial los resúmenes de los partners indicados.
+
+        Args:
+            partner_ids (list): IDs de partners a reconstruir
+        """
+        if not partner_ids:
+            return
+        self.env['loyalty.history'].flush_model()
+        params = {'partner_ids': list(partner_ids), 'uid': self.env.uid}
+        self.env.cr.execute("""
+            DELETE FROM loyalty_ledger_summary WHERE partner_id = ANY(%(partner_ids)s)
+        """, params)
+        self.env.cr.execute("""
+            INSERT INTO loyalty_ledger_summary (
+                partner_id, program_id,
+                points_earned, points_redeemed, points_expired, discount_amount, points_balance,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT h.partner_id, c.program_id,
+                   SUM(CASE WHEN h.transaction_type = 'earn' THEN h.points ELSE 0 END),
+                   SUM(CASE WHEN h.transaction_type = 'redeem' THEN h.points ELSE 0 END),
+                   SUM(CASE WHEN h.transaction_type = 'expire' THEN h.points ELSE 0 END),
+                   SUM(CASE WHEN h.transaction_type = 'discount' THEN COALESCE(h.amount, 0) ELSE 0 END),
+                   SUM(CASE
+                       WHEN h.transaction_type = 'earn' THEN h.points
+                       WHEN h.transaction_type IN ('redeem', 'expire') THEN -h.points
+                       ELSE 0
+                   END),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM loyalty_history h
+         LEFT JOIN loyalty_card c ON c.id = h.card_id
+             WHERE h.partner_id = ANY(%(partner_ids)s)
+          GROUP BY h.partner_id, c.program_id
+        """, params)
+        self.invalidate_model()
+        self.env['res.partner'].invalidate_model(['total_points_earned', 'total_points_redeemed'])
+
+    @api.model
+    def rebuild_all(self, batch_size=REBUILD_BATCH_SIZE, commit=False):
+        """
+        Reconstruye todos los resúmenes por lotes de partners para corregir
+        desviaciones respecto al historial.
+
+        Args:
+            batch_size (int): Partners por lote
+            commit (bool): Confirmar la transacción después de cada lote
+
+        Returns:
+            int: Número de partners reconstruidos
+        """
+        cr = self.env.cr
+        last_id = 0
+        total = 0
+
+        # Resúmenes de partners que ya no tienen historial
+        cr.execute("""
+            DELETE FROM loyalty_ledger_summary s
+             WHERE NOT EXISTS (SELECT 1 FROM loyalty_history h WHERE h.partner_id = s.partner_id)
+        """)
+
+        while True:
+            cr.execute("""
+                SELECT DISTINCT partner_id
+                  FROM loyalty_history
+                 WHERE partner_id > %s
+              ORDER BY partner_id
+                 LIMIT %s
+            """, (last_id, batch_size))
+            partner_ids = [row[0] for row in cr.fetchall()]
+            if not partner_ids:
+                break
+
+            self._rebuild_partners(partner_ids)
+            last_id = partner_ids[-1]
+            total += len(partner_ids)
+            if commit:
+                cr.commit()
+            _logger.info(f'Resúmenes de lealtad reconstruidos: {total} partners (hasta id {last_id})')
+
+        return total
+
+    @api.model
+    def _cron_rebuild_all(self):
+        """Método para cron de reconstrucción de resúmenes"""
+        try:
+            self.rebuild_all(commit=True)
+        except Exception as e:
+            _logger.error(f'Error en cron de reconstrucción de resúmenes de lealtad: {str(e)}')
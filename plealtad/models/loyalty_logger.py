@@ -1,10 +1,34 @@
-from odoo import models, fields
+from odoo import models, fields, api, tools
 import logging
+import random
+import time
 import traceback
-from datetime import datetime
+from datetime import timedelta
 
 _logger = logging.getLogger(__name__)
 
+# Orden de severidad para el filtrado por nivel mínimo
+LEVEL_ORDER = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'critical': 50}
+
+# Parámetros de persistencia; admiten sufijo por tipo, p. ej. plealtad.logger_min_level.register
+MIN_LEVEL_PARAM = 'plealtad.logger_min_level'
+INFO_SAMPLE_RATE_PARAM = 'plealtad.logger_info_sample_rate'
+
+# Llave del buffer de eventos en los datos de precommit del cursor
+LOG_BUFFER_KEY = 'plealtad.loyalty_logger_buffer'
+
+# Días de retención por nivel; configurables con plealtad.logger_retention_days.<nivel>
+RETENTION_DAYS_PARAM = 'plealtad.logger_retention_days'
+DEFAULT_RETENTION_DAYS = {
+    'debug': 14,
+    'info': 14,
+    'warning': 90,
+    'error': 365,
+    'critical': 365,
+}
+PURGE_CHUNK_SIZE = 10000
+PURGE_TIME_BUDGET = 10 * 60  # segundos por ejecución del cron
+
 class LoyaltyLogger(models.Model):
    """
    Modelo centralizado para registro de eventos en el sistema de lealtad.
@@ -12,7 +36,7 @@ class LoyaltyLogger(models.Model):
    """
    _name = 'loyalty.logger'
    _description = 'Sistema Centralizado de Logging para Programa de Lealtad'
-   _order = 'create_date desc'
+   _order = 'timestamp desc, id desc'
 
    name = fields.Char(
        string='Título del Evento', 
@@ -58,13 +82,28 @@ class LoyaltyLogger(models.Model):
    
    timestamp = fields.Datetime(
        string='Hora del Evento', 
-       default=fields.Datetime.now
+       default=fields.Datetime.now,
+       index=True
    )
 
+   def init(self):
+       """Índices compuestos para la consulta y depuración de eventos"""
+       tools.create_index(self._cr, 'loyalty_logger_type_level_timestamp_idx',
+                          self._table, ['type', 'level', 'timestamp DESC'])
+       tools.create_index(self._cr, 'loyalty_logger_level_timestamp_idx',
+                          self._table, ['level', 'timestamp'])
+       tools.create_index(self._cr, 'loyalty_logger_partner_timestamp_idx',
+                          self._table, ['partner_id', 'timestamp DESC'],
+                          where='partner_id IS NOT NULL')
+
    def create_log(self, event_type, name, details=None, level='info', 
                   user=None, partner=None, source_module=None, error=None):
        """
        Método centralizado para crear registros de log.
+
+       Los eventos se acumulan durante la transacción y se insertan juntos
+       antes del commit. Sólo se persisten los que alcanzan el nivel mínimo
+       configurado para su tipo, y los eventos ``info`` pueden muestrearse.
        
        Args:
            event_type (str): Categoría del evento
@@ -77,9 +116,16 @@ class LoyaltyLogger(models.Model):
            error (Exception, optional): Excepción capturada
        
        Returns:
-           LoyaltyLogger: Registro de log creado
+           bool: True si el evento quedó en cola para persistirse
        """
        try:
+           # Log en consola para respaldo
+           log_method = getattr(_logger, level, _logger.info)
+           log_method('[%s] %s - %s', event_type.upper(), name, details or '')
+
+           if not self._should_persist(event_type, level):
+               return False
+
            # Preparar información de error si existe
            traceback_info = None
            if error:
@@ -87,8 +133,7 @@ class LoyaltyLogger(models.Model):
                    type(error), error, error.__traceback__
                ))
            
-           # Crear registro de log
-           log_values = {
+           self._buffer_log({
                'name': name,
                'type': event_type,
                'level': level,
@@ -96,21 +141,60 @@ class LoyaltyLogger(models.Model):
                'user_id': user,
                'partner_id': partner,
                'source_module': source_module or 'loyalty_core',
-               'error_traceback': traceback_info
-           }
-           
-           log_record = self.create(log_values)
-           
-           # Log en consola para respaldo
-           log_method = getattr(_logger, level, _logger.info)
-           log_method(f"[{event_type.upper()}] {name} - {details or ''}")
-           
-           return log_record
+               'error_traceback': traceback_info,
+               'timestamp': fields.Datetime.now()
+           })
+           return True
        
        except Exception as e:
            _logger.error(f"Error al crear log: {e}")
            return False
 
+   def _should_persist(self, event_type, level):
+       """
+       Decide si un evento se guarda según el nivel mínimo y el muestreo.
+
+       Args:
+           event_type (str): Categoría del evento
+           level (str): Nivel de severidad
+
+       Returns:
+           bool: True si el evento debe persistirse
+       """
+       params = self.env['ir.config_parameter'].sudo()
+       min_level = (
+           params.get_param(f'{MIN_LEVEL_PARAM}.{event_type}') or
+           params.get_param(MIN_LEVEL_PARAM, 'debug')
+       )
+       if LEVEL_ORDER.get(level, 20) < LEVEL_ORDER.get(min_level, 10):
+           return False
+
+       if level == 'info':
+           sample_rate = float(
+               params.get_param(f'{INFO_SAMPLE_RATE_PARAM}.{event_type}') or
+               params.get_param(INFO_SAMPLE_RATE_PARAM, 1.0)
+           )
+           if sample_rate < 1.0 and random.random() >= sample_rate:
+               return False
+       return True
+
+   def _buffer_log(self, values):
+       """Acumula un evento para insertarlo junto con los demás antes del commit"""
+       cr = self.env.cr
+       buffer = cr.precommit.data.get(LOG_BUFFER_KEY)
+       if buffer is None:
+           buffer = cr.precommit.data[LOG_BUFFER_KEY] = []
+           cr.precommit.add(self.sudo()._flush_log_buffer)
+       buffer.append(values)
+
+   def _flush_log_buffer(self):
+       """Inserta en una sola operación los eventos acumulados en la transacción"""
+       buffer = self.env.cr.precommit.data.pop(LOG_BUFFER_KEY, None)
+       if not buffer:
+           return
+       self.create(buffer)
+       self.flush_model()
+
    def log_event(self, event_type, name, level='info', details=None, 
                  user=None, partner=None, source=None, reference=None, **kwargs):
        """
@@ -127,7 +211,7 @@ class LoyaltyLogger(models.Model):
            reference (str, optional): Referencia única
        
        Returns:
-           LoyaltyLogger: Registro de log creado
+           bool: True si el evento quedó en cola para persistirse
        """
        return self.create_log(
            event_type=event_type,
@@ -138,4 +222,88 @@ class LoyaltyLogger(models.Model):
            partner=partner,
            source_module=source,
            error=kwargs.get('error')
-       )
\ No newline at end of file
+       )
+
+   # =========================================================================
+   # Retención y compactación
+   # =========================================================================
+   @api.model
+   def purge_old_events(self, chunk_size=PURGE_CHUNK_SIZE, time_budget=None, commit=False):
+       """
+       Depura los eventos que superan la retención de su nivel.
+
+       Cada bloque se elimina y se acumula en ``loyalty.logger.daily`` con una
+       sola sentencia, de modo que los conteos históricos no se pierden.
+
+       Args:
+           chunk_size (int): Eventos por bloque
+           time_budget (float, optional): Segundos máximos de la ejecución
+           commit (bool): Confirmar la transacción después de cada bloque
+
+       Returns:
+           int: Número de eventos depurados
+       """
+       cr = self.env.cr
+       params = self.env['ir.config_parameter'].sudo()
+       started = time.monotonic()
+       total = 0
+
+       self.flush_model()
+       for level, default_days in DEFAULT_RETENTION_DAYS.items():
+           days = int(params.get_param(f'{RETENTION_DAYS_PARAM}.{level}', default_days))
+           cutoff = fields.Datetime.now() - timedelta(days=days)
+
+           while True:
+               cr.execute("""
+                   WITH purged AS (
+                       DELETE FROM loyalty_logger
+                        WHERE id IN (
+                            SELECT id
+                              FROM loyalty_logger
+                             WHERE level = %(level)s
+                               AND timestamp < %(cutoff)s
+                             LIMIT %(limit)s
+                        )
+                    RETURNING timestamp, type, level
+                   ), compacted AS (
+                       INSERT INTO loyalty_logger_daily AS d (
+                           date, type, level, count,
+                           create_uid, create_date, write_uid, write_date
+                       )
+                       SELECT timestamp::date, type, level, COUNT(*),
+                              %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+                         FROM purged
+                     GROUP BY timestamp::date, type, level
+                       ON CONFLICT (date, type, level) DO UPDATE SET
+                           count = d.count + EXCLUDED.count,
+                           write_uid = EXCLUDED.write_uid,
+                           write_date = EXCLUDED.write_date
+                   )
+                   SELECT COUNT(*) FROM purged
+               """, {'level': level, 'cutoff': cutoff, 'limit': chunk_size, 'uid': self.env.uid})
+               purged = cr.fetchone()[0]
+               if not purged:
+                   break
+
+               total += purged
+               if commit:
+                   cr.commit()
+
+               if time_budget and time.monotonic() - started >= time_budget:
+                   _logger.info(f'Presupuesto de tiempo agotado en la depuración de eventos: {total} eventos')
+                   self.invalidate_model()
+                   self.env['loyalty.logger.daily'].invalidate_model()
+                   return total
+
+       self.invalidate_model()
+       self.env['loyalty.logger.daily'].invalidate_model()
+       return total
+
+   @api.model
+   def _cron_purge_old_events(self, chunk_size=PURGE_CHUNK_SIZE, time_budget=PURGE_TIME_BUDGET):
+       """Método para cron de depuración de eventos de lealtad"""
+       try:
+           total = self.purge_old_events(chunk_size=chunk_size, time_budget=time_budget, commit=True)
+           _logger.info(f'Cron de depuración de eventos ejecutado: {total} eventos')
+       except Exception as e:
+           _logger.error(f'Error en cron de depuración de eventos: {str(e)}')
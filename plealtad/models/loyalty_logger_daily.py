@@ -0,0 +1,37 @@
+from odoo import models, fields
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class LoyaltyLoggerDaily(models.Model):
+    """
+    Conteos diarios de eventos de lealtad por tipo y nivel.
+
+    Conserva el volumen histórico de ``loyalty.logger`` una vez que los
+    eventos individuales se depuran por antigüedad.
+    """
+    _name = 'loyalty.logger.daily'
+    _description = 'Resumen Diario de Eventos de Lealtad'
+    _order = 'date desc, type, level'
+
+    date = fields.Date(string='Fecha', required=True, readonly=True)
+
+    type = fields.Selection(
+        selection=lambda self: self.env['loyalty.logger']._fields['type'].selection,
+        string='Categoría de Evento',
+        required=True,
+        readonly=True
+    )
+
+    level = fields.Selection(
+        selection=lambda self: self.env['loyalty.logger']._fields['level'].selection,
+        string='Nivel de Severidad',
+        required=True,
+        readonly=True
+    )
+
+    count = fields.Integer(string='Eventos', readonly=True)
+
+    _sql_constraints = [
+        ('date_type_level_uniq', 'unique(date, type, level)', 'Ya existe un resumen para la fecha, tipo y nivel.'),
+    ]
@@ -0,0 +1,183 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Parámetros del envío diferido de correos
+OUTBOX_RATE_PARAM = 'plealtad.mail_outbox_rate_per_run'
+OUTBOX_SERVER_PARAM = 'plealtad.mail_outbox_server_id'
+OUTBOX_DEFAULT_RATE = 500
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_SECONDS = 60
+OUTBOX_MAX_BACKOFF_SECONDS = 6 * 60 * 60
+OUTBOX_KEEP_DAYS = 7
+
+class LoyaltyMailOutbox(models.Model):
+    """
+    Bandeja de salida de los correos del programa de lealtad.
+
+    Las rutas HTTP sólo encolan el correo; un cron los envía por lotes
+    agrupados por plantilla, con límite por ejecución y reintentos con
+    espera exponencial.
+
+    Para pruebas locales basta con un ``ir.mail_server`` apuntando a un SMTP
+    de prueba (p. ej. ``python -m aiosmtpd -n -l localhost:1025``) y su id en
+    ``plealtad.mail_outbox_server_id``.
+    """
+    _name = 'loyalty.mail.outbox'
+    _description = 'Bandeja de Salida de Correos de Lealtad'
+    _order = 'id'
+
+    template_id = fields.Many2one(
+        'mail.template',
+        string='Plantilla',
+        required=True,
+        ondelete='cascade'
+    )
+
+    res_id = fields.Integer(
+        string='ID del Registro',
+        required=True,
+        help='Registro sobre el que se renderiza la plantilla'
+    )
+
+    render_context = fields.Json(
+        string='Contexto de Renderizado',
+        help='Valores adicionales disponibles como ctx en la plantilla'
+    )
+
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('sent', 'Enviado'),
+        ('failed', 'Fallido'),
+    ], string='Estado', required=True, default='pending', index=True)
+
+    attempts = fields.Integer(
+        string='Intentos',
+        default=0
+    )
+
+    next_attempt_date = fields.Datetime(
+        string='Próximo Intento',
+        default=fields.Datetime.now,
+        index=True
+    )
+
+    last_error = fields.Text(
+        string='Último Error'
+    )
+
+    @api.model
+    def enqueue(self, template, res_id, render_context=None):
+        """
+        Encola un correo para enviarlo fuera de la petición HTTP.
+
+        Args:
+            template (mail.template): Plantilla a enviar
+            res_id (int): ID del registro a renderizar
+            render_context (dict, optional): Contexto adicional de la plantilla
+
+        Returns:
+            LoyaltyMailOutbox: Registro encolado
+        """
+        message = self.sudo().create({
+            'template_id': template.id,
+            'res_id': res_id,
+            'render_context': render_context or {},
+        })
+        # El cron se ejecuta en cuanto se confirme la transacción actual
+        self.env.ref('plealtad.ir_cron_loyalty_mail_outbox').sudo()._trigger()
+        return message
+
+    @api.model
+    def _cron_send_outbox(self, limit=None):
+        """
+        Envía los correos pendientes agrupados por plantilla.
+
+        Args:
+            limit (int, optional): Máximo de correos por ejecución; por defecto
+                ``plealtad.mail_outbox_rate_per_run``
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        if not limit:
+            limit = int(params.get_param(OUTBOX_RATE_PARAM, OUTBOX_DEFAULT_RATE))
+        mail_server_id = int(params.get_param(OUTBOX_SERVER_PARAM, 0) or 0)
+
+        pending = self.search([
+            ('state', '=', 'pending'),
+            ('next_attempt_date', '<=', fields.Datetime.now()),
+        ], order='template_id, id', limit=limit)
+
+        for template in pending.template_id:
+            messages = pending.filtered(lambda m: m.template_id == template)
+            try:
+                self._send_template_batch(template, messages, mail_server_id)
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.error(f'Error al enviar correos de la plantilla {template.name}: {str(e)}')
+                messages = messages.exists()
+                messages._schedule_retry(str(e))
+            self.env.cr.commit()
+
+        if len(pending) == limit:
+            # Quedan correos: continuar en la siguiente ejecución inmediata
+            self.env.ref('plealtad.ir_cron_loyalty_mail_outbox')._trigger()
+
+        # Depurar los correos enviados hace más de OUTBOX_KEEP_DAYS días
+        self.search([
+            ('state', '=', 'sent'),
+            ('write_date', '<', fields.Datetime.now() - timedelta(days=OUTBOX_KEEP_DAYS)),
+        ]).unlink()
+
+    def _send_template_batch(self, template, messages, mail_server_id=False):
+        """
+        Genera y envía los correos de una misma plantilla en una sola llamada.
+
+        Args:
+            template (mail.template): Plantilla compartida por los mensajes
+            messages (LoyaltyMailOutbox): Mensajes a enviar
+            mail_server_id (int, optional): Servidor de correo a utilizar
+        """
+        email_values = {'auto_delete': False}
+        if mail_server_id:
+            email_values['mail_server_id'] = mail_server_id
+
+        mails = self.env['mail.mail'].sudo()
+        mail_by_message = {}
+        for message in messages:
+            mail_id = template.sudo().with_context(**(message.render_context or {})).send_mail(
+                message.res_id,
+                force_send=False,
+                email_values=email_values
+            )
+            mail_by_message[message] = mails.browse(mail_id)
+            mails |= mail_by_message[message]
+
+        # Una sola llamada reutiliza la conexión SMTP para todo el lote
+        mails.send(auto_commit=False, raise_exception=False)
+
+        for message, mail in mail_by_message.items():
+            if mail.state == 'sent':
+                message.write({'state': 'sent', 'attempts': message.attempts + 1, 'last_error': False})
+            else:
+                message._schedule_retry(mail.failure_reason or mail.state)
+        # El reintento vuelve a generar el correo desde la plantilla: no se
+        # conservan los mail.mail fallidos
+        mails.unlink()
+        _logger.info(f'Correos procesados para la plantilla {template.name}: {len(messages)}')
+
+    def _schedule_retry(self, error):
+        """Programa el siguiente intento con espera exponencial"""
+        now = fields.Datetime.now()
+        for message in self:
+            attempts = message.attempts + 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                message.write({'state': 'failed', 'attempts': attempts, 'last_error': error})
+                continue
+            delay = min(OUTBOX_BACKOFF_SECONDS * 2 ** attempts, OUTBOX_MAX_BACKOFF_SECONDS)
+            message.write({
+                'attempts': attempts,
+                'last_error': error,
+                'next_attempt_date': now + timedelta(seconds=delay),
+            })
@@ -0,0 +1,81 @@
+from odoo import models, fields, api
+from odoo.addons.plealtad.tools.metrics import METRICS, render
+import hmac
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Token para leer /plealtad/metrics sin sesión (p. ej. desde Prometheus)
+METRICS_TOKEN_PARAM = 'plealtad.metrics_token'
+
+class LoyaltyMetric(models.Model):
+    """
+    Totales de las métricas de lealtad de todos los workers.
+
+    Cada fila es una serie (nombre más etiquetas) y los workers suman sus
+    incrementos con un upsert desde ``tools.metrics``. Sin columnas de
+    auditoría: las filas se actualizan continuamente por SQL.
+    """
+    _name = 'loyalty.metric'
+    _description = 'Métrica de Lealtad'
+    _order = 'name, labels'
+    _log_access = False
+
+    name = fields.Char(string='Métrica', required=True, readonly=True)
+    labels = fields.Char(string='Etiquetas', required=True, default='', readonly=True)
+    value = fields.Float(string='Valor', readonly=True)
+
+    _sql_constraints = [
+        ('name_labels_uniq', 'unique(name, labels)', 'La serie de la métrica ya existe.'),
+    ]
+
+    @api.model
+    def check_scrape_access(self, token=None):
+        """
+        Indica si la petición puede leer las métricas: con el token
+        configurado o con una sesión de administrador de lealtad.
+
+        Args:
+            token (str, optional): Token recibido en la petición
+
+        Returns:
+            bool: True si se permite el acceso
+        """
+        expected = self.env['ir.config_parameter'].sudo().get_param(METRICS_TOKEN_PARAM)
+        if expected and token and hmac.compare_digest(expected, token):
+            return True
+        return self.env.user.has_group('plealtad.group_loyalty_manager')
+
+    @api.model
+    def _get_gauges(self):
+        """
+        Valores instantáneos calculados al publicar las métricas.
+
+        Returns:
+            list: Tuplas (nombre, etiquetas, valor)
+        """
+        stats = self.env['loyalty.order.queue'].sudo().get_queue_stats()
+        return [
+            ('plealtad_order_queue_pending', '', float(stats['pending'])),
+            ('plealtad_order_queue_failed', '', float(stats['failed'])),
+            ('plealtad_order_queue_lag_seconds', '', stats['lag_seconds']),
+        ]
+
+    @api.model
+    def render_prometheus(self):
+        """
+        Publica las métricas en formato de texto de Prometheus.
+
+        Suma a los totales guardados las métricas pendientes de este worker;
+        las de los demás se incluyen hasta su última escritura (como mucho
+        ``FLUSH_INTERVAL`` segundos de retraso).
+
+        Returns:
+            str: Cuerpo de la respuesta
+        """
+        self.env.cr.execute("SELECT name, labels, value FROM loyalty_metric")
+        totals = {(name, labels): value for name, labels, value in self.env.cr.fetchall()}
+        for key, value in METRICS.get_pending(self.env.cr.dbname).items():
+            totals[key] = totals.get(key, 0.0) + value
+        samples = [(name, labels, value) for (name, labels), value in totals.items()]
+        return render(samples + self._get_gauges())
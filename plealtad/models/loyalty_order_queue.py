@@ -0,0 +1,251 @@
+from odoo import models, fields, api, _
+from odoo.addons.plealtad.tools.concurrency import CONCURRENCY_ERRORS, retry_on_concurrency
+from odoo.addons.plealtad.tools.metrics import timed
+from datetime import timedelta
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Procesamiento de la cola de pedidos confirmados
+ORDER_QUEUE_BATCH_SIZE = 500
+ORDER_QUEUE_TIME_BUDGET = 5 * 60  # segundos por ejecución del cron
+ORDER_QUEUE_MAX_ATTEMPTS = 5
+ORDER_QUEUE_BACKOFF_SECONDS = 60
+
+class LoyaltyOrderQueue(models.Model):
+    """
+    Cola de pedidos confirmados pendientes de acreditar puntos.
+
+    La confirmación del pedido sólo inserta una fila (una por pedido, gracias
+    a la restricción única); un cron acredita los puntos por lotes. Cada lote
+    bloquea sus filas con ``FOR UPDATE SKIP LOCKED`` y marca las entradas
+    como procesadas en la misma transacción que acredita los puntos, por lo
+    que un reintento o la caída de un worker nunca acredita un pedido dos
+    veces.
+    """
+    _name = 'loyalty.order.queue'
+    _description = 'Cola de Pedidos para Puntos de Lealtad'
+    _order = 'id'
+
+    order_id = fields.Many2one(
+        'sale.order',
+        string='Pedido',
+        required=True,
+        ondelete='cascade'
+    )
+
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('done', 'Acreditado'),
+        ('skipped', 'Omitido'),
+        ('failed', 'Fallido'),
+    ], string='Estado', required=True, default='pending', index=True)
+
+    attempts = fields.Integer(
+        string='Intentos',
+        default=0
+    )
+
+    next_attempt_date = fields.Datetime(
+        string='Próximo Intento',
+        default=fields.Datetime.now
+    )
+
+    processed_date = fields.Datetime(
+        string='Fecha de Proceso'
+    )
+
+    last_error = fields.Text(
+        string='Último Error'
+    )
+
+    _sql_constraints = [
+        ('order_uniq', 'unique(order_id)', 'El pedido ya está en la cola de puntos.'),
+    ]
+
+    @api.model
+    def enqueue_orders(self, orders):
+        """
+        Encola pedidos confirmados; los que ya estaban en la cola se ignoran.
+
+        Args:
+            orders (sale.order): Pedidos confirmados
+
+        Returns:
+            int: Número de pedidos encolados
+        """
+        if not orders:
+            return 0
+        self.env.cr.execute("""
+            INSERT INTO loyalty_order_queue (
+                order_id, state, attempts, next_attempt_date,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT order_id, 'pending', 0, NOW() AT TIME ZONE 'UTC',
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%(order_ids)s::int[]) AS o(order_id)
+                ON CONFLICT (order_id) DO NOTHING
+        """, {'order_ids': orders.ids, 'uid': self.env.uid})
+        count = self.env.cr.rowcount
+        if count:
+            # El cron se ejecuta en cuanto se confirme la transacción actual
+            self.env.ref('plealtad.ir_cron_loyalty_order_queue').sudo()._trigger()
+        return count
+
+    @api.model
+    @timed('process_order_queue')
+    def process_queue(self, batch_size=ORDER_QUEUE_BATCH_SIZE, time_budget=None, commit=False):
+        """
+        Acredita los puntos de los pedidos pendientes por lotes.
+
+        Args:
+            batch_size (int): Pedidos por lote
+            time_budget (float, optional): Segundos máximos de la ejecución
+            commit (bool): Confirmar la transacción después de cada lote,
+                repitiéndolo ante conflictos de concurrencia
+
+        Returns:
+            bool: True si la cola quedó vacía
+        """
+        started = time.monotonic()
+        while True:
+            if commit:
+                processed = retry_on_concurrency(self.env.cr, lambda: self._process_batch(batch_size))
+            else:
+                processed = self._process_batch(batch_size)
+            if processed < batch_size:
+                return True
+            if time_budget and time.monotonic() - started >= time_budget:
+                return False
+
+    @api.model
+    def _process_batch(self, batch_size):
+        """
+        Bloquea y procesa un lote de entradas pendientes.
+
+        Returns:
+            int: Número de entradas tomadas del lote
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id
+              FROM loyalty_order_queue
+             WHERE state = 'pending'
+               AND next_attempt_date <= %s
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (fields.Datetime.now(), batch_size))
+        entries = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not entries:
+            return 0
+
+        try:
+            with self.env.cr.savepoint():
+                entries._credit_entries()
+        except CONCURRENCY_ERRORS:
+            raise
+        except Exception as e:
+            # Un pedido defectuoso no debe bloquear el lote: repetir entrada
+            # por entrada y programar el reintento sólo de las que fallan
+            _logger.warning(f'Error en lote de pedidos, se procesará por entrada: {str(e)}')
+            for entry in entries:
+                try:
+                    with self.env.cr.savepoint():
+                        entry._credit_entries()
+                except CONCURRENCY_ERRORS:
+                    raise
+                except Exception as entry_error:
+                    _logger.error(f'Error al acreditar el pedido de la entrada {entry.id}: {str(entry_error)}')
+                    entry._schedule_retry(str(entry_error))
+
+        _logger.info(f'Lote de pedidos procesado: {len(entries)} entradas')
+        return len(entries)
+
+    def _credit_entries(self):
+        """Acredita los puntos de las entradas y registra su resultado"""
+        Partner = self.env['res.partner'].sudo()
+        now = fields.Datetime.now()
+        skipped = {}
+        to_credit = []
+        for entry in self:
+            order = entry.order_id
+            if order.state != 'sale':
+                skipped[entry] = _('El pedido ya no está confirmado.')
+                continue
+            points = Partner._get_order_points(order)
+            if points <= 0:
+                skipped[entry] = _('El pedido no genera puntos.')
+                continue
+            to_credit.append((entry, (order.partner_id.id, points, _('Puntos por compra'), order.name)))
+
+        results = Partner.add_loyalty_points_batch([item for __, item in to_credit])
+        credited = self.browse()
+        failed = self.browse()
+        for (entry, __), result in zip(to_credit, results):
+            if result['success']:
+                credited |= entry
+            elif result['code'] in ('no_card', 'invalid'):
+                skipped[entry] = result['message']
+            else:
+                failed |= entry
+
+        credited.write({'state': 'done', 'processed_date': now, 'last_error': False})
+        for entry, reason in skipped.items():
+            entry.write({'state': 'skipped', 'processed_date': now, 'last_error': reason})
+        failed._schedule_retry(_('Error al añadir puntos de lealtad.'))
+
+    def _schedule_retry(self, error):
+        """Programa el siguiente intento con espera exponencial"""
+        now = fields.Datetime.now()
+        for entry in self:
+            attempts = entry.attempts + 1
+            if attempts >= ORDER_QUEUE_MAX_ATTEMPTS:
+                entry.write({'state': 'failed', 'attempts': attempts, 'last_error': error})
+                continue
+            entry.write({
+                'attempts': attempts,
+                'last_error': error,
+                'next_attempt_date': now + timedelta(seconds=ORDER_QUEUE_BACKOFF_SECONDS * 2 ** attempts),
+            })
+
+    @api.model
+    def get_queue_stats(self):
+        """
+        Profundidad y retraso de la cola.
+
+        Returns:
+            dict: Pendientes, fallidos y antigüedad en segundos del pedido
+                pendiente más antiguo
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT COUNT(*) FILTER (WHERE state = 'pending'),
+                   COUNT(*) FILTER (WHERE state = 'failed'),
+                   EXTRACT(EPOCH FROM (NOW() AT TIME ZONE 'UTC') - MIN(create_date) FILTER (WHERE state = 'pending'))
+              FROM loyalty_order_queue
+             WHERE state IN ('pending', 'failed')
+        """)
+        pending, failed, lag = self.env.cr.fetchone()
+        return {
+            'pending': pending,
+            'failed': failed,
+            'lag_seconds': float(lag or 0.0),
+        }
+
+    @api.model
+    def _cron_process_queue(self):
+        """Método para cron de acreditación de pedidos"""
+        try:
+            done = self.process_queue(time_budget=ORDER_QUEUE_TIME_BUDGET, commit=True)
+            stats = self.get_queue_stats()
+            _logger.info(
+                f'Cola de pedidos: {stats["pending"]} pendientes, {stats["failed"]} fallidos, '
+                f'retraso {stats["lag_seconds"]:.0f}s'
+            )
+            if not done:
+                self.env.ref('plealtad.ir_cron_loyalty_order_queue')._trigger()
+        except Exception as e:
+            self.env.cr.rollback()
+            _logger.error(f'Error en cron de cola de pedidos: {str(e)}')
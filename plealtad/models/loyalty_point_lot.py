@@ -0,0 +1,335 @@
+from odoo import models, fields, api, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Vigencia de los puntos ganados
+POINTS_VALIDITY_PARAM = 'plealtad.points_validity_days'
+POINTS_VALIDITY_DAYS = 365
+LOT_REBUILD_BATCH_SIZE = 5000
+
+class LoyaltyPointLot(models.Model):
+    """
+    Lote de puntos generado por cada movimiento ``earn`` del historial.
+
+    Cada lote tiene su propia fecha de expiración y su saldo restante. Las
+    redenciones consumen primero los lotes que expiran antes (FIFO) y la
+    expiración nocturna sólo recorre, por índice, los lotes vencidos con
+    saldo.
+    """
+    _name = 'loyalty.point.lot'
+    _description = 'Lote de Puntos de Lealtad'
+    _order = 'expiration_date, id'
+
+    history_id = fields.Many2one(
+        'loyalty.history',
+        string='Movimiento',
+        required=True,
+        ondelete='cascade'
+    )
+
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Cliente',
+        required=True,
+        ondelete='cascade'
+    )
+
+    card_id = fields.Many2one(
+        'loyalty.card',
+        string='Tarjeta de Lealtad',
+        required=True,
+        ondelete='cascade'
+    )
+
+    date = fields.Datetime(string='Fecha', required=True)
+    expiration_date = fields.Date(string='Fecha de Expiración', required=True)
+    points = fields.Float(string='Puntos', readonly=True)
+    remaining = fields.Float(string='Puntos Restantes', readonly=True)
+
+    _sql_constraints = [
+        ('history_uniq', 'unique(history_id)', 'Un movimiento sólo puede generar un lote.'),
+    ]
+
+    def init(self):
+        """Índices parciales sobre los lotes que aún tienen saldo"""
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS loyalty_point_lot_due_idx
+                ON loyalty_point_lot (expiration_date, id)
+             WHERE remaining > 0
+        """)
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS loyalty_point_lot_partner_fifo_idx
+                ON loyalty_point_lot (partner_id, expiration_date, id)
+             WHERE remaining > 0
+        """)
+
+    @api.model
+    def _get_validity_days(self):
+        """Días de vigencia configurados para los puntos"""
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            POINTS_VALIDITY_PARAM, POINTS_VALIDITY_DAYS
+        ))
+
+    # =========================================================================
+    # Mantenimiento desde el historial
+    # =========================================================================
+    @api.model
+    def _apply_earn(self, history_ids):
+        """
+        Crea los lotes de los movimientos ``earn`` indicados.
+
+        Args:
+            history_ids (list): IDs de ``loyalty.history``
+        """
+        if not history_ids:
+            return
+        self.env['loyalty.history'].flush_model()
+        self.env.cr.execute("""
+            INSERT INTO loyalty_point_lot (
+                history_id, partner_id, card_id, date, expiration_date, points, remaining,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT id, partner_id, card_id, date,
+                   (date + make_interval(days => %(days)s))::date, points, points,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM loyalty_history
+             WHERE id = ANY(%(history_ids)s)
+               AND transaction_type = 'earn'
+                ON CONFLICT (history_id) DO NOTHING
+            RETURNING partner_id
+        """, {'history_ids': list(history_ids), 'days': self._get_validity_days(), 'uid': self.env.uid})
+        partner_ids = {row[0] for row in self.env.cr.fetchall()}
+        self.invalidate_model()
+        self.env['res.partner']._schedule_loyalty_sync(partner_ids, expiration=True)
+
+    @api.model
+    def _consume(self, debits):
+        """
+        Descuenta puntos de los lotes de cada partner, empezando por los que
+        expiran antes, con una sola sentencia para todos los partners.
+
+        Args:
+            debits (dict): {partner_id: puntos a descontar}
+        """
+        debits = {partner_id: points for partner_id, points in debits.items() if points > 0}
+        if not debits:
+            return
+        self.flush_model()
+        partner_ids = list(debits)
+        self.env.cr.execute("""
+            WITH debit AS (
+                SELECT * FROM unnest(%(partner_ids)s::int[], %(points)s::float[]) AS d(partner_id, points)
+            ), ordered AS (
+                SELECT l.id, l.remaining, d.points,
+                       SUM(l.remaining) OVER (PARTITION BY l.partner_id ORDER BY l.expiration_date, l.id) AS running
+                  FROM loyalty_point_lot l
+                  JOIN debit d ON d.partner_id = l.partner_id
+                 WHERE l.remaining > 0
+            )
+            UPDATE loyalty_point_lot l
+               SET remaining = LEAST(o.remaining, GREATEST(o.running - o.points, 0)),
+                   write_uid = %(uid)s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM ordered o
+             WHERE l.id = o.id
+               AND o.running - o.remaining < o.points
+        """, {
+            'partner_ids': partner_ids,
+            'points': [debits[partner_id] for partner_id in partner_ids],
+            'uid': self.env.uid,
+        })
+        self.invalidate_model(['remaining'])
+        self.env['res.partner']._schedule_loyalty_sync(partner_ids, expiration=True)
+
+    @api.model
+    def _rebuild_partners(self, partner_ids):
+        """
+        Reconstruye desde el historial los lotes de los partners indicados.
+
+        Con consumo FIFO el resultado equivale a descontar el total de
+        redenciones y expiraciones de los lotes más antiguos.
+
+        Args:
+            partner_ids (list): IDs de partners a reconstruir
+        """
+        if not partner_ids:
+            return
+        self.env['loyalty.history'].flush_model()
+        params = {
+            'partner_ids': list(partner_ids),
+            'days': self._get_validity_days(),
+            'uid': self.env.uid,
+        }
+        self.env.cr.execute("""
+            DELETE FROM loyalty_point_lot WHERE partner_id = ANY(%(partner_ids)s)
+        """, params)
+        self.env.cr.execute("""
+            WITH earn AS (
+                SELECT id, partner_id, card_id, date, points,
+                       (date + make_interval(days => %(days)s))::date AS expiration_date
+                  FROM loyalty_history
+                 WHERE partner_id = ANY(%(partner_ids)s)
+                   AND transaction_type = 'earn'
+            ), ordered AS (
+                SELECT e.*,
+                       SUM(points) OVER (PARTITION BY partner_id ORDER BY expiration_date, id) AS running
+                  FROM earn e
+            ), debit AS (
+                SELECT partner_id, SUM(points) AS points
+                  FROM loyalty_history
+                 WHERE partner_id = ANY(%(partner_ids)s)
+                   AND transaction_type IN ('redeem', 'expire')
+              GROUP BY partner_id
+            )
+            INSERT INTO loyalty_point_lot (
+                history_id, partner_id, card_id, date, expiration_date, points, remaining,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT o.id, o.partner_id, o.card_id, o.date, o.expiration_date, o.points,
+                   LEAST(o.points, GREATEST(o.running - COALESCE(d.points, 0), 0)),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM ordered o
+         LEFT JOIN debit d ON d.partner_id = o.partner_id
+        """, params)
+        self.invalidate_model()
+        self.env['res.partner']._schedule_loyalty_sync(partner_ids, expiration=True)
+
+    @api.model
+    def rebuild_all(self, batch_size=LOT_REBUILD_BATCH_SIZE, commit=False):
+        """
+        Reconstruye los lotes de todos los partners por bloques.
+
+        Args:
+            batch_size (int): Partners por lote
+            commit (bool): Confirmar la transacción después de cada lote
+
+        Returns:
+            int: Número de partners reconstruidos
+        """
+        cr = self.env.cr
+        last_id = 0
+        total = 0
+        while True:
+            cr.execute("""
+                SELECT DISTINCT partner_id
+                  FROM loyalty_history
+                 WHERE partner_id > %s
+              ORDER BY partner_id
+                 LIMIT %s
+            """, (last_id, batch_size))
+            partner_ids = [row[0] for row in cr.fetchall()]
+            if not partner_ids:
+                break
+
+            self._rebuild_partners(partner_ids)
+            last_id = partner_ids[-1]
+            total += len(partner_ids)
+            if commit:
+                cr.commit()
+            _logger.info(f'Lotes de puntos reconstruidos: {total} partners (hasta id {last_id})')
+        return total
+
+    # =========================================================================
+    # Expiración
+    # =========================================================================
+    @api.model
+    def _expire_due_lots(self, limit):
+        """
+        Expira un bloque de lotes vencidos con saldo.
+
+        Pone en cero los lotes, registra un movimiento ``expire`` por partner
+        y descuenta los puntos de cada tarjeta. Los lotes se toman con
+        ``SKIP LOCKED`` para que dos ejecuciones no procesen los mismos.
+
+        Args:
+            limit (int): Lotes por bloque
+
+        Returns:
+            tuple: (lotes expirados, IDs de partners afectados)
+        """
+        cr = self.env.cr
+        now = fields.Datetime.now()
+        self.flush_model()
+        cr.execute("""
+            WITH due AS (
+                SELECT id, remaining
+                  FROM loyalty_point_lot
+                 WHERE expiration_date < %(today)s
+                   AND remaining > 0
+              ORDER BY expiration_date, id
+                 LIMIT %(limit)s
+                   FOR UPDATE SKIP LOCKED
+            )
+            UPDATE loyalty_point_lot l
+               SET remaining = 0,
+                   write_uid = %(uid)s,
+                   write_date = %(now)s
+              FROM due
+             WHERE l.id = due.id
+         RETURNING l.partner_id, l.card_id, due.remaining
+        """, {'today': fields.Date.context_today(self), 'limit': limit, 'uid': self.env.uid, 'now': now})
+        rows = cr.fetchall()
+        if not rows:
+            return 0, []
+
+        by_partner = {}
+        by_card = {}
+        for partner_id, card_id, points in rows:
+            partner = by_partner.setdefault(partner_id, [card_id, 0.0])
+            partner[0] = min(partner[0], card_id)
+            partner[1] += points
+            by_card[card_id] = by_card.get(card_id, 0.0) + points
+
+        partner_ids = list(by_partner)
+        cr.execute("""
+            INSERT INTO loyalty_history (
+                partner_id, card_id, points, transaction_type, reason, date,
+                points_balance, company_id,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT e.partner_id, e.card_id, e.points, 'expire', %(reason)s, %(now)s,
+                   COALESCE((
+                       SELECT h.points_balance
+                         FROM loyalty_history h
+                        WHERE h.partner_id = e.partner_id
+                     ORDER BY h.date DESC, h.id DESC
+                        LIMIT 1
+                   ), 0) - e.points,
+                   COALESCE(p.company_id, %(company_id)s),
+                   %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(partner_ids)s::int[], %(card_ids)s::int[], %(points)s::float[])
+                   AS e(partner_id, card_id, points)
+              JOIN loyalty_card c ON c.id = e.card_id
+              JOIN loyalty_program p ON p.id = c.program_id
+         RETURNING id
+        """, {
+            'partner_ids': partner_ids,
+            'card_ids': [by_partner[pid][0] for pid in partner_ids],
+            'points': [by_partner[pid][1] for pid in partner_ids],
+            'reason': _('Puntos expirados'),
+            'now': now,
+            'uid': self.env.uid,
+            'company_id': self.env.company.id,
+        })
+        history_ids = [row[0] for row in cr.fetchall()]
+        self.env['loyalty.ledger.summary']._apply_history(history_ids)
+
+        card_ids = list(by_card)
+        cr.execute("""
+            UPDATE loyalty_card c
+               SET points = GREATEST(c.points - e.points, 0),
+                   write_uid = %(uid)s,
+                   write_date = %(now)s
+              FROM unnest(%(card_ids)s::int[], %(points)s::float[]) AS e(card_id, points)
+             WHERE c.id = e.card_id
+        """, {'card_ids': card_ids, 'points': [by_card[cid] for cid in card_ids], 'uid': self.env.uid, 'now': now})
+
+        # El SQL directo no pasa por el ORM: descartar la caché afectada y
+        # recalcular los puntos de los partners a partir de sus tarjetas
+        self.invalidate_model()
+        self.env['loyalty.card'].invalidate_model(['points'])
+        self.env['loyalty.card'].browse(card_ids).modified(['points'])
+        self.env['loyalty.history'].invalidate_model()
+        self.env['res.partner']._schedule_loyalty_sync(partner_ids, expiration=True)
+        return len(rows), partner_ids
@@ -0,0 +1,14 @@
+from odoo import models
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class LoyaltyProgram(models.Model):
+    _inherit = 'loyalty.program'
+
+    def write(self, vals):
+        result = super().write(vals)
+        if {'active', 'program_type', 'name'}.intersection(vals):
+            # Un cambio de programa afecta a todos sus clientes
+            self.env['res.partner']._bump_loyalty_snapshot_global_version()
+        return result
@@ -0,0 +1,118 @@
+from odoo import models, api
+from odoo.addons.plealtad.tools.lru_cache import LRUCache
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Catálogo de países y estados en memoria, por base de datos e idioma
+COUNTRY_CATALOG_VERSION_PARAM = 'plealtad.country_catalog_version'
+COUNTRY_CATALOG_CACHE = LRUCache(max_size=2000)
+
+class ResCountry(models.Model):
+    """
+    Caché por proceso de los países y estados usados en el registro.
+
+    La versión del catálogo se guarda en ``ir.config_parameter``; cualquier
+    escritura en países o estados la incrementa y los demás workers descartan
+    su copia al leer la nueva versión.
+    """
+    _inherit = 'res.country'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        countries = super().create(vals_list)
+        self._bump_country_catalog_version()
+        return countries
+
+    def write(self, vals):
+        result = super().write(vals)
+        self._bump_country_catalog_version()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self._bump_country_catalog_version()
+        return result
+
+    @api.model
+    def _get_country_catalog_version(self):
+        """Versión actual del catálogo (``get_param`` está en caché del ORM)"""
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            COUNTRY_CATALOG_VERSION_PARAM, 0
+        ))
+
+    @api.model
+    def _bump_country_catalog_version(self):
+        """Invalida el catálogo en caché de todos los workers"""
+        params = self.env['ir.config_parameter'].sudo()
+        version = int(params.get_param(COUNTRY_CATALOG_VERSION_PARAM, 0))
+        params.set_param(COUNTRY_CATALOG_VERSION_PARAM, version + 1)
+
+    @api.model
+    def _get_catalog(self, kind, loader, country_id=0):
+        """
+        Obtiene una entrada del catálogo, cargándola si no está en caché.
+
+        Args:
+            kind (str): Tipo de entrada ('countries' o 'states')
+            loader (callable): Función que devuelve la lista a guardar
+            country_id (int, optional): País de los estados
+
+        Returns:
+            list: Diccionarios con id, name y code
+        """
+        version = self._get_country_catalog_version()
+        key = (self.env.cr.dbname, self.env.lang or 'en_US', kind, country_id)
+
+        cached = COUNTRY_CATALOG_CACHE.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        data = loader()
+        COUNTRY_CATALOG_CACHE.set(key, (version, data))
+        return data
+
+    @api.model
+    def _get_cached_countries(self):
+        """
+        Lista de países en el idioma del entorno.
+
+        Returns:
+            list: Diccionarios con id, name y code de cada país
+        """
+        def loader():
+            countries = self.sudo().search([])
+            return [{
+                'id': country.id,
+                'name': country.name,
+                'code': country.code,
+            } for country in countries]
+
+        return self._get_catalog('countries', loader)
+
+    @api.model
+    def _get_cached_states(self, country_id):
+        """
+        Lista de estados/provincias de un país en el idioma del entorno.
+
+        Args:
+            country_id (int): ID del país
+
+        Returns:
+            list: Diccionarios con id, name y code de cada estado
+        """
+        country_id = int(country_id or 0)
+        if not country_id:
+            return []
+
+        def loader():
+            states = self.env['res.country.state'].sudo().search([
+                ('country_id', '=', country_id)
+            ])
+            return [{
+                'id': state.id,
+                'name': state.name,
+                'code': state.code,
+            } for state in states]
+
+        return self._get_catalog('states', loader, country_id)
@@ -0,0 +1,23 @@
+from odoo import models, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class ResCountryState(models.Model):
+    _inherit = 'res.country.state'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        states = super().create(vals_list)
+        self.env['res.country']._bump_country_catalog_version()
+        return states
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env['res.country']._bump_country_catalog_version()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env['res.country']._bump_country_catalog_version()
+        return result
@@ -1,16 +1,92 @@
 import logging
-import random
-import string
-from datetime import datetime, timedelta
-from odoo import models, fields, api, _
+import time
+from datetime import timedelta
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
 from odoo.tools import float_round
+from odoo.addons.plealtad.tools.concurrency import CONCURRENCY_ERRORS, retry_on_concurrency
+from odoo.addons.plealtad.tools.lru_cache import LRUCache
+from odoo.addons.plealtad.tools.bloom import BloomFilter
+from odoo.addons.plealtad.tools.metrics import METRICS, timed
+from odoo.addons.plealtad.models.loyalty_history import HISTORY_PAGE_SIZE
 
 _logger = logging.getLogger(__name__)
 
+# Parámetros del motor de expiración de puntos
+EXPIRATION_CHUNK_SIZE = 1000
+EXPIRATION_TIME_BUDGET = 15 * 60  # segundos por ejecución del cron
+
+# Política de normalización de teléfonos
+PHONE_PREFIX_POLICY_PARAM = 'plealtad.phone_prefix_policy'
+PHONE_COUNTRY_PREFIX_PARAM = 'plealtad.phone_country_prefix'
+PHONE_NATIONAL_LENGTH = 10
+PHONE_BACKFILL_BATCH_SIZE = 10000
+EMAIL_BACKFILL_BATCH_SIZE = 10000
+
+# Espera máxima por el bloqueo de una tarjeta al mover sus puntos
+CARD_LOCK_TIMEOUT_PARAM = 'plealtad.card_lock_timeout_ms'
+CARD_LOCK_TIMEOUT_MS = 5000
+
+# Caché de resúmenes de lealtad para el portal, por proceso
+LOYALTY_SNAPSHOT_CACHE_SIZE = 20000
+LOYALTY_SNAPSHOT_GLOBAL_VERSION_PARAM = 'plealtad.loyalty_snapshot_global_version'
+LOYALTY_SNAPSHOT_CACHE = LRUCache(max_size=LOYALTY_SNAPSHOT_CACHE_SIZE)
+
+# Partners con cambios de lealtad pendientes en los datos de precommit del cursor
+PARTNER_SYNC_KEY = 'plealtad.partner_sync'
+
+# Filtro en memoria de correos y teléfonos registrados, por proceso y base
+CONTACT_FILTER_ERROR_RATE = 0.01
+CONTACT_FILTER_MIN_CAPACITY = 100000
+CONTACT_FILTER_SYNC_SECONDS = 5
+# Margen al releer partners modificados: cubre transacciones que confirman
+# después de iniciada la sincronización (``write_date`` es su hora de inicio)
+CONTACT_FILTER_SYNC_OVERLAP_SECONDS = 10 * 60
+# Filtro construido por el cron y compartido por los workers
+CONTACT_FILTER_SNAPSHOT_PARAM = 'plealtad.contact_filter_snapshot'
+CONTACT_FILTER_ATTACHMENT_NAME = 'plealtad_contact_filter.bin'
+CONTACT_FILTER_FETCH_SIZE = 10000
+CONTACT_FILTERS = {}
+
+
+def normalize_phone(phone, policy='keep', country_prefix='52'):
+    """
+    Normaliza un teléfono a sólo dígitos según la política de prefijo de país.
+
+    Args:
+        phone (str): Teléfono capturado
+        policy (str): ``keep`` conserva todos los dígitos, ``strip`` elimina el
+            prefijo internacional (``00``/``+``) y ``country_prefix`` cuando el
+            número excede la longitud nacional, ``national`` conserva sólo los
+            últimos dígitos nacionales
+        country_prefix (str): Prefijo de país a eliminar con ``strip``
+
+    Returns:
+        str: Teléfono normalizado o cadena vacía si no contiene dígitos
+    """
+    digits = ''.join(filter(str.isdigit, phone or ''))
+    if policy == 'strip':
+        if digits.startswith('00'):
+            digits = digits[2:]
+        if country_prefix and digits.startswith(country_prefix) and len(digits) > PHONE_NATIONAL_LENGTH:
+            digits = digits[len(country_prefix):]
+    elif policy == 'national':
+        digits = digits[-PHONE_NATIONAL_LENGTH:]
+    return digits
+
+
+def normalize_email(email):
+    """Normaliza un correo para comparaciones de unicidad (minúsculas y sin espacios)"""
+    return (email or '').strip().lower()
+
+
 class ResPartner(models.Model):
     _inherit = 'res.partner'
 
+    _sql_constraints = [
+        ('email_key_uniq', 'unique(email_key)', 'Este correo electrónico ya está registrado.'),
+    ]
+
     # =========================================================================
     # Campos base de lealtad y verificación
     # =========================================================================
@@ -24,21 +100,21 @@ class ResPartner(models.Model):
     loyalty_program_id = fields.Many2one(
         'loyalty.program',
         string='Programa de Lealtad',
-        compute='_compute_loyalty_program',
+        compute='_compute_loyalty_values',
         store=True,
         help='Programa de lealtad actual del cliente'
     )
 
     points = fields.Float(
         string='Puntos del Programa',
-        compute='_compute_loyalty_points',
+        compute='_compute_loyalty_values',
         store=True,
         help='Puntos acumulados en el programa de lealtad'
     )
     
     is_loyalty_active = fields.Boolean(
         string='Programa Activo',
-        compute='_compute_loyalty_active',
+        compute='_compute_loyalty_values',
         store=True,
         help='Indica si el cliente tiene un programa de lealtad activo'
     )
@@ -58,9 +134,9 @@ class ResPartner(models.Model):
 
     points_expiration_date = fields.Date(
         string='Fecha de Expiración de Puntos',
-        compute='_compute_points_expiration',
-        store=True,
-        help='Fecha en que expirarán los puntos actuales'
+        readonly=True,
+        copy=False,
+        help='Fecha en que expira el lote de puntos con saldo más próximo'
     )
 
     total_points_earned = fields.Float(
@@ -88,127 +164,335 @@ class ResPartner(models.Model):
         help='Historial de transacciones de lealtad'
     )
 
+    email_key = fields.Char(
+        string='Correo Normalizado',
+        readonly=True,
+        copy=False,
+        help='Correo en minúsculas y sin espacios usado para validar unicidad'
+    )
+
+    loyalty_summary_ids = fields.One2many(
+        'loyalty.ledger.summary',
+        'partner_id',
+        string='Resumen de Lealtad',
+        help='Totales de lealtad por programa'
+    )
+
+    loyalty_snapshot_version = fields.Integer(
+        string='Versión del Resumen de Lealtad',
+        default=0,
+        readonly=True,
+        copy=False,
+        help='Se incrementa con cada cambio de tarjetas o historial del cliente'
+    )
+
+    phone_normalized = fields.Char(
+        string='Teléfono Normalizado',
+        index=True,
+        readonly=True,
+        copy=False,
+        help='Teléfono sólo con dígitos usado para validar unicidad'
+    )
+
     # =========================================================================
     # Campos computados y sus dependencias
     # =========================================================================
-    @api.depends('loyalty_card_ids', 'loyalty_card_ids.points')
-    def _compute_loyalty_points(self):
-        """Calcula los puntos actuales del programa de lealtad"""
-        for partner in self:
-            try:
-                active_cards = partner.loyalty_card_ids.filtered(
-                    lambda c: c.program_id.program_type == 'loyalty' and 
-                             c.program_id.active
-                )
-                partner.points = sum(active_cards.mapped('points'))
-                partner.last_points_update = fields.Datetime.now()
-                _logger.info(f'Puntos calculados para {partner.name}: {partner.points}')
-            except Exception as e:
-                _logger.error(f'Error al calcular puntos para {partner.name}: {str(e)}')
-                partner.points = 0.0
+    @api.depends(
+        'loyalty_card_ids',
+        'loyalty_card_ids.points',
+        'loyalty_card_ids.program_id',
+        'loyalty_card_ids.program_id.program_type',
+        'loyalty_card_ids.program_id.active'
+    )
+    @timed('_compute_loyalty_values')
+    def _compute_loyalty_values(self):
+        """
+        Calcula puntos, estado y programa de lealtad en una sola pasada.
 
-    @api.depends('loyalty_card_ids.program_id')
-    def _compute_loyalty_active(self):
-        """Determina si el partner tiene un programa de lealtad activo"""
-        for partner in self:
-            try:
-                active_cards = partner.loyalty_card_ids.filtered(
-                    lambda c: c.program_id.program_type == 'loyalty' and 
-                             c.program_id.active
-                )
-                partner.is_loyalty_active = bool(active_cards)
-                _logger.info(f'Estado de lealtad para {partner.name}: {partner.is_loyalty_active}')
-            except Exception as e:
-                _logger.error(f'Error al verificar estado de lealtad para {partner.name}: {str(e)}')
-                partner.is_loyalty_active = False
+        Los partners guardados se resuelven con una única consulta agrupada sobre
+        ``loyalty.card``; los registros en memoria (onchange) se calculan con
+        sus tarjetas en caché.
 
-    @api.depends('loyalty_card_ids.program_id')
-    def _compute_loyalty_program(self):
-        """Obtiene el programa de lealtad activo del partner"""
-        for partner in self:
-            try:
-                active_card = partner.loyalty_card_ids.filtered(
-                    lambda c: c.program_id.program_type == 'loyalty' and 
-                             c.program_id.active
-                )
-                partner.loyalty_program_id = active_card[0].program_id if active_card else False
-                _logger.info(f'Programa obtenido para {partner.name}: {partner.loyalty_program_id.name if partner.loyalty_program_id else "Ninguno"}')
-            except Exception as e:
-                _logger.error(f'Error al obtener programa de lealtad para {partner.name}: {str(e)}')
-                partner.loyalty_program_id = False
+        Los valores guardados se cargan antes de asignar: el ORM descarta las
+        asignaciones iguales al valor en caché, así que un partner cuyos
+        valores no cambian no genera ningún UPDATE. La fecha de última
+        actualización la mantienen los movimientos del historial
+        (``_schedule_loyalty_sync``), no este cálculo.
+        """
+        try:
+            card_values = self._get_loyalty_card_values()
+        except Exception as e:
+            _logger.error(f'Error al calcular valores de lealtad: {str(e)}')
+            card_values = {}
 
-    @api.depends('last_points_update')
-    def _compute_points_expiration(self):
-        """Calcula la fecha de expiración de los puntos"""
-        expiration_days = 365  # 1 año de vigencia
+        stored = self.filtered(lambda p: isinstance(p.id, int))
+        stored.fetch(['points', 'is_loyalty_active', 'loyalty_program_id'])
         for partner in self:
-            try:
-                if partner.last_points_update:
-                    partner.points_expiration_date = fields.Date.from_string(partner.last_points_update) + timedelta(days=expiration_days)
-                else:
-                    partner.points_expiration_date = False
-                _logger.info(f'Fecha de expiración calculada para {partner.name}: {partner.points_expiration_date}')
-            except Exception as e:
-                _logger.error(f'Error al calcular fecha de expiración para {partner.name}: {str(e)}')
-                partner.points_expiration_date = False
+            points, program = card_values.get(partner.id, (0.0, False))
+            partner.points = points
+            partner.is_loyalty_active = bool(program)
+            partner.loyalty_program_id = program
+
+        _logger.debug('Valores de lealtad calculados para %s partners', len(self))
+
+    def _get_loyalty_card_values(self):
+        """
+        Agrupa las tarjetas de lealtad activas por partner.
+
+        Returns:
+            dict: {partner_id: (puntos, programa)} de los partners con tarjeta activa;
+                el programa es el de la tarjeta activa más antigua
+        """
+        stored = self.filtered(lambda p: isinstance(p.id, int))
+        values = {}
+
+        if stored:
+            groups = self.env['loyalty.card'].sudo()._read_group(
+                [
+                    ('partner_id', 'in', stored.ids),
+                    ('program_id.program_type', '=', 'loyalty'),
+                    ('program_id.active', '=', True),
+                ],
+                ['partner_id'],
+                ['points:sum', 'id:min']
+            )
+            first_cards = self.env['loyalty.card'].sudo().browse([card_id for __, __, card_id in groups])
+            programs = {card.id: card.program_id for card in first_cards}
+            for partner, points, card_id in groups:
+                values[partner.id] = (points or 0.0, programs[card_id])
+
+        for partner in self - stored:
+            active_cards = partner.loyalty_card_ids.filtered(
+                lambda c: c.program_id.program_type == 'loyalty' and 
+                         c.program_id.active
+            )
+            if active_cards:
+                values[partner.id] = (sum(active_cards.mapped('points')), active_cards[0].program_id)
+
+        return values
 
-    @api.depends('loyalty_history_ids')
+    @api.depends('loyalty_summary_ids.points_earned', 'loyalty_summary_ids.points_redeemed')
+    @timed('_compute_total_points')
     def _compute_total_points(self):
-        """Calcula el total histórico de puntos ganados y redimidos"""
+        """Obtiene el total histórico de puntos ganados y redimidos del resumen"""
+        stored = self.filtered(lambda p: isinstance(p.id, int))
+        totals = {}
+        if stored:
+            groups = self.env['loyalty.ledger.summary'].sudo()._read_group(
+                [('partner_id', 'in', stored.ids)],
+                ['partner_id'],
+                ['points_earned:sum', 'points_redeemed:sum']
+            )
+            totals = {partner.id: (earned, redeemed) for partner, earned, redeemed in groups}
+
         for partner in self:
-            try:
-                earned = sum(partner.loyalty_history_ids.filtered(lambda h: h.transaction_type == 'earn').mapped('points'))
-                redeemed = sum(partner.loyalty_history_ids.filtered(lambda h: h.transaction_type == 'redeem').mapped('points'))
-                
-                partner.total_points_earned = earned
-                partner.total_points_redeemed = redeemed
-                
-                _logger.info(f'Totales calculados para {partner.name}: Ganados={earned}, Redimidos={redeemed}')
-            except Exception as e:
-                _logger.error(f'Error al calcular totales para {partner.name}: {str(e)}')
-                partner.total_points_earned = 0.0
-                partner.total_points_redeemed = 0.0
+            earned, redeemed = totals.get(partner.id, (0.0, 0.0))
+            partner.total_points_earned = earned or 0.0
+            partner.total_points_redeemed = redeemed or 0.0
 
     # =========================================================================
     # Métodos de manejo de puntos y recompensas
     # =========================================================================
+    @timed('add_loyalty_points')
     def add_loyalty_points(self, points, reason=None, order_reference=None):
         """Añade puntos al programa de lealtad del partner"""
         self.ensure_one()
-        try:
-            if not self.is_loyalty_active:
-                raise ValidationError(_('El cliente no tiene un programa de lealtad activo.'))
-                
-            active_card = self.loyalty_card_ids.filtered(
-                lambda c: c.program_id.program_type == 'loyalty' and 
-                         c.program_id.active
-            )
-            
-            if not active_card:
-                raise ValidationError(_('No se encontró una tarjeta de lealtad activa.'))
-                
-            active_card[0].write({
-                'points': active_card[0].points + points,
-            })
+        result = self.add_loyalty_points_batch([(self.id, points, reason, order_reference)])[0]
+        if not result['success']:
+            _logger.error(f'Error al añadir puntos: {result["message"]}')
+            raise ValidationError(_('Error al añadir puntos de lealtad.'))
 
-            # Registrar la transacción en el historial
-            self.env['loyalty.history'].create({
-                'partner_id': self.id,
-                'card_id': active_card[0].id,
-                'points': points,
-                'transaction_type': 'earn',
-                'reason': reason or _('Puntos añadidos por compra'),
-                'order_reference': order_reference,
-                'date': fields.Datetime.now()
-            })
-            
+        if result['code'] == 'credited':
             _logger.info(f'Puntos añadidos para {self.name}: {points}')
-            return True
-            
-        except Exception as e:
-            _logger.error(f'Error al añadir puntos: {str(e)}')
-            raise ValidationError(_('Error al añadir puntos de lealtad.'))
+        return True
+
+    @api.model
+    @timed('add_loyalty_points_batch')
+    def add_loyalty_points_batch(self, items):
+        """
+        Añade puntos a muchos partners en una sola operación.
+
+        Agrupa los puntos por tarjeta para hacer una sola escritura por tarjeta
+        y registra todo el historial con un único INSERT. Un elemento inválido
+        no detiene el lote: se reporta en su resultado. Los elementos con una
+        referencia ya acreditada al partner, aunque la registre otra
+        transacción concurrente, se omiten y se reportan como exitosos con
+        ``duplicate`` en True.
+
+        Args:
+            items (list): Tuplas ``(partner_id, puntos, motivo, referencia)``;
+                motivo y referencia pueden ser ``None``
+
+        Returns:
+            list: Un diccionario por elemento, en el mismo orden, con las
+                llaves ``partner_id``, ``success``, ``message`` y ``code``:
+                ``credited``, ``duplicate``, ``invalid`` (puntos no
+                numéricos o no positivos), ``no_card`` o ``error``
+        """
+        results = [{'partner_id': item[0], 'success': False, 'message': '', 'code': 'error'} for item in items]
+        cards = self._get_active_loyalty_cards([item[0] for item in items])
+
+        # Referencias ya acreditadas: un lote repetido se descarta sin tocar las
+        # tarjetas; las que registra otra transacción las omite el INSERT
+        credited = self.env['loyalty.history']._existing_references(
+            (item[0], item[3], 'earn') for item in items
+        )
+
+        # Agrupar los elementos válidos por tarjeta
+        items_by_card = {}
+        amounts = {}
+        for index, (partner_id, points, reason, order_reference) in enumerate(items):
+            try:
+                points = float(points or 0.0)
+            except (TypeError, ValueError):
+                points = 0.0
+            if points <= 0:
+                results[index].update(code='invalid', message=_('Los puntos deben ser un valor positivo.'))
+                continue
+            if order_reference:
+                key = (partner_id, order_reference, 'earn')
+                if key in credited:
+                    results[index].update(success=True, duplicate=True, code='duplicate',
+                                          message=_('Los puntos de esta referencia ya fueron acreditados.'))
+                    continue
+                credited.add(key)
+            card = cards.get(partner_id)
+            if not card:
+                results[index].update(code='no_card', message=_('No se encontró una tarjeta de lealtad activa.'))
+                continue
+            amounts[index] = points
+            items_by_card.setdefault(card, []).append(index)
+
+        # Registrar primero el historial: la referencia que otra transacción
+        # ya insertó se omite y sólo se acreditan las filas insertadas
+        now = fields.Datetime.now()
+        History = self.env['loyalty.history'].sudo()
+        history_values = []
+        for card, indexes in items_by_card.items():
+            for i in indexes:
+                partner_id, __, reason, order_reference = items[i]
+                history_values.append({
+                    'partner_id': partner_id,
+                    'card_id': card.id,
+                    'points': amounts[i],
+                    'transaction_type': 'earn',
+                    'reason': reason or _('Puntos añadidos por compra'),
+                    'order_reference': order_reference,
+                    'date': now
+                })
+        history = History._insert_or_skip(history_values)
+        inserted_references = {
+            (record.partner_id.id, record.order_reference) for record in history if record.order_reference
+        }
+
+        failed = History
+        for card, indexes in items_by_card.items():
+            credited_indexes = []
+            for i in indexes:
+                partner_id, __, __, order_reference = items[i]
+                if order_reference and (partner_id, order_reference) not in inserted_references:
+                    results[i].update(success=True, duplicate=True, code='duplicate',
+                                      message=_('Los puntos de esta referencia ya fueron acreditados.'))
+                else:
+                    credited_indexes.append(i)
+            if not credited_indexes:
+                continue
+            try:
+                # Sin flush: la actualización del partner se escribe una vez por lote
+                with self.env.cr.savepoint(flush=False):
+                    self._mutate_card_points(card, sum(amounts[i] for i in credited_indexes))
+            except CONCURRENCY_ERRORS:
+                # Sólo se resuelven repitiendo la transacción completa
+                raise
+            except Exception as e:
+                _logger.error(f'Error al acreditar puntos en la tarjeta {card.id}: {str(e)}')
+                failed |= history.filtered(lambda record: record.card_id == card)
+                for i in credited_indexes:
+                    results[i]['message'] = _('Error al añadir puntos de lealtad.')
+                continue
+            for i in credited_indexes:
+                results[i].update(success=True, code='credited')
+
+        # Los movimientos de tarjetas no acreditadas nunca se propagaron
+        if failed:
+            self.env.cr.execute("DELETE FROM loyalty_history WHERE id = ANY(%s)", (failed.ids,))
+            failed.invalidate_recordset()
+            history -= failed
+        history._apply_ledger_changes()
 
+        _logger.info(f'Lote de puntos procesado: {len(history)} de {len(items)} elementos acreditados')
+        return results
+
+    @api.model
+    def _get_active_loyalty_cards(self, partner_ids):
+        """
+        Obtiene la tarjeta de lealtad activa de cada partner.
+
+        Args:
+            partner_ids (list): IDs de partners
+
+        Returns:
+            dict: {partner_id: loyalty.card} con la tarjeta activa más antigua
+        """
+        cards = self.env['loyalty.card'].sudo().search([
+            ('partner_id', 'in', list(set(partner_ids))),
+            ('program_id.program_type', '=', 'loyalty'),
+            ('program_id.active', '=', True),
+        ], order='id')
+
+        cards_by_partner = {}
+        for card in cards:
+            cards_by_partner.setdefault(card.partner_id.id, card)
+        return cards_by_partner
+
+    @api.model
+    def _mutate_card_points(self, card, delta, allow_negative=True):
+        """
+        Suma ``delta`` a los puntos de una tarjeta de forma atómica.
+
+        El incremento se hace en SQL sobre el valor actual de la fila, por lo
+        que dos operaciones concurrentes no pierden actualizaciones. La espera
+        por el bloqueo de la fila está acotada por ``plealtad.card_lock_timeout_ms``.
+
+        Args:
+            card (loyalty.card): Tarjeta a modificar
+            delta (float): Puntos a sumar (negativo para descontar)
+            allow_negative (bool): Permitir que el saldo quede negativo
+
+        Returns:
+            float: Nuevo saldo, o None si el saldo resultante sería negativo
+        """
+        cr = self.env.cr
+        lock_timeout = int(self.env['ir.config_parameter'].sudo().get_param(
+            CARD_LOCK_TIMEOUT_PARAM, CARD_LOCK_TIMEOUT_MS
+        ))
+
+        card.flush_recordset(['points'])
+        cr.execute("SELECT set_config('lock_timeout', %s, true)", (f'{lock_timeout}ms',))
+        cr.execute("""
+            UPDATE loyalty_card
+               SET points = points + %(delta)s,
+                   write_uid = %(uid)s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+             WHERE id = %(card_id)s
+               AND (%(allow_negative)s OR points + %(delta)s >= 0)
+         RETURNING points
+        """, {
+            'delta': delta,
+            'uid': self.env.uid,
+            'card_id': card.id,
+            'allow_negative': allow_negative,
+        })
+        row = cr.fetchone()
+        cr.execute("SELECT set_config('lock_timeout', '0', true)")
+
+        # Propagar el cambio a la caché y a los campos que dependen de los puntos
+        card.invalidate_recordset(['points'])
+        card.modified(['points'])
+        self._schedule_loyalty_sync(card.partner_id.ids)
+        return row[0] if row else None
+
+    @timed('redeem_points')
     def redeem_points(self, points_to_redeem, order_reference=None):
         """Redime puntos del programa de lealtad"""
         self.ensure_one()
@@ -216,32 +500,34 @@ class ResPartner(models.Model):
             if not self.is_loyalty_active:
                 raise ValidationError(_('El cliente no tiene un programa de lealtad activo.'))
 
-            if points_to_redeem > self.points:
-                raise ValidationError(_('Puntos insuficientes para redención.'))
+            if points_to_redeem <= 0:
+                raise ValidationError(_('Los puntos deben ser un valor positivo.'))
 
-            active_card = self.loyalty_card_ids.filtered(
-                lambda c: c.program_id.program_type == 'loyalty' and 
-                         c.program_id.active
-            )
+            active_card = self._get_active_loyalty_cards([self.id]).get(self.id)
 
             if not active_card:
                 raise ValidationError(_('No se encontró una tarjeta de lealtad activa.'))
 
-            # Registrar la redención
-            self.env['loyalty.history'].create({
-                'partner_id': self.id,
-                'card_id': active_card[0].id,
-                'points': points_to_redeem,
-                'transaction_type': 'redeem',
-                'reason': _('Redención de puntos'),
-                'order_reference': order_reference,
-                'date': fields.Datetime.now()
-            })
+            # La redención se registra antes de descontar: una repetición de la
+            # misma orden, aunque sea concurrente, se omite en el INSERT
+            with self.env.cr.savepoint():
+                redemption = self.env['loyalty.history']._insert_or_skip([{
+                    'partner_id': self.id,
+                    'card_id': active_card.id,
+                    'points': points_to_redeem,
+                    'transaction_type': 'redeem',
+                    'reason': _('Redención de puntos'),
+                    'order_reference': order_reference,
+                    'date': fields.Datetime.now()
+                }])
+                if not redemption:
+                    _logger.info(f'Redención ya registrada para {self.name}: {order_reference}')
+                    return True
 
-            # Actualizar puntos
-            active_card[0].write({
-                'points': active_card[0].points - points_to_redeem
-            })
+                # Descontar los puntos sólo si el saldo alcanza, en una sola sentencia
+                if self._mutate_card_points(active_card, -points_to_redeem, allow_negative=False) is None:
+                    raise ValidationError(_('Puntos insuficientes para redención.'))
+                redemption._apply_ledger_changes()
 
             # Enviar correo de confirmación
             self._send_redemption_email(points_to_redeem, order_reference)
@@ -249,6 +535,9 @@ class ResPartner(models.Model):
             _logger.info(f'Puntos redimidos para {self.name}: {points_to_redeem}')
             return True
 
+        except CONCURRENCY_ERRORS:
+            # Dejar que Odoo repita la petición completa
+            raise
         except Exception as e:
             _logger.error(f'Error al redimir puntos: {str(e)}')
             raise ValidationError(_('Error al redimir puntos de lealtad.'))
@@ -257,50 +546,635 @@ class ResPartner(models.Model):
         """Envía correo de confirmación de redención"""
         try:
             template = self.env.ref('plealtad.email_template_points_redemption')
-            template.with_context(
-                points_before=self.points + points_redeemed,
-                points_redeemed=points_redeemed,
-                points_after=self.points,
-                order_reference=order_reference
-            ).send_mail(self.id, force_send=True)
+            self.env['loyalty.mail.outbox'].enqueue(template, self.id, {
+                'points_before': self.points + points_redeemed,
+                'points_redeemed': points_redeemed,
+                'points_after': self.points,
+                'order_reference': order_reference,
+            })
             
-            _logger.info(f'Correo de redención enviado a {self.name}')
+            _logger.info(f'Correo de redención encolado para {self.name}')
         except Exception as e:
             _logger.error(f'Error al enviar correo de redención: {str(e)}')
 
     # =========================================================================
-    # Validaciones
+    # Resumen de lealtad en caché
     # =========================================================================
-    @api.constrains('email')
-    def _check_unique_email(self):
-        """Valida que el email sea único"""
-        for partner in self:
-            if partner.email:
-                _logger.info(f'Validando unicidad de email: {partner.email}')
-                duplicate = self.search([
-                    ('email', '=ilike', partner.email),
-                    ('id', '!=', partner.id)
-                ])
-                if duplicate:
-                    _logger.warning(f'Email duplicado encontrado: {partner.email}')
-                    raise ValidationError(_('Este correo electrónico ya está registrado.'))
+    def _get_loyalty_snapshot(self):
+        """
+        Obtiene el resumen de lealtad del partner desde la caché del proceso.
 
+        Cada entrada se guarda junto con la versión del partner y la versión
+        global; como ambas viven en base de datos, cualquier worker detecta
+        un cambio hecho por otro sin necesidad de notificaciones.
+
+        Returns:
+            dict: Puntos, estado, programa, tarjeta y fecha de expiración
+        """
+        self.ensure_one()
+        self._sync_pending_loyalty()
+        partner = self.sudo()
+        global_version = int(self.env['ir.config_parameter'].sudo().get_param(
+            LOYALTY_SNAPSHOT_GLOBAL_VERSION_PARAM, 0
+        ))
+        version = (global_version, partner.loyalty_snapshot_version)
+        key = (self.env.cr.dbname, partner.id)
+
+        cached = LOYALTY_SNAPSHOT_CACHE.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        program = partner.loyalty_program_id
+        card = partner._get_active_loyalty_cards([partner.id]).get(partner.id)
+        snapshot = {
+            'points': partner.points,
+            'is_active': bool(partner.is_loyalty_active or (program and program.active)),
+            'program_id': program.id,
+            'program_name': program.name or '',
+            'card_id': card.id if card else False,
+            'expiration_date': partner.points_expiration_date,
+        }
+        LOYALTY_SNAPSHOT_CACHE.set(key, (version, snapshot))
+        return snapshot
+
+    @api.model
+    def _schedule_loyalty_sync(self, partner_ids, last_update=False, expiration=False):
+        """
+        Registra partners cuyo resumen de lealtad cambió en la transacción.
+
+        La fila del partner se escribe una sola vez, antes del commit
+        (``_flush_loyalty_sync``): una acumulación que mueve la tarjeta, el
+        historial y los lotes genera un único UPDATE por partner.
+
+        Args:
+            partner_ids (iterable): IDs de partners modificados
+            last_update (bool): Recalcular la fecha del último movimiento
+            expiration (bool): Recalcular la fecha de expiración de puntos
+        """
+        partner_ids = {partner_id for partner_id in partner_ids if partner_id}
+        if not partner_ids:
+            return
+        cr = self.env.cr
+        pending = cr.precommit.data.get(PARTNER_SYNC_KEY)
+        if pending is None:
+            pending = cr.precommit.data[PARTNER_SYNC_KEY] = {
+                'snapshot': set(), 'last_update': set(), 'expiration': set(),
+            }
+            cr.precommit.add(self.sudo()._flush_loyalty_sync)
+        pending['snapshot'] |= partner_ids
+        if last_update:
+            pending['last_update'] |= partner_ids
+        if expiration:
+            pending['expiration'] |= partner_ids
+
+    @api.model
+    def _flush_loyalty_sync(self):
+        """
+        Escribe con un solo UPDATE los partners registrados en la transacción:
+        incrementa la versión del resumen en caché y recalcula, sólo donde se
+        pidió, la fecha del último movimiento y la de expiración de puntos.
+        """
+        pending = self.env.cr.precommit.data.pop(PARTNER_SYNC_KEY, None)
+        if not pending:
+            return
+        partner_ids = sorted(pending['snapshot'])
+        self.flush_model(['loyalty_snapshot_version', 'last_points_update', 'points_expiration_date'])
+        self.env['loyalty.history'].flush_model(['partner_id', 'date'])
+        self.env['loyalty.point.lot'].flush_model(['partner_id', 'expiration_date', 'remaining'])
+        self.env.cr.execute("""
+            UPDATE res_partner p
+               SET loyalty_snapshot_version = COALESCE(p.loyalty_snapshot_version, 0) + 1,
+                   last_points_update = CASE
+                       WHEN p.id = ANY(%(last_update)s) THEN (
+                           SELECT MAX(h.date)
+                             FROM loyalty_history h
+                            WHERE h.partner_id = p.id
+                       )
+                       ELSE p.last_points_update
+                   END,
+                   points_expiration_date = CASE
+                       WHEN p.id = ANY(%(expiration)s) THEN (
+                           SELECT MIN(l.expiration_date)
+                             FROM loyalty_point_lot l
+                            WHERE l.partner_id = p.id
+                              AND l.remaining > 0
+                       )
+                       ELSE p.points_expiration_date
+                   END
+             WHERE p.id = ANY(%(partner_ids)s)
+        """, {
+            'partner_ids': partner_ids,
+            'last_update': list(pending['last_update']),
+            'expiration': list(pending['expiration']),
+        })
+        self.browse(partner_ids).invalidate_recordset(
+            ['loyalty_snapshot_version', 'last_points_update', 'points_expiration_date']
+        )
+
+    def _sync_pending_loyalty(self):
+        """Escribe ya los cambios pendientes si afectan a los partners del recordset"""
+        pending = self.env.cr.precommit.data.get(PARTNER_SYNC_KEY)
+        if pending and not pending['snapshot'].isdisjoint(self.ids):
+            self._flush_loyalty_sync()
+
+    @api.model
+    def _bump_loyalty_snapshot_global_version(self):
+        """Invalida el resumen en caché de todos los partners"""
+        params = self.env['ir.config_parameter'].sudo()
+        version = int(params.get_param(LOYALTY_SNAPSHOT_GLOBAL_VERSION_PARAM, 0))
+        params.set_param(LOYALTY_SNAPSHOT_GLOBAL_VERSION_PARAM, version + 1)
+
+    # =========================================================================
+    # Validaciones
+    # =========================================================================
     @api.constrains('phone')
     def _check_unique_phone(self):
         """Valida que el teléfono sea único"""
         for partner in self:
-            if partner.phone:
+            if partner.phone_normalized:
                 _logger.info(f'Validando unicidad de teléfono: {partner.phone}')
-                normalized_phone = ''.join(filter(str.isdigit, partner.phone))
                 duplicate = self.search([
-                    ('phone', '!=', False),
+                    ('phone_normalized', '=', partner.phone_normalized),
                     ('id', '!=', partner.id)
-                ]).filtered(lambda p: ''.join(filter(str.isdigit, p.phone)) == normalized_phone)
+                ], limit=1)
                 
                 if duplicate:
                     _logger.warning(f'Teléfono duplicado encontrado: {partner.phone}')
                     raise ValidationError(_('Este número de teléfono ya está registrado.'))
 
+    # =========================================================================
+    # Normalización de correo y teléfono
+    # =========================================================================
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if 'email' in vals:
+                vals['email_key'] = normalize_email(vals['email']) or False
+            if 'phone' in vals:
+                vals['phone_normalized'] = self._normalize_phone(vals['phone'])
+        partners = super().create(vals_list)
+        self._update_contact_filter(vals_list)
+        return partners
+
+    def write(self, vals):
+        if 'email' in vals:
+            vals = dict(vals, email_key=normalize_email(vals['email']) or False)
+        if 'phone' in vals:
+            vals = dict(vals, phone_normalized=self._normalize_phone(vals['phone']))
+        result = super().write(vals)
+        self._update_contact_filter([vals])
+        return result
+
+    @api.model
+    def _update_contact_filter(self, vals_list):
+        """Agrega al filtro del proceso los correos y teléfonos escritos"""
+        state = CONTACT_FILTERS.get(self.env.cr.dbname)
+        if not state:
+            return
+        for vals in vals_list:
+            self._add_to_contact_filter(state['bloom'], vals.get('email_key'), vals.get('phone_normalized'))
+
+    @api.model
+    def _email_exists(self, email):
+        """Indica si el correo ya está registrado usando el índice único"""
+        email_key = normalize_email(email)
+        return bool(email_key) and self.sudo().search_count([('email_key', '=', email_key)], limit=1) > 0
+
+    @api.model
+    def _backfill_email_key(self, batch_size=EMAIL_BACKFILL_BATCH_SIZE, commit=False):
+        """
+        Rellena el correo normalizado de los partners existentes por lotes.
+
+        Los partners se recorren por id; ante correos que sólo difieren en
+        mayúsculas o espacios conserva la clave en el partner más antiguo y
+        deja vacía la de los demás para no violar el índice único.
+
+        Args:
+            batch_size (int): Partners por lote
+            commit (bool): Confirmar la transacción después de cada lote
+
+        Returns:
+            int: Número de partners actualizados
+        """
+        cr = self.env.cr
+        last_id = 0
+        total = 0
+
+        self.flush_model(['email', 'email_key'])
+        while True:
+            cr.execute("""
+                SELECT id, email
+                  FROM res_partner
+                 WHERE id > %s
+                   AND email IS NOT NULL
+                   AND email_key IS NULL
+              ORDER BY id
+                 LIMIT %s
+            """, (last_id, batch_size))
+            rows = cr.fetchall()
+            if not rows:
+                break
+
+            batch = {}
+            for partner_id, email in rows:
+                email_key = normalize_email(email)
+                if email_key and email_key not in batch:
+                    batch[email_key] = partner_id
+
+            if batch:
+                cr.execute("""
+                    UPDATE res_partner p
+                       SET email_key = v.email_key,
+                           write_date = NOW() AT TIME ZONE 'UTC'
+                      FROM unnest(%s::int[], %s::varchar[]) AS v(id, email_key)
+                     WHERE p.id = v.id
+                       AND NOT EXISTS (
+                           SELECT 1 FROM res_partner o WHERE o.email_key = v.email_key
+                       )
+                """, (list(batch.values()), list(batch.keys())))
+                total += cr.rowcount
+
+            last_id = rows[-1][0]
+            if commit:
+                cr.commit()
+            _logger.info(f'Correos normalizados: {total} (hasta id {last_id})')
+
+        self.invalidate_model(['email_key'])
+        return total
+
+    @api.model
+    def _report_email_collisions(self):
+        """
+        Reporta los partners cuyo correo coincide con otro salvo mayúsculas o
+        espacios y que por ello quedaron sin correo normalizado.
+
+        Returns:
+            list: Tuplas (correo normalizado, [ids de partners]) por colisión
+        """
+        self.flush_model(['email', 'email_key'])
+        self.env.cr.execute("""
+            SELECT lower(btrim(email)) AS email_key, array_agg(id ORDER BY id)
+              FROM res_partner
+             WHERE email IS NOT NULL
+               AND btrim(email) != ''
+          GROUP BY lower(btrim(email))
+            HAVING count(*) > 1
+          ORDER BY 1
+        """)
+        collisions = self.env.cr.fetchall()
+
+        if collisions:
+            details = '\n'.join(f'{email_key}: {partner_ids}' for email_key, partner_ids in collisions)
+            _logger.warning(f'Correos duplicados por mayúsculas/espacios: {len(collisions)}\n{details}')
+            self.env['loyalty.logger'].sudo().log_event(
+                'warning',
+                'Colisiones de correo normalizado',
+                level='warning',
+                details=details,
+                source='res.partner'
+            )
+        return collisions
+
+    @api.model
+    def _get_phone_normalization_policy(self):
+        """Obtiene la política y el prefijo de país configurados"""
+        params = self.env['ir.config_parameter'].sudo()
+        policy = params.get_param(PHONE_PREFIX_POLICY_PARAM, 'keep')
+        country_prefix = params.get_param(PHONE_COUNTRY_PREFIX_PARAM, '52')
+        return policy, country_prefix
+
+    @api.model
+    def _normalize_phone(self, phone):
+        """Normaliza un teléfono con la política configurada"""
+        policy, country_prefix = self._get_phone_normalization_policy()
+        return normalize_phone(phone, policy, country_prefix) or False
+
+    @api.model
+    def _backfill_phone_normalized(self, batch_size=PHONE_BACKFILL_BATCH_SIZE, force=False, commit=False):
+        """
+        Rellena el teléfono normalizado de los partners existentes por lotes.
+
+        Args:
+            batch_size (int): Partners por lote
+            force (bool): Renormalizar también los ya rellenados, p. ej. tras
+                cambiar la política de prefijo
+            commit (bool): Confirmar la transacción después de cada lote
+
+        Returns:
+            int: Número de partners actualizados
+        """
+        cr = self.env.cr
+        policy, country_prefix = self._get_phone_normalization_policy()
+        last_id = 0
+        total = 0
+
+        self.flush_model(['phone', 'phone_normalized'])
+        while True:
+            cr.execute("""
+                SELECT id, phone
+                  FROM res_partner
+                 WHERE id > %s
+                   AND (%s OR (phone IS NOT NULL AND phone_normalized IS NULL))
+              ORDER BY id
+                 LIMIT %s
+            """, (last_id, force, batch_size))
+            rows = cr.fetchall()
+            if not rows:
+                break
+
+            ids = [row[0] for row in rows]
+            normalized = [normalize_phone(phone, policy, country_prefix) or None for __, phone in rows]
+            cr.execute("""
+                UPDATE res_partner p
+                   SET phone_normalized = v.phone_normalized,
+                       write_date = NOW() AT TIME ZONE 'UTC'
+                  FROM unnest(%s::int[], %s::varchar[]) AS v(id, phone_normalized)
+                 WHERE p.id = v.id
+            """, (ids, normalized))
+
+            last_id = ids[-1]
+            total += len(ids)
+            if commit:
+                cr.commit()
+            _logger.info(f'Teléfonos normalizados: {total} (hasta id {last_id})')
+
+        self.invalidate_model(['phone_normalized'])
+        return total
+
+    # =========================================================================
+    # Filtro de correos y teléfonos registrados
+    # =========================================================================
+    def init(self):
+        """Índice para leer los partners modificados al sincronizar el filtro de contactos"""
+        tools.create_index(self._cr, 'res_partner_write_date_idx', self._table, ['write_date'])
+
+    def _register_hook(self):
+        """Carga el filtro de contactos al cargar el registro del worker"""
+        super()._register_hook()
+        self._load_contact_filter()
+
+    @api.model
+    def _build_contact_filter(self):
+        """
+        Construye el filtro de Bloom con todos los correos y teléfonos
+        normalizados, incluidos los de partners archivados, con capacidad
+        ajustada al número actual de partners.
+
+        Returns:
+            BloomFilter: Filtro construido
+        """
+        cr = self.env.cr
+        self.flush_model(['email_key', 'phone_normalized'])
+        cr.execute("SELECT COUNT(*) FROM res_partner")
+        count = cr.fetchone()[0]
+
+        # Hasta dos claves por partner, con el doble de margen para nuevos registros
+        bloom = BloomFilter(
+            max(4 * count, CONTACT_FILTER_MIN_CAPACITY),
+            CONTACT_FILTER_ERROR_RATE
+        )
+        cr.execute("""
+            SELECT email_key, phone_normalized
+              FROM res_partner
+             WHERE email_key IS NOT NULL OR phone_normalized IS NOT NULL
+        """)
+        while True:
+            rows = cr.fetchmany(CONTACT_FILTER_FETCH_SIZE)
+            if not rows:
+                break
+            for email_key, phone_normalized in rows:
+                self._add_to_contact_filter(bloom, email_key, phone_normalized)
+        return bloom
+
+    @api.model
+    def _cron_rebuild_contact_filter(self):
+        """
+        Reconstruye el filtro de contactos fuera de las peticiones y lo publica
+        como adjunto; cada worker lo carga en su siguiente sincronización.
+        """
+        cr = self.env.cr
+        # Las modificaciones posteriores al inicio de la transacción las
+        # recoge la sincronización incremental de cada worker
+        watermark = cr.now()
+        bloom = self._build_contact_filter()
+
+        Attachment = self.env['ir.attachment'].sudo()
+        previous = Attachment.search([
+            ('res_model', '=', self._name),
+            ('name', '=', CONTACT_FILTER_ATTACHMENT_NAME),
+        ])
+        attachment = Attachment.create({
+            'name': CONTACT_FILTER_ATTACHMENT_NAME,
+            'res_model': self._name,
+            'raw': bloom.dumps(),
+            'mimetype': 'application/octet-stream',
+        })
+        self.env['ir.config_parameter'].sudo().set_param(
+            CONTACT_FILTER_SNAPSHOT_PARAM,
+            f'{attachment.id}|{fields.Datetime.to_string(watermark)}'
+        )
+        previous.unlink()
+        _logger.info(
+            f'Filtro de contactos construido: {len(bloom)} claves, '
+            f'{bloom.memory_bytes / 1024:.0f} KiB, {bloom.hash_count} hashes'
+        )
+
+    @api.model
+    def _get_contact_filter_snapshot(self):
+        """
+        Lee el filtro publicado por el cron directamente de la tabla: la caché
+        de parámetros de este worker puede estar atrasada.
+
+        Returns:
+            tuple: (ID del adjunto, marca de agua) o (None, None)
+        """
+        self.env['ir.config_parameter'].flush_model(['key', 'value'])
+        self.env.cr.execute(
+            "SELECT value FROM ir_config_parameter WHERE key = %s", (CONTACT_FILTER_SNAPSHOT_PARAM,)
+        )
+        row = self.env.cr.fetchone()
+        if not row or '|' not in (row[0] or ''):
+            return None, None
+        attachment_id, watermark = row[0].split('|', 1)
+        return int(attachment_id), fields.Datetime.to_datetime(watermark)
+
+    @api.model
+    def _load_contact_filter(self, snapshot=None):
+        """
+        Carga en el proceso el filtro publicado por el cron.
+
+        Args:
+            snapshot (tuple, optional): (ID del adjunto, marca de agua) ya leídos
+
+        Returns:
+            dict: Estado del filtro, o None si aún no se ha publicado
+        """
+        cr = self.env.cr
+        attachment_id, watermark = snapshot or self._get_contact_filter_snapshot()
+        if not attachment_id:
+            return None
+        attachment = self.env['ir.attachment'].sudo().browse(attachment_id).exists()
+        if not attachment:
+            return CONTACT_FILTERS.get(cr.dbname)
+        try:
+            bloom = BloomFilter.loads(attachment.raw)
+        except ValueError as e:
+            _logger.error(f'Filtro de contactos publicado inválido: {str(e)}')
+            return CONTACT_FILTERS.get(cr.dbname)
+
+        previous = CONTACT_FILTERS.get(cr.dbname) or {}
+        state = {
+            'bloom': bloom,
+            'snapshot_id': attachment_id,
+            'synced_until': watermark,
+            'synced_at': 0.0,
+            'lookups': previous.get('lookups', 0),
+            'filtered': previous.get('filtered', 0),
+            'false_positives': previous.get('false_positives', 0),
+        }
+        CONTACT_FILTERS[cr.dbname] = state
+        return self._sync_contact_filter(state)
+
+    @api.model
+    def _sync_contact_filter(self, state):
+        """
+        Agrega al filtro los correos y teléfonos de los partners creados o
+        modificados (por ``write_date``) desde la última sincronización.
+
+        Args:
+            state (dict): Estado del filtro
+
+        Returns:
+            dict: Estado actualizado
+        """
+        cr = self.env.cr
+        synced_until = cr.now()
+        cr.execute("""
+            SELECT email_key, phone_normalized
+              FROM res_partner
+             WHERE write_date >= %s
+               AND (email_key IS NOT NULL OR phone_normalized IS NOT NULL)
+        """, (state['synced_until'] - timedelta(seconds=CONTACT_FILTER_SYNC_OVERLAP_SECONDS),))
+        for email_key, phone_normalized in cr.fetchall():
+            self._add_to_contact_filter(state['bloom'], email_key, phone_normalized)
+        state['synced_until'] = max(state['synced_until'], synced_until)
+        state['synced_at'] = time.monotonic()
+        return state
+
+    @api.model
+    def _add_to_contact_filter(self, bloom, email_key=None, phone_normalized=None):
+        """Agrega un correo y/o teléfono normalizados al filtro"""
+        if email_key:
+            bloom.add(f'e:{email_key}')
+        if phone_normalized:
+            bloom.add(f'p:{phone_normalized}')
+
+    @api.model
+    def _get_contact_filter(self):
+        """
+        Obtiene el filtro del proceso, poniéndolo al día con los cambios de
+        otros workers.
+
+        Cada ``CONTACT_FILTER_SYNC_SECONDS`` agrega los partners creados o
+        modificados desde la última sincronización, y carga el filtro que el
+        cron haya vuelto a publicar. Ninguna petición recorre ``res_partner``
+        completo: la reconstrucción sólo la hace el cron.
+
+        Returns:
+            dict: Estado del filtro, o None si el cron aún no lo publica
+        """
+        state = CONTACT_FILTERS.get(self.env.cr.dbname)
+        if state and time.monotonic() - state['synced_at'] <= CONTACT_FILTER_SYNC_SECONDS:
+            return state
+
+        snapshot = self._get_contact_filter_snapshot()
+        if snapshot[0] and (not state or state['snapshot_id'] != snapshot[0]):
+            return self._load_contact_filter(snapshot)
+        if not state:
+            return None
+        return self._sync_contact_filter(state)
+
+    @api.model
+    def _contact_maybe_registered(self, email_key=None, phone_normalized=None):
+        """
+        Consulta el filtro: False significa que el contacto no está registrado.
+
+        Args:
+            email_key (str, optional): Correo normalizado
+            phone_normalized (str, optional): Teléfono normalizado
+
+        Returns:
+            bool: True si el contacto podría estar registrado
+        """
+        state = self._get_contact_filter()
+        if not state:
+            # Sin filtro publicado se consulta siempre el índice
+            return True
+        key = f'e:{email_key}' if email_key else f'p:{phone_normalized}'
+        state['lookups'] += 1
+        if key in state['bloom']:
+            return True
+        state['filtered'] += 1
+        return False
+
+    @api.model
+    def _is_contact_registered(self, email=None, phone=None):
+        """
+        Indica si un correo o teléfono ya está registrado. Las respuestas
+        negativas del filtro no consultan la base de datos; las positivas se
+        confirman con el índice correspondiente.
+
+        Args:
+            email (str, optional): Correo a verificar
+            phone (str, optional): Teléfono a verificar
+
+        Returns:
+            bool: True si el contacto está registrado
+        """
+        if email is not None:
+            email_key = normalize_email(email)
+            if not email_key or not self._contact_maybe_registered(email_key=email_key):
+                return False
+            exists = self._email_exists(email)
+        else:
+            phone_normalized = self._normalize_phone(phone)
+            if not phone_normalized or not self._contact_maybe_registered(phone_normalized=phone_normalized):
+                return False
+            exists = self.sudo().search_count([
+                ('phone_normalized', '=', phone_normalized)
+            ], limit=1) > 0
+
+        state = CONTACT_FILTERS.get(self.env.cr.dbname)
+        if not exists and state:
+            state['false_positives'] += 1
+        return exists
+
+    @api.model
+    def _get_contact_filter_stats(self):
+        """
+        Estadísticas del filtro de contactos de este proceso.
+
+        Returns:
+            dict: Claves, memoria, tasa teórica y observada de falsos positivos
+        """
+        state = self._get_contact_filter()
+        if not state:
+            return {}
+        bloom = state['bloom']
+        negatives = state['filtered'] + state['false_positives']
+        return {
+            'keys': len(bloom),
+            'capacity': bloom.capacity,
+            'bits': bloom.size,
+            'hash_count': bloom.hash_count,
+            'memory_bytes': bloom.memory_bytes,
+            'expected_false_positive_rate': bloom.expected_error_rate(),
+            'lookups': state['lookups'],
+            'answered_without_db': state['filtered'],
+            'false_positives': state['false_positives'],
+            'observed_false_positive_rate': state['false_positives'] / negatives if negatives else 0.0,
+        }
+
         # =========================================================================
         # Métodos de manejo de transacciones
         # =========================================================================
@@ -350,8 +1224,7 @@ class ResPartner(models.Model):
             if not self.is_loyalty_active:
                 return False
 
-            # Calcular puntos (5 puntos por peso)
-            points_earned = float_round(order.amount_total * 5, precision_digits=2)
+            points_earned = self._get_order_points(order)
 
             # Añadir puntos
             self.add_loyalty_points(
@@ -367,9 +1240,15 @@ class ResPartner(models.Model):
             _logger.error(f'Error al procesar puntos por compra: {str(e)}')
             return False
 
+    @api.model
+    def _get_order_points(self, order):
+        """Puntos que genera un pedido (5 puntos por peso)"""
+        return float_round(order.amount_total * 5, precision_digits=2)
+
     def get_points_summary(self):
         """Obtiene resumen de puntos del cliente"""
         self.ensure_one()
+        self._sync_pending_loyalty()
         return {
             'points_available': self.points,
             'points_earned': self.total_points_earned,
@@ -382,54 +1261,124 @@ class ResPartner(models.Model):
     # =========================================================================
     # Métodos de utilidad
     # =========================================================================
-    def check_points_expiration(self):
-        """Verifica y procesa puntos expirados"""
-        expired_partners = self.search([
-            ('points_expiration_date', '<', fields.Date.today()),
-            ('points', '>', 0)
-        ])
+    @timed('check_points_expiration')
+    def check_points_expiration(self, chunk_size=EXPIRATION_CHUNK_SIZE, time_budget=None, commit=False):
+        """
+        Expira por bloques los lotes de puntos vencidos.
 
-        for partner in expired_partners:
-            try:
-                expired_points = partner.points
-                
-                # Registrar expiración en historial
-                self.env['loyalty.history'].create({
-                    'partner_id': partner.id,
-                    'transaction_type': 'expire',
-                    'points': expired_points,
-                    'reason': _('Puntos expirados'),
-                    'date': fields.Datetime.now()
-                })
+        Los lotes vencidos con saldo se leen del índice parcial por fecha de
+        expiración, de modo que cada ejecución sólo toca los lotes que vencen
+        y nunca recorre todos los partners. Cada bloque pone sus lotes en
+        cero, registra los movimientos ``expire`` y descuenta las tarjetas.
 
-                # Actualizar puntos
-                active_card = partner.loyalty_card_ids.filtered(
-                    lambda c: c.program_id.program_type == 'loyalty' and 
-                                c.program_id.active
-                )
-                if active_card:
-                    active_card[0].write({'points': 0})
+        Args:
+            chunk_size (int): Lotes por bloque
+            time_budget (float, optional): Segundos máximos de la ejecución
+            commit (bool): Confirmar la transacción al terminar cada bloque
 
-                _logger.info(f'Puntos expirados procesados para {partner.name}: {expired_points}')
+        Returns:
+            bool: True si no quedan lotes vencidos, False si se agotó el
+                presupuesto de tiempo
 
+        Raises:
+            Exception: Los errores de un bloque se propagan; con ``commit``
+                se revierte antes el bloque en curso
+        """
+        cr = self.env.cr
+        started = time.monotonic()
+
+        self.env.flush_all()
+        while True:
+            try:
+                if commit:
+                    expired_count, partner_ids = retry_on_concurrency(
+                        cr, lambda: self._expire_points_chunk(chunk_size)
+                    )
+                else:
+                    expired_count, partner_ids = self._expire_points_chunk(chunk_size)
             except Exception as e:
-                _logger.error(f'Error al procesar expiración de puntos para {partner.name}: {str(e)}')
-                continue
+                if commit:
+                    cr.rollback()
+                _logger.error(f'Error al procesar bloque de expiración de puntos: {str(e)}')
+                raise
+
+            if expired_count:
+                METRICS.inc(cr.dbname, 'plealtad_points_expired_lots_total', value=expired_count)
+                _logger.info(f'Bloque de expiración procesado: {expired_count} lotes de {len(partner_ids)} partners')
+            if expired_count < chunk_size:
+                return True
+
+            if time_budget and time.monotonic() - started >= time_budget:
+                _logger.info('Presupuesto de tiempo agotado en la expiración de puntos, se reanudará en la siguiente ejecución')
+                return False
+
+    def _expire_points_chunk(self, limit):
+        """
+        Expira un bloque de lotes vencidos.
+
+        Args:
+            limit (int): Lotes por bloque
+
+        Returns:
+            tuple: (lotes expirados, IDs de partners afectados)
+        """
+        expired_count, partner_ids = self.env['loyalty.point.lot']._expire_due_lots(limit)
+        self._schedule_loyalty_sync(partner_ids, last_update=True)
+        return expired_count, partner_ids
 
     @api.model
-    def _cron_check_points_expiration(self):
+    def _cron_check_points_expiration(self, chunk_size=EXPIRATION_CHUNK_SIZE, time_budget=EXPIRATION_TIME_BUDGET):
         """Método para cron de verificación de puntos expirados"""
         try:
-            self.check_points_expiration()
+            done = self.check_points_expiration(
+                chunk_size=chunk_size,
+                time_budget=time_budget,
+                commit=True
+            )
+            if not done:
+                # Reprogramar el cron para continuar con los lotes pendientes
+                self.env.ref('plealtad.ir_cron_check_points_expiration')._trigger()
             _logger.info('Cron de verificación de puntos expirados ejecutado exitosamente')
         except Exception as e:
+            # Un error persistente no se reprograma: se reintenta en la
+            # siguiente ejecución programada del cron
+            self.env.cr.rollback()
             _logger.error(f'Error en cron de verificación de puntos expirados: {str(e)}')
 
     def get_transaction_history(self, limit=None):
-        """Obtiene el historial de transacciones del cliente"""
+        """
+        Obtiene el historial de transacciones del cliente.
+
+        Sin límite devuelve el historial completo; para recorrerlo por
+        partes usar ``get_transaction_history_page``.
+        """
         self.ensure_one()
-        domain = [('partner_id', '=', self.id)]
-        
         if limit:
-            return self.env['loyalty.history'].search(domain, limit=limit, order='date desc')
-        return self.env['loyalty.history'].search(domain, order='date desc')
\ No newline at end of file
+            return self.get_transaction_history_page(limit=limit)['records']
+        return self.env['loyalty.history'].search([('partner_id', '=', self.id)])
+
+    def get_transaction_history_page(self, limit=HISTORY_PAGE_SIZE, after=None, before=None):
+        """
+        Obtiene una página del historial paginada por cursor (fecha, id).
+
+        Args:
+            limit (int): Movimientos por página
+            after (str, optional): Cursor para la página siguiente (más antigua)
+            before (str, optional): Cursor para la página anterior (más reciente)
+
+        Returns:
+            dict: 'records', 'next_cursor' y 'prev_cursor'
+        """
+        self.ensure_one()
+        return self.env['loyalty.history'].get_history_page(
+            self.id, limit=limit, after=after, before=before
+        )
+
+    def action_export_loyalty_history(self):
+        """Descarga el historial de lealtad del cliente en CSV"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/plealtad/history/export/{self.id}',
+            'target': 'self',
+        }
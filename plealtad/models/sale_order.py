@@ -0,0 +1,13 @@
+from odoo import models
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    def action_confirm(self):
+        result = super().action_confirm()
+        # Los puntos se acreditan fuera de la confirmación, desde la cola
+        self.env['loyalty.order.queue'].sudo().enqueue_orders(self)
+        return result
@@ -0,0 +1,48 @@
+/**
+ * Formulario de registro del programa de lealtad.
+ *
+ * Al cambiar el país se cargan sus estados desde /plealtad/states/<id>, una
+ * ruta GET que navegadores y proxies pueden conservar en caché.
+ */
+(function () {
+    'use strict';
+
+    function resetStates(stateSelect) {
+        stateSelect.querySelectorAll('option[value]:not([value=""])').forEach(function (option) {
+            option.remove();
+        });
+    }
+
+    function loadStates(countrySelect) {
+        const stateSelect = document.getElementById(countrySelect.dataset.stateSelect);
+        if (!stateSelect) {
+            return;
+        }
+        resetStates(stateSelect);
+        if (!countrySelect.value) {
+            return;
+        }
+        fetch(countrySelect.dataset.statesUrl + '/' + encodeURIComponent(countrySelect.value), {
+            headers: {'Accept': 'application/json'},
+        })
+            .then(function (response) {
+                return response.ok ? response.json() : [];
+            })
+            .then(function (states) {
+                states.forEach(function (state) {
+                    stateSelect.add(new Option(state.name, state.id));
+                });
+            })
+            .catch(function () {
+                resetStates(stateSelect);
+            });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-states-url]').forEach(function (countrySelect) {
+            countrySelect.addEventListener('change', function () {
+                loadStates(countrySelect);
+            });
+        });
+    });
+})();
@@ -0,0 +1,4 @@
+from . import test_loyalty_history
+from . import test_loyalty_ledger
+from . import test_partner_contacts
+from . import test_tools
\ No newline at end of file
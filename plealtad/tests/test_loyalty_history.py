@@ -0,0 +1,129 @@
+from datetime import timedelta
+from unittest.mock import patch
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestLoyaltyHistory(TransactionCase):
+    """Historial de puntos: paginación por cursor y registro sin repetir referencias."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.program = cls.env.ref('plealtad.default_loyalty_program')
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Cliente Prueba Historial',
+            'email': 'cliente.prueba.historial@example.com',
+        })
+        cls.card = cls.env['loyalty.card'].create({
+            'partner_id': cls.partner.id,
+            'program_id': cls.program.id,
+            'points': 0,
+        })
+
+    # =========================================================================
+    # Utilidades
+    # =========================================================================
+    def _earn_vals(self, points, order_reference=None, transaction_type='earn', date=None):
+        """Valores de un movimiento para ``_insert_or_skip``"""
+        return {
+            'partner_id': self.partner.id,
+            'card_id': self.card.id,
+            'points': points,
+            'transaction_type': transaction_type,
+            'order_reference': order_reference,
+            'date': date or fields.Datetime.now(),
+        }
+
+    def _page(self, **kwargs):
+        """Página del historial del partner como lista de IDs y cursores"""
+        page = self.env['loyalty.history'].get_history_page(self.partner.id, **kwargs)
+        return page['records'].ids, page['next_cursor'], page['prev_cursor']
+
+    # =========================================================================
+    # Paginación por cursor
+    # =========================================================================
+    def test_history_page_keyset(self):
+        """Las páginas recorren el historial en ambos sentidos sin saltar ni repetir movimientos"""
+        now = fields.Datetime.now()
+        dates = [now - timedelta(days=5), now - timedelta(days=4), now - timedelta(days=3),
+                 now - timedelta(days=3), now - timedelta(days=1)]
+        history = self.env['loyalty.history'].create([
+            dict(self._earn_vals(10), date=date) for date in dates
+        ])
+        # Más reciente primero; a igual fecha, el de mayor id
+        expected = history.sorted(lambda record: (record.date, record.id), reverse=True).ids
+
+        first, next_cursor, prev_cursor = self._page(limit=2)
+        self.assertEqual(first, expected[:2])
+        self.assertFalse(prev_cursor)
+
+        second, next_cursor, prev_cursor = self._page(limit=2, after=next_cursor)
+        self.assertEqual(second, expected[2:4])
+        self.assertTrue(prev_cursor)
+
+        third, next_cursor, third_prev = self._page(limit=2, after=next_cursor)
+        self.assertEqual(third, expected[4:])
+        self.assertFalse(next_cursor)
+
+        back, __, prev_cursor = self._page(limit=2, before=third_prev)
+        self.assertEqual(back, expected[2:4])
+        back, next_cursor, prev_cursor = self._page(limit=2, before=prev_cursor)
+        self.assertEqual(back, expected[:2])
+        self.assertFalse(prev_cursor)
+        self.assertTrue(next_cursor)
+
+    def test_history_page_invalid_cursor(self):
+        """Un cursor inválido devuelve la primera página y el límite se acota"""
+        self.env['loyalty.history'].create([self._earn_vals(5) for __ in range(3)])
+        first = self._page(limit=3)[0]
+        self.assertEqual(self._page(limit=3, after='no-es-un-cursor')[0], first)
+        self.assertEqual(len(self._page(limit=-5)[0]), 1)
+
+        page = self.partner.get_transaction_history_page(limit=3)
+        self.assertEqual(page['records'].ids, first)
+        self.assertFalse(page['next_cursor'])
+
+    # =========================================================================
+    # Registro sin repetir referencias
+    # =========================================================================
+    def test_insert_or_skip_reference(self):
+        """Una referencia ya registrada se omite sin error, también dentro del mismo INSERT"""
+        History = self.env['loyalty.history']
+        inserted = History._insert_or_skip([
+            self._earn_vals(10, 'SO-SKIP-1'),
+            self._earn_vals(10, 'SO-SKIP-1'),
+            self._earn_vals(10, 'SO-SKIP-1', transaction_type='redeem'),
+            self._earn_vals(5),
+            self._earn_vals(5),
+        ])
+        self.assertEqual(len(inserted), 4)
+        self.assertEqual(
+            sorted(inserted.mapped('transaction_type')), ['earn', 'earn', 'earn', 'redeem']
+        )
+
+        self.assertFalse(History._insert_or_skip([self._earn_vals(10, 'SO-SKIP-1')]))
+        self.assertEqual(History.search_count([
+            ('partner_id', '=', self.partner.id),
+            ('order_reference', '=', 'SO-SKIP-1'),
+        ]), 2)
+
+    def test_batch_skips_concurrent_reference(self):
+        """Si otra transacción registró la referencia, el lote no acredita la tarjeta"""
+        History = self.env['loyalty.history']
+        History._insert_or_skip([self._earn_vals(10, 'SO-RACE-1')])
+
+        # Simula que la referencia se registró después de la verificación previa
+        with patch.object(type(History), '_existing_references', return_value=set()):
+            results = self.env['res.partner'].add_loyalty_points_batch([
+                (self.partner.id, 10, None, 'SO-RACE-1'),
+                (self.partner.id, 7, None, 'SO-RACE-2'),
+            ])
+        self.assertEqual([result['code'] for result in results], ['duplicate', 'credited'])
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(self.card.points, 7)
+        self.assertEqual(History.search_count([
+            ('partner_id', '=', self.partner.id),
+            ('order_reference', 'in', ['SO-RACE-1', 'SO-RACE-2']),
+        ]), 2)
@@ -0,0 +1,144 @@
+from datetime import timedelta
+from psycopg2 import IntegrityError
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import mute_logger
+from odoo.addons.plealtad.models.loyalty_balance_checkpoint import (
+    CHECKPOINT_FIRST_PERIOD_PARAM,
+    CHECKPOINT_LAST_PERIOD_PARAM,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestLoyaltyLedger(TransactionCase):
+    """Historial de puntos: balance acumulado, lotes FIFO y puntos de control."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.program = cls.env.ref('plealtad.default_loyalty_program')
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Cliente Prueba Lealtad',
+            'email': 'cliente.prueba.lealtad@example.com',
+        })
+        cls.card = cls.env['loyalty.card'].create({
+            'partner_id': cls.partner.id,
+            'program_id': cls.program.id,
+            'points': 0,
+        })
+
+    # =========================================================================
+    # Utilidades
+    # =========================================================================
+    def _move(self, transaction_type, points, date, order_reference=None):
+        """Registra un movimiento y ajusta la tarjeta como lo hacen los flujos de puntos"""
+        delta = points if transaction_type == 'earn' else -points
+        self.env['res.partner']._mutate_card_points(self.card, delta)
+        return self.env['loyalty.history'].create({
+            'partner_id': self.partner.id,
+            'card_id': self.card.id,
+            'points': points,
+            'transaction_type': transaction_type,
+            'order_reference': order_reference,
+            'date': date,
+        })
+
+    def _lots(self):
+        """Lotes del partner: {history_id: (restante, fecha de expiración)}"""
+        lots = self.env['loyalty.point.lot'].search([('partner_id', '=', self.partner.id)])
+        return {lot.history_id.id: (lot.remaining, lot.expiration_date) for lot in lots}
+
+    def _summaries(self):
+        """Resúmenes del partner por programa"""
+        summaries = self.env['loyalty.ledger.summary'].search([('partner_id', '=', self.partner.id)])
+        return {
+            summary.program_id.id: (
+                summary.points_earned, summary.points_redeemed, summary.points_expired,
+                summary.discount_amount, summary.points_balance,
+            )
+            for summary in summaries
+        }
+
+    # =========================================================================
+    # Pruebas
+    # =========================================================================
+    def test_earn_redeem_expire_fifo(self):
+        """La redención consume primero el lote que vence antes y la expiración sólo su saldo"""
+        now = fields.Datetime.now()
+        old = self._move('earn', 100, now - timedelta(days=400))
+        new = self._move('earn', 50, now - timedelta(days=1))
+
+        self.assertTrue(self.partner.redeem_points(70))
+        lots = self._lots()
+        self.assertEqual(lots[old.id][0], 30)
+        self.assertEqual(lots[new.id][0], 50)
+
+        self.assertTrue(self.env['res.partner'].check_points_expiration())
+        lots = self._lots()
+        self.assertEqual(lots[old.id][0], 0)
+        self.assertEqual(lots[new.id][0], 50)
+
+        expired = self.env['loyalty.history'].search([
+            ('partner_id', '=', self.partner.id),
+            ('transaction_type', '=', 'expire'),
+        ])
+        self.assertEqual(expired.points, 30)
+        self.assertEqual(expired.points_balance, 50)
+        self.assertEqual(self.card.points, 50)
+        self.assertEqual(self.partner.points, 50)
+        self.assertEqual(self.partner.get_points_summary()['expiration_date'], lots[new.id][1])
+
+    def test_backdated_move_recomputes_balances_and_checkpoints(self):
+        """Un movimiento con fecha pasada recalcula los balances posteriores y los puntos de control"""
+        Checkpoint = self.env['loyalty.balance.checkpoint']
+        period = Checkpoint._month_start(fields.Datetime.now())
+        first = self._move('earn', 100, period - timedelta(days=60))
+        last = self._move('redeem', 30, period - timedelta(days=5))
+
+        params = self.env['ir.config_parameter'].sudo()
+        params.set_param(CHECKPOINT_FIRST_PERIOD_PARAM, False)
+        params.set_param(CHECKPOINT_LAST_PERIOD_PARAM, False)
+        self.assertEqual(Checkpoint.create_checkpoints(until=period), 1)
+        checkpoint = Checkpoint.search([('partner_id', '=', self.partner.id), ('date', '=', period)])
+        self.assertEqual(checkpoint.points_balance, 70)
+
+        backdated = self._move('earn', 40, period - timedelta(days=30))
+        self.assertEqual(first.points_balance, 100)
+        self.assertEqual(backdated.points_balance, 140)
+        self.assertEqual(last.points_balance, 110)
+        self.assertEqual(checkpoint.points_balance, 110)
+        self.assertEqual(Checkpoint.get_partner_balance(self.partner.id, period), 110)
+        self.assertEqual(Checkpoint.get_balances_as_of(period)[self.partner.id], 110)
+
+    def test_duplicate_order_reference_rejected(self):
+        """Una referencia ya acreditada no vuelve a sumar puntos"""
+        Partner = self.env['res.partner']
+        result = Partner.add_loyalty_points_batch([(self.partner.id, 10, None, 'SO-DUP-1')])
+        self.assertEqual(result[0]['code'], 'credited')
+        result = Partner.add_loyalty_points_batch([(self.partner.id, 10, None, 'SO-DUP-1')])
+        self.assertEqual(result[0]['code'], 'duplicate')
+        self.assertEqual(self.card.points, 10)
+
+        with self.assertRaises(IntegrityError), mute_logger('odoo.sql_db'), self.env.cr.savepoint():
+            self.env['loyalty.history'].create({
+                'partner_id': self.partner.id,
+                'card_id': self.card.id,
+                'points': 10,
+                'transaction_type': 'earn',
+                'order_reference': 'SO-DUP-1',
+            })
+
+    def test_rebuild_matches_incremental(self):
+        """Reconstruir lotes y resúmenes desde el historial da lo mismo que el cálculo incremental"""
+        now = fields.Datetime.now()
+        self._move('earn', 80, now - timedelta(days=40))
+        self._move('earn', 20, now - timedelta(days=30))
+        self._move('redeem', 90, now - timedelta(days=20))
+        self._move('earn', 60, now - timedelta(days=10))
+        self._move('redeem', 15, now - timedelta(days=5))
+
+        lots, summaries = self._lots(), self._summaries()
+        self.env['loyalty.point.lot']._rebuild_partners([self.partner.id])
+        self.env['loyalty.ledger.summary']._rebuild_partners([self.partner.id])
+        self.assertEqual(self._lots(), lots)
+        self.assertEqual(self._summaries(), summaries)
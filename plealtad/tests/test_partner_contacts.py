@@ -0,0 +1,86 @@
+from unittest.mock import patch
+from odoo.tests import TransactionCase, tagged
+from odoo.addons.plealtad.models.res_partner import CONTACT_FILTERS, CONTACT_FILTER_SNAPSHOT_PARAM
+
+
+@tagged('post_install', '-at_install')
+class TestPartnerContacts(TransactionCase):
+    """Correo normalizado y filtro de contactos del registro."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Partner = cls.env['res.partner']
+        cls.older = Partner.create({'name': 'Contacto Antiguo', 'email': 'Colision.Contacto@Example.com'})
+        cls.newer = Partner.create({'name': 'Contacto Reciente', 'email': 'otro.contacto@example.com'})
+        cls.other = Partner.create({'name': 'Contacto Único', 'email': 'unico.contacto@example.com'})
+
+    def _set_email(self, partner, email, email_key=None):
+        """Escribe el correo como lo hacía el módulo antes de normalizarlo, o como otro worker"""
+        self.env['res.partner'].flush_model()
+        self.env.cr.execute("""
+            UPDATE res_partner
+               SET email = %s, email_key = %s, write_date = NOW() AT TIME ZONE 'UTC'
+             WHERE id = %s
+        """, (email, email_key, partner.id))
+        partner.invalidate_recordset(['email', 'email_key'])
+
+    # =========================================================================
+    # Correo normalizado
+    # =========================================================================
+    def test_backfill_email_key_collisions(self):
+        """El relleno conserva la clave en el partner más antiguo y reporta la colisión"""
+        self._set_email(self.older, 'Colision.Contacto@Example.com')
+        self._set_email(self.newer, ' colision.contacto@example.com ')
+        self._set_email(self.other, 'Unico.Contacto@Example.com')
+
+        # Un lote por partner: la colisión se resuelve entre lotes
+        total = self.env['res.partner']._backfill_email_key(batch_size=1)
+        self.assertGreaterEqual(total, 2)
+        self.assertEqual(self.older.email_key, 'colision.contacto@example.com')
+        self.assertFalse(self.newer.email_key)
+        self.assertEqual(self.other.email_key, 'unico.contacto@example.com')
+        self.assertEqual(self.env['res.partner']._backfill_email_key(), 0)
+
+        collisions = self.env['res.partner']._report_email_collisions()
+        self.assertIn(('colision.contacto@example.com', [self.older.id, self.newer.id]), collisions)
+        self.assertNotIn('unico.contacto@example.com', [email_key for email_key, __ in collisions])
+
+    def test_email_key_follows_email(self):
+        """Crear y escribir el correo mantiene la clave normalizada"""
+        self.assertEqual(self.older.email_key, 'colision.contacto@example.com')
+        self.newer.write({'email': '  Nuevo.Contacto@Example.COM'})
+        self.assertEqual(self.newer.email_key, 'nuevo.contacto@example.com')
+        self.assertTrue(self.env['res.partner']._email_exists('NUEVO.contacto@example.com '))
+
+    # =========================================================================
+    # Filtro de contactos
+    # =========================================================================
+    def test_contact_filter_snapshot_and_sync(self):
+        """Los workers cargan el filtro del cron y agregan lo que otros workers modifican"""
+        Partner = self.env['res.partner']
+        self.env['ir.config_parameter'].sudo().set_param(CONTACT_FILTER_SNAPSHOT_PARAM, False)
+        with patch.dict(CONTACT_FILTERS, clear=True):
+            # Sin filtro publicado todas las consultas van al índice
+            self.assertTrue(Partner._contact_maybe_registered(email_key='nadie@example.com'))
+            self.assertFalse(Partner._is_contact_registered(email='nadie@example.com'))
+
+            Partner._cron_rebuild_contact_filter()
+            self.assertTrue(Partner._contact_maybe_registered(email_key='unico.contacto@example.com'))
+            self.assertTrue(Partner._is_contact_registered(email='Unico.Contacto@example.com'))
+            state = CONTACT_FILTERS[self.env.cr.dbname]
+            snapshot_id = state['snapshot_id']
+
+            # Cambio hecho por otro worker: sólo lo ve la sincronización por write_date
+            self._set_email(self.other, 'cambiado.contacto@example.com', 'cambiado.contacto@example.com')
+            state['synced_at'] = 0.0
+            self.assertTrue(Partner._contact_maybe_registered(email_key='cambiado.contacto@example.com'))
+            self.assertTrue(Partner._is_contact_registered(email='cambiado.contacto@example.com'))
+
+            # Una nueva publicación del cron reemplaza el filtro del proceso
+            Partner._cron_rebuild_contact_filter()
+            CONTACT_FILTERS[self.env.cr.dbname]['synced_at'] = 0.0
+            Partner._get_contact_filter()
+            self.assertNotEqual(CONTACT_FILTERS[self.env.cr.dbname]['snapshot_id'], snapshot_id)
+            self.assertFalse(self.env['ir.attachment'].sudo().browse(snapshot_id).exists())
+            self.assertIn('lookups', Partner._get_contact_filter_stats())
@@ -0,0 +1,89 @@
+from odoo.tests import BaseCase, tagged
+from odoo.addons.plealtad.tools.bloom import SERIAL_HEADER, BloomFilter
+from odoo.addons.plealtad.tools.lru_cache import LRUCache
+
+
+@tagged('post_install', '-at_install')
+class TestBloomFilter(BaseCase):
+    """Filtro de Bloom del registro: pertenencia, tasa de error y serialización."""
+
+    def test_no_false_negatives(self):
+        """Todo elemento agregado se reporta como presente"""
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'e:cliente{i}@example.com' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertEqual(len(bloom), 1000)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate(self):
+        """Dentro de la capacidad los falsos positivos se mantienen cerca de la tasa objetivo"""
+        bloom = BloomFilter(2000, 0.01)
+        for i in range(2000):
+            bloom.add(f'p:55{i:08d}')
+        false_positives = sum(f'p:33{i:08d}' in bloom for i in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+        self.assertLess(bloom.expected_error_rate(), 0.02)
+
+    def test_dumps_loads_roundtrip(self):
+        """El filtro publicado por el cron se carga igual en otro proceso"""
+        bloom = BloomFilter(500, 0.001)
+        for i in range(300):
+            bloom.add(f'e:{i}@example.com')
+        loaded = BloomFilter.loads(bloom.dumps())
+        self.assertEqual(
+            (loaded.capacity, loaded.error_rate, loaded.size, loaded.hash_count, len(loaded)),
+            (bloom.capacity, bloom.error_rate, bloom.size, bloom.hash_count, len(bloom)),
+        )
+        self.assertTrue(all(f'e:{i}@example.com' in loaded for i in range(300)))
+        loaded.add('e:nuevo@example.com')
+        self.assertIn('e:nuevo@example.com', loaded)
+        self.assertNotIn('e:nuevo@example.com', bloom)
+
+    def test_loads_rejects_invalid_data(self):
+        """Un adjunto truncado o vacío no produce un filtro con falsos negativos"""
+        data = BloomFilter(100).dumps()
+        for invalid in (b'', data[:SERIAL_HEADER.size - 1], data[:-1], data + b'\x00'):
+            with self.assertRaises(ValueError):
+                BloomFilter.loads(invalid)
+
+
+@tagged('post_install', '-at_install')
+class TestLRUCache(BaseCase):
+    """Caché LRU de los snapshots del portal."""
+
+    def test_evicts_least_recently_used(self):
+        """Al exceder el tamaño se desaloja el elemento usado hace más tiempo"""
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_overwrite_refreshes_entry(self):
+        """Reescribir una llave la marca como la más reciente"""
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 10)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 10)
+        self.assertIsNone(cache.get('b'))
+
+    def test_hits_misses_pop_clear(self):
+        """Contadores de aciertos y fallos, eliminación y vaciado"""
+        cache = LRUCache(max_size=10)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('x')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.get('x', 'default'), 'default')
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        cache.set('b', 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
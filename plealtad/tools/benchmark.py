@@ -0,0 +1,438 @@
+"""
+Benchmarks del programa de lealtad.
+
+Se ejecutan desde ``odoo-bin shell`` sobre una base de datos de pruebas:
+
+    >>> from odoo.addons.plealtad.tools import benchmark
+    >>> benchmark.benchmark_partner_compute(env, partner_count=100000)
+    >>> benchmark.benchmark_points_import(env, card_count=10000)
+    >>> benchmark.run_benchmark_suite(env, scale='100k', output_path='/tmp/plealtad_100k.json')
+
+Todos los datos generados se crean dentro de un savepoint que se revierte al
+terminar, por lo que la base de datos queda intacta.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+import json
+import logging
+import random
+import re
+import time
+import tracemalloc
+
+from odoo import fields
+from odoo.addons.plealtad.tools import synthetic_data
+
+_logger = logging.getLogger(__name__)
+
+
+def measure(env, label, func, *args, **kwargs):
+    """
+    Ejecuta una función con la caché vacía y mide su duración.
+
+    Args:
+        env: Entorno de Odoo
+        label (str): Nombre de la medición
+        func (callable): Función a medir
+
+    Returns:
+        dict: Nombre, segundos transcurridos y resultado de la función
+    """
+    env.invalidate_all()
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    _logger.warning(f'[benchmark] {label}: {elapsed:.3f}s')
+    return {'label': label, 'seconds': elapsed, 'result': result}
+
+
+def ensure_loyalty_partners(env, partner_count, batch_size=5000):
+    """
+    Obtiene partners con tarjeta de lealtad, creando los faltantes.
+
+    Args:
+        env: Entorno de Odoo
+        partner_count (int): Número de partners requeridos
+        batch_size (int): Registros creados por lote
+
+    Returns:
+        res.partner: Partners con tarjeta en el programa por defecto
+    """
+    program = env.ref('plealtad.default_loyalty_program')
+    Partner = env['res.partner'].sudo()
+    Card = env['loyalty.card'].sudo()
+
+    partners = Partner.search([('loyalty_card_ids.program_id', '=', program.id)], limit=partner_count)
+    missing = partner_count - len(partners)
+    created = 0
+    while created < missing:
+        size = min(batch_size, missing - created)
+        new_partners = Partner.create([{
+            'name': f'Benchmark Lealtad {created + i}',
+        } for i in range(size)])
+        Card.create([{
+            'partner_id': partner.id,
+            'program_id': program.id,
+            'points': (partner.id % 1000) * 1.5,
+        } for partner in new_partners])
+        partners |= new_partners
+        created += size
+    env.flush_all()
+    return partners
+
+
+def _legacy_loyalty_values(partners):
+    """Reproduce el cálculo anterior: tres pasadas por partner con su log."""
+    logger = logging.getLogger('odoo.addons.plealtad.models.res_partner')
+    values = {}
+    for partner in partners:
+        active_cards = partner.loyalty_card_ids.filtered(
+            lambda c: c.program_id.program_type == 'loyalty' and c.program_id.active
+        )
+        points = sum(active_cards.mapped('points'))
+        logger.info(f'Puntos calculados para {partner.name}: {points}')
+        values[partner.id] = [points]
+    for partner in partners:
+        active_cards = partner.loyalty_card_ids.filtered(
+            lambda c: c.program_id.program_type == 'loyalty' and c.program_id.active
+        )
+        logger.info(f'Estado de lealtad para {partner.name}: {bool(active_cards)}')
+        values[partner.id].append(bool(active_cards))
+    for partner in partners:
+        active_cards = partner.loyalty_card_ids.filtered(
+            lambda c: c.program_id.program_type == 'loyalty' and c.program_id.active
+        )
+        program = active_cards[0].program_id if active_cards else False
+        logger.info(f'Programa obtenido para {partner.name}: {program.name if program else "Ninguno"}')
+        values[partner.id].append(program)
+    return len(values)
+
+
+def _batched_loyalty_values(partners):
+    """Cálculo agrupado actual, sin escribir los valores en base de datos."""
+    fnames = ['points', 'is_loyalty_active', 'loyalty_program_id']
+    fields_list = [partners._fields[fname] for fname in fnames]
+    with partners.env.protecting(fields_list, partners):
+        partners._compute_loyalty_values()
+    return len(partners)
+
+
+def benchmark_partner_compute(env, partner_count=100000):
+    """
+    Compara el recálculo de puntos, estado y programa antes y después del
+    cálculo agrupado.
+
+    Args:
+        env: Entorno de Odoo
+        partner_count (int): Número de partners a recalcular
+
+    Returns:
+        dict: Segundos de cada variante y la aceleración obtenida
+    """
+    with env.cr.savepoint(flush=False) as savepoint:
+        partners = ensure_loyalty_partners(env, partner_count)
+        before = measure(env, f'recalculo por partner ({len(partners)})',
+                         _legacy_loyalty_values, partners.with_env(env))
+        after = measure(env, f'recalculo agrupado ({len(partners)})',
+                        _batched_loyalty_values, partners.with_env(env))
+        savepoint.rollback()
+    env.invalidate_all()
+
+    speedup = before['seconds'] / after['seconds'] if after['seconds'] else 0.0
+    _logger.warning(f'[benchmark] aceleración del recálculo de lealtad: x{speedup:.1f}')
+    return {
+        'partners': partner_count,
+        'before_seconds': before['seconds'],
+        'after_seconds': after['seconds'],
+        'speedup': speedup,
+    }
+
+
+# =========================================================================
+# Escrituras por importación de puntos
+# =========================================================================
+UPDATE_PATTERN = re.compile(r'\s*UPDATE\s+"?(\w+)"?', re.IGNORECASE)
+
+
+@contextmanager
+def count_updates(cr):
+    """
+    Cuenta las sentencias UPDATE ejecutadas en el cursor, por tabla.
+
+    Args:
+        cr: Cursor de base de datos
+
+    Yields:
+        Counter: {tabla: número de UPDATE}
+    """
+    counts = Counter()
+    execute = cr.execute
+
+    def counting_execute(query, params=None, log_exceptions=True):
+        match = UPDATE_PATTERN.match(str(getattr(query, 'code', query)))
+        if match:
+            counts[match.group(1)] += 1
+        return execute(query, params, log_exceptions)
+
+    cr.execute = counting_execute
+    try:
+        yield counts
+    finally:
+        del cr.execute
+
+
+def _legacy_compute_loyalty_values(self):
+    """Reproduce el cálculo anterior: fecha de actualización en cada recálculo."""
+    card_values = self._get_loyalty_card_values()
+    now = fields.Datetime.now()
+    for partner in self:
+        points, program = card_values.get(partner.id, (0.0, False))
+        partner.points = points
+        partner.is_loyalty_active = bool(program)
+        partner.loyalty_program_id = program
+        partner.last_points_update = now
+    # El cálculo dependiente de la fecha reescribía la expiración
+    with self.env.protecting([self._fields['points_expiration_date']], self):
+        for partner in self:
+            partner.points_expiration_date = (now + timedelta(days=365)).date()
+
+
+@contextmanager
+def _legacy_partner_writes(env):
+    """Sustituye temporalmente el cálculo y la invalidación anteriores."""
+    Partner = type(env['res.partner'])
+    Card = type(env['loyalty.card'])
+    compute = Partner._compute_loyalty_values
+    filter_changed = Card._filter_changed
+    Partner._compute_loyalty_values = _legacy_compute_loyalty_values
+    Card._filter_changed = lambda self, vals: self
+    try:
+        yield
+    finally:
+        Partner._compute_loyalty_values = compute
+        Card._filter_changed = filter_changed
+
+
+def _import_card_points(env, cards, delta):
+    """
+    Escribe los puntos tarjeta por tarjeta, como una importación.
+
+    Returns:
+        dict: UPDATE por tabla y total
+    """
+    points = {card.id: card.points + delta for card in cards}
+    # ``cr.flush`` incluye la actualización de partners que se hace antes del commit
+    env.cr.flush()
+    env.invalidate_all()
+    with count_updates(env.cr) as counts:
+        for card in cards.with_env(env):
+            card.write({'points': points[card.id]})
+        env.cr.flush()
+    result = dict(counts)
+    result['total'] = sum(counts.values())
+    return result
+
+
+def benchmark_points_import(env, card_count=10000):
+    """
+    Cuenta los UPDATE que genera una importación masiva de puntos antes y
+    después de quitar la fecha de actualización del cálculo de lealtad.
+
+    Se mide reescribiendo los mismos puntos (sin cambios) y sumando un punto
+    a cada tarjeta.
+
+    Args:
+        env: Entorno de Odoo
+        card_count (int): Número de tarjetas importadas
+
+    Returns:
+        dict: UPDATE por tabla de cada variante y escenario
+    """
+    results = {'cards': card_count}
+    with env.cr.savepoint(flush=False) as savepoint:
+        partners = ensure_loyalty_partners(env, card_count)
+        program = env.ref('plealtad.default_loyalty_program')
+        cards = partners.loyalty_card_ids.filtered(lambda c: c.program_id == program)[:card_count]
+        for scenario, delta in (('unchanged', 0.0), ('changed', 1.0)):
+            for variant in ('before', 'after'):
+                with env.cr.savepoint(flush=False) as run:
+                    if variant == 'before':
+                        with _legacy_partner_writes(env):
+                            counts = _import_card_points(env, cards, delta)
+                    else:
+                        counts = _import_card_points(env, cards, delta)
+                    run.rollback()
+                env.invalidate_all()
+                results[f'{scenario}_{variant}'] = counts
+                _logger.warning(
+                    f'[benchmark] importación {scenario} ({len(cards)} tarjetas), {variant}: '
+                    f'{counts["total"]} UPDATE, {counts.get("res_partner", 0)} en res_partner'
+                )
+        savepoint.rollback()
+    env.invalidate_all()
+    return results
+
+
+# =========================================================================
+# Suite sobre datos sintéticos
+# =========================================================================
+def profile(env, label, func, *args, trace_memory=True, **kwargs):
+    """
+    Ejecuta una función con la caché vacía y mide duración, consultas SQL y
+    pico de memoria de Python.
+
+    Args:
+        env: Entorno de Odoo
+        label (str): Nombre de la medición
+        func (callable): Función a medir
+        trace_memory (bool): Medir el pico de memoria con ``tracemalloc``,
+            que hace más lenta la ejecución
+
+    Returns:
+        dict: Nombre, segundos, consultas, pico de memoria en bytes y resultado
+    """
+    env.invalidate_all()
+    if trace_memory:
+        tracemalloc.start()
+    queries = env.cr.sql_log_count
+    started = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        env.flush_all()
+    finally:
+        elapsed = time.perf_counter() - started
+        queries = env.cr.sql_log_count - queries
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    _logger.warning(f'[benchmark] {label}: {elapsed:.3f}s, {queries} consultas, pico {peak or 0} bytes')
+    return {'label': label, 'seconds': elapsed, 'queries': queries, 'peak_memory_bytes': peak, 'result': result}
+
+
+def _bench_partner_computes(env, partners):
+    """Recalcula los valores y totales de lealtad de los partners"""
+    fnames = ['points', 'is_loyalty_active', 'loyalty_program_id', 'total_points_earned', 'total_points_redeemed']
+    with env.protecting([partners._fields[fname] for fname in fnames], partners):
+        partners._compute_loyalty_values()
+        partners._compute_total_points()
+    return len(partners)
+
+
+def _bench_points_balance(env, partner_ids):
+    """Recalcula el balance acumulado desde el primer movimiento de cada partner"""
+    env.cr.execute("""
+        SELECT DISTINCT ON (partner_id) partner_id, date, id
+          FROM loyalty_history
+         WHERE partner_id = ANY(%s)
+      ORDER BY partner_id, date, id
+    """, (partner_ids,))
+    starts = {partner_id: (date, record_id) for partner_id, date, record_id in env.cr.fetchall()}
+    env['loyalty.history'].sudo()._update_points_balance(starts)
+    return len(starts)
+
+
+def _bench_points_expiration(env):
+    """Expira todos los lotes vencidos"""
+    return env['res.partner'].sudo().check_points_expiration()
+
+
+def _bench_partner_balance(env, partner_ids):
+    """Balance actual y a hace seis meses de cada partner"""
+    History = env['loyalty.history'].sudo()
+    past = fields.Datetime.now() - timedelta(days=180)
+    for partner_id in partner_ids:
+        History.get_partner_balance(partner_id)
+        History.get_partner_balance(partner_id, past)
+    return len(partner_ids)
+
+
+def _bench_export_history(env, partner_ids):
+    """Exporta el historial completo de cada partner"""
+    History = env['loyalty.history'].sudo()
+    return sum(len(History.export_history(partner_id)) for partner_id in partner_ids)
+
+
+def _bench_uniqueness(env, count):
+    """
+    Crea partners con correo y teléfono nuevos (índice único de correo y
+    validación de teléfono) y consulta la disponibilidad de contactos
+    existentes y nuevos.
+    """
+    Partner = env['res.partner'].sudo()
+    tag = int(time.time())
+    partners = Partner.create([{
+        'name': f'Benchmark Unicidad {index}',
+        'email': f'unicidad.{tag}.{index}@{synthetic_data.SYNTHETIC_EMAIL_DOMAIN}',
+        'phone': f'56{(tag + index) % 10 ** 8:08d}',
+    } for index in range(count)])
+    env.flush_all()
+    registered = 0
+    for partner in partners:
+        registered += Partner._is_contact_registered(email=partner.email)
+        registered += Partner._is_contact_registered(phone=partner.phone)
+        registered += Partner._is_contact_registered(email=f'libre.{partner.id}@{synthetic_data.SYNTHETIC_EMAIL_DOMAIN}')
+    return registered
+
+
+def run_benchmark_suite(env, scale='10k', output_path=None, sample_size=1000, seed=42, trace_memory=True):
+    """
+    Genera datos sintéticos y ejecuta los benchmarks del módulo sobre ellos.
+
+    Cada benchmark corre en su propio savepoint, que se revierte al terminar,
+    para que todos partan de los mismos datos; los datos sintéticos también se
+    revierten al final. Los resultados se guardan en JSON para comparar
+    ejecuciones.
+
+    Args:
+        env: Entorno de Odoo
+        scale (str|int): Escala de ``synthetic_data.SCALES`` o número de partners
+        output_path (str, optional): Archivo JSON de resultados
+        sample_size (int): Partners usados en las mediciones por partner
+        seed (int): Semilla de los datos y de la muestra
+        trace_memory (bool): Medir el pico de memoria
+
+    Returns:
+        dict: Datos generados y mediciones de cada benchmark
+    """
+    output_path = output_path or f'/tmp/plealtad_benchmark_{scale}_{int(time.time())}.json'
+    report = {
+        'database': env.cr.dbname,
+        'scale': scale,
+        'sample_size': sample_size,
+        'seed': seed,
+        'started_at': fields.Datetime.to_string(fields.Datetime.now()),
+        'benchmarks': [],
+    }
+
+    with env.cr.savepoint(flush=False) as savepoint:
+        generated = profile(env, 'generate', synthetic_data.generate, env, scale, seed=seed, trace_memory=trace_memory)
+        dataset = generated['result']
+        report['dataset'] = dataset
+        report['benchmarks'].append(generated)
+
+        all_ids = range(dataset['first_partner_id'], dataset['last_partner_id'] + 1)
+        sample_ids = sorted(random.Random(seed).sample(all_ids, min(sample_size, len(all_ids))))
+        partners = env['res.partner'].sudo().browse(list(all_ids))
+
+        benchmarks = [
+            ('partner_computes', _bench_partner_computes, (env, partners)),
+            ('points_balance', _bench_points_balance, (env, sample_ids)),
+            ('check_points_expiration', _bench_points_expiration, (env,)),
+            ('get_partner_balance', _bench_partner_balance, (env, sample_ids)),
+            ('export_history', _bench_export_history, (env, sample_ids)),
+            ('uniqueness_constraints', _bench_uniqueness, (env, sample_size)),
+        ]
+        for label, func, args in benchmarks:
+            with env.cr.savepoint(flush=False) as run:
+                report['benchmarks'].append(profile(env, label, func, *args, trace_memory=trace_memory))
+                run.rollback()
+            env.invalidate_all()
+        savepoint.rollback()
+    env.invalidate_all()
+
+    with open(output_path, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2, default=str)
+    _logger.warning(f'[benchmark] resultados guardados en {output_path}')
+    return report
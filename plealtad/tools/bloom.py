@@ -0,0 +1,98 @@
+"""
+Filtro de Bloom para consultas de pertenencia sin acceso a base de datos.
+"""
+import hashlib
+import math
+import struct
+import threading
+
+# Cabecera de la forma serializada: capacidad, tasa de error, bits, hashes y elementos
+SERIAL_HEADER = struct.Struct('<QdQQQ')
+
+
+class BloomFilter:
+    """
+    Conjunto probabilístico: ``in`` nunca da falsos negativos y da falsos
+    positivos con una probabilidad cercana a ``error_rate`` mientras no se
+    exceda la capacidad.
+
+    Args:
+        capacity (int): Número de elementos previsto
+        error_rate (float): Tasa de falsos positivos objetivo
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, item):
+        """Posiciones del elemento por doble hash (Kirsch-Mitzenmacher)"""
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Agrega un elemento al filtro"""
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def dumps(self):
+        """
+        Serializa el filtro para compartirlo entre procesos.
+
+        Returns:
+            bytes: Parámetros del filtro seguidos del arreglo de bits
+        """
+        with self._lock:
+            header = SERIAL_HEADER.pack(self.capacity, self.error_rate, self.size, self.hash_count, self.count)
+            return header + bytes(self._bits)
+
+    @classmethod
+    def loads(cls, data):
+        """
+        Reconstruye un filtro serializado con ``dumps``.
+
+        Args:
+            data (bytes): Filtro serializado
+
+        Returns:
+            BloomFilter: Filtro con los mismos elementos
+
+        Raises:
+            ValueError: Si los datos no corresponden a un filtro válido
+        """
+        if len(data) < SERIAL_HEADER.size:
+            raise ValueError('Filtro de Bloom serializado incompleto')
+        capacity, error_rate, size, hash_count, count = SERIAL_HEADER.unpack_from(data)
+        bloom = cls(capacity, error_rate)
+        bits = data[SERIAL_HEADER.size:]
+        if (bloom.size, bloom.hash_count) != (size, hash_count) or len(bits) != len(bloom._bits):
+            raise ValueError('Filtro de Bloom serializado inválido')
+        bloom._bits = bytearray(bits)
+        bloom.count = count
+        return bloom
+
+    @property
+    def memory_bytes(self):
+        """Bytes ocupados por el arreglo de bits"""
+        return len(self._bits)
+
+    def expected_error_rate(self):
+        """Tasa teórica de falsos positivos con los elementos actuales"""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
@@ -0,0 +1,52 @@
+"""
+Utilidades para operaciones concurrentes sobre los saldos de lealtad.
+
+Odoo trabaja en aislamiento REPEATABLE READ: ante un conflicto de
+serialización la transacción completa debe repetirse, por lo que los
+reintentos sólo son posibles en el código que controla su propia
+transacción (crons y procesos por lotes). Las peticiones HTTP ya se repiten
+automáticamente en Odoo siempre que el error se propague.
+"""
+import logging
+import random
+import time
+from psycopg2 import errors
+
+_logger = logging.getLogger(__name__)
+
+# Errores de PostgreSQL que se resuelven repitiendo la transacción
+CONCURRENCY_ERRORS = (
+    errors.SerializationFailure,
+    errors.DeadlockDetected,
+    errors.LockNotAvailable,
+)
+
+
+def retry_on_concurrency(cr, func, max_tries=5, base_delay=0.1, max_delay=2.0):
+    """
+    Ejecuta ``func`` y confirma la transacción, repitiéndola ante conflictos
+    de concurrencia con espera exponencial y aleatoria (jitter).
+
+    Args:
+        cr: Cursor cuya transacción se confirma o revierte
+        func (callable): Operación a ejecutar; debe poder repetirse desde cero
+        max_tries (int): Número máximo de intentos
+        base_delay (float): Espera base en segundos
+        max_delay (float): Espera máxima en segundos
+
+    Returns:
+        El resultado de ``func``
+    """
+    for attempt in range(1, max_tries + 1):
+        try:
+            result = func()
+            cr.commit()
+            return result
+        except CONCURRENCY_ERRORS as e:
+            cr.rollback()
+            if attempt == max_tries:
+                _logger.error(f'Conflicto de concurrencia tras {attempt} intentos: {str(e)}')
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            _logger.info(f'Conflicto de concurrencia, reintento {attempt} en {delay:.2f}s: {type(e).__name__}')
+            time.sleep(delay)
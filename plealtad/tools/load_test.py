@@ -0,0 +1,528 @@
+"""
+Prueba de carga HTTP de las rutas de registro, login y dashboard.
+
+Envía peticiones concurrentes a una instancia local de Odoo y reporta por
+ruta la latencia p50/p95/p99, el rendimiento y la tasa de errores. Los
+correos salen hacia un servidor SMTP local que sólo los cuenta.
+
+Preparación desde ``odoo-bin shell`` (usuarios portal y servidor de correo):
+
+    >>> from odoo.addons.plealtad.tools import load_test
+    >>> logins = load_test.prepare_users(env, count=50)
+    >>> load_test.configure_mail_sink(env, port=2525)
+    >>> env.cr.commit()
+
+Ejecución, desde el mismo shell o como script independiente (sólo usa la
+biblioteca estándar):
+
+    >>> load_test.run_load_test('http://localhost:8069', env.cr.dbname, logins,
+    ...                         concurrency=16, requests_per_route=500)
+
+    $ python load_test.py --url http://localhost:8069 --db pruebas \\
+          --users-prefix carga --users 50 --concurrency 16 --requests 500
+
+Los correos de registro se encolan y los envía el cron de la bandeja de
+salida; ``mails_received`` sólo cuenta los que llegan durante la prueba.
+Al terminar, ``cleanup(env)`` elimina los usuarios, los registros de la
+prueba y el servidor de correo.
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import logging
+import math
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+_logger = logging.getLogger(__name__)
+
+LOAD_TEST_EMAIL_DOMAIN = 'load.plealtad.test'
+LOAD_TEST_USER_PREFIX = 'carga'
+LOAD_TEST_PASSWORD = 'Carga-Plealtad-2024'
+MAIL_SINK_SERVER_NAME = 'Prueba de carga plealtad (SMTP local)'
+
+REQUEST_TIMEOUT = 60
+CSRF_PATTERN = re.compile(r'name="csrf_token"\s+value="([^"]+)"')
+
+ROUTES = ('register_submit', 'login', 'check_email', 'get_states', 'my_loyalty')
+
+
+# =========================================================================
+# Servidor SMTP local
+# =========================================================================
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """Diálogo SMTP mínimo: acepta cualquier mensaje y lo cuenta."""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self._reply('220 plealtad-sink ESMTP')
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line.rstrip(b'\r\n') == b'.':
+                    in_data = False
+                    self.server.count_message()
+                    self._reply('250 OK')
+                continue
+            command = line.strip().split(b' ', 1)[0].upper()
+            if command == b'EHLO':
+                self._reply('250-plealtad-sink')
+                self._reply('250 SIZE 52428800')
+            elif command == b'DATA':
+                in_data = True
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self._reply('250 OK')
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """
+    Servidor SMTP local que descarta los mensajes recibidos.
+
+    Args:
+        host (str): Dirección de escucha
+        port (int): Puerto de escucha
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=2525):
+        super().__init__((host, port), _SmtpHandler)
+        self.messages = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count_message(self):
+        with self._lock:
+            self.messages += 1
+
+    def start(self):
+        """Atiende conexiones en un hilo de fondo"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Detiene el servidor"""
+        self.shutdown()
+        self.server_close()
+
+
+# =========================================================================
+# Preparación en Odoo
+# =========================================================================
+def prepare_users(env, count=50, prefix=LOAD_TEST_USER_PREFIX, password=LOAD_TEST_PASSWORD):
+    """
+    Crea (o reutiliza) usuarios portal con tarjeta de lealtad.
+
+    Args:
+        env: Entorno de Odoo
+        count (int): Número de usuarios
+        prefix (str): Prefijo del login
+        password (str): Contraseña común
+
+    Returns:
+        list: Logins de los usuarios
+    """
+    Users = env['res.users'].sudo().with_context(no_reset_password=True)
+    program = env.ref('plealtad.default_loyalty_program')
+    portal = env.ref('base.group_portal')
+    logins = [f'{prefix}.{index}@{LOAD_TEST_EMAIL_DOMAIN}' for index in range(count)]
+    existing = set(Users.search([('login', 'in', logins)]).mapped('login'))
+    for index, login in enumerate(logins):
+        if login in existing:
+            continue
+        user = Users.create({
+            'name': f'Usuario de Carga {index}',
+            'login': login,
+            'email': login,
+            'password': password,
+            'groups_id': [(6, 0, [portal.id])],
+        })
+        env['loyalty.card'].sudo().create({
+            'partner_id': user.partner_id.id,
+            'program_id': program.id,
+            'points': 100,
+        })
+    env.flush_all()
+    return logins
+
+
+def configure_mail_sink(env, host='127.0.0.1', port=2525):
+    """
+    Crea un servidor de correo saliente, con máxima prioridad, que apunta
+    al servidor SMTP local.
+
+    Returns:
+        ir.mail_server: Servidor configurado
+    """
+    MailServer = env['ir.mail_server'].sudo()
+    values = {
+        'name': MAIL_SINK_SERVER_NAME,
+        'smtp_host': host,
+        'smtp_port': port,
+        'smtp_encryption': 'none',
+        'sequence': 0,
+    }
+    server = MailServer.search([('name', '=', MAIL_SINK_SERVER_NAME)], limit=1)
+    if server:
+        server.write(values)
+    else:
+        server = MailServer.create(values)
+    return server
+
+
+def cleanup(env, prefix=LOAD_TEST_USER_PREFIX):
+    """
+    Elimina los usuarios de la prueba, los partners registrados durante la
+    carga y el servidor de correo local.
+
+    Returns:
+        int: Número de partners eliminados
+    """
+    Users = env['res.users'].sudo().with_context(active_test=False)
+    Partner = env['res.partner'].sudo().with_context(active_test=False)
+    users = Users.search([('login', '=like', f'{prefix}.%@{LOAD_TEST_EMAIL_DOMAIN}')])
+    partners = users.partner_id | Partner.search([('email', '=like', f'%@{LOAD_TEST_EMAIL_DOMAIN}')])
+    users.unlink()
+    env['loyalty.history'].sudo().search([('partner_id', 'in', partners.ids)]).unlink()
+    env['loyalty.card'].sudo().search([('partner_id', 'in', partners.ids)]).unlink()
+    count = len(partners)
+    partners.unlink()
+    env['ir.mail_server'].sudo().search([('name', '=', MAIL_SINK_SERVER_NAME)]).unlink()
+    return count
+
+
+# =========================================================================
+# Cliente HTTP
+# =========================================================================
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Devuelve las redirecciones como respuesta en lugar de seguirlas."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Session:
+    """
+    Sesión HTTP con sus propias cookies, como un navegador.
+
+    Args:
+        base_url (str): URL de la instancia de Odoo
+        db (str): Base de datos
+    """
+
+    def __init__(self, base_url, db):
+        self.base_url = base_url.rstrip('/')
+        self.db = db
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect()
+        )
+
+    def request(self, path, data=None, json_body=None):
+        """
+        Envía una petición y lee la respuesta completa.
+
+        Returns:
+            tuple: (código de estado, cabeceras, cuerpo)
+        """
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def json_rpc(self, path, params):
+        """Llamada JSON-RPC; devuelve (estado, respuesta decodificada)"""
+        status, __, body = self.request(path, json_body={
+            'jsonrpc': '2.0', 'method': 'call', 'params': params, 'id': random.randint(1, 10 ** 9),
+        })
+        try:
+            return status, json.loads(body)
+        except ValueError:
+            return status, {'error': body[:200].decode('utf-8', 'replace')}
+
+    def csrf_token(self, path):
+        """Obtiene el token CSRF del formulario de una página"""
+        status, __, body = self.request(path)
+        match = CSRF_PATTERN.search(body.decode('utf-8', 'replace'))
+        if status != 200 or not match:
+            raise RuntimeError(f'No se encontró el token CSRF en {path} (HTTP {status})')
+        return match.group(1)
+
+    def authenticate(self, login, password):
+        """Inicia sesión con la API de sesión web"""
+        status, result = self.json_rpc('/web/session/authenticate', {
+            'db': self.db, 'login': login, 'password': password,
+        })
+        if status != 200 or 'error' in result or not result.get('result', {}).get('uid'):
+            raise RuntimeError(f'No se pudo iniciar sesión como {login}')
+
+
+# =========================================================================
+# Escenarios: cada uno prepara lo necesario y devuelve una función que
+# ejecuta y valida una petición medida (True si fue correcta)
+# =========================================================================
+def _scenario_register_submit(base_url, db, logins, password, run_tag, counter):
+    session = Session(base_url, db)
+    token = session.csrf_token('/plealtad/register')
+
+    def call():
+        number = next(counter)
+        status, __, body = session.request('/plealtad/register/submit', data={
+            'csrf_token': token,
+            'name': f'Registro de Carga {run_tag}-{number}',
+            'email_prefix': f'registro.{run_tag}.{number}',
+            'email_domain': LOAD_TEST_EMAIL_DOMAIN,
+            'phone': f'57{(int(run_tag, 16) * 100000 + number) % 10 ** 8:08d}',
+            'password': password,
+            'confirm_password': password,
+            'terms_accepted': 'on',
+        })
+        return status == 200 and b'alert-danger' not in body
+    return call
+
+
+def _scenario_login(base_url, db, logins, password, run_tag, counter):
+    def call():
+        # Cada intento usa una sesión nueva: una sesión iniciada redirige
+        session = Session(base_url, db)
+        token = session.csrf_token('/plealtad/login')
+        login = logins[next(counter) % len(logins)]
+        started = time.perf_counter()
+        status, headers, __ = session.request('/plealtad/login', data={
+            'csrf_token': token, 'login': login, 'password': password,
+        })
+        ok = status in (302, 303) and '/my/loyalty' in (headers.get('Location') or '')
+        # Sólo se mide el envío del formulario, no la carga de la página
+        return ok, time.perf_counter() - started
+    return call
+
+
+def _scenario_check_email(base_url, db, logins, password, run_tag, counter):
+    session = Session(base_url, db)
+
+    def call():
+        number = next(counter)
+        # Mitad correos registrados, mitad libres
+        email = logins[number % len(logins)] if number % 2 else f'libre.{run_tag}.{number}@{LOAD_TEST_EMAIL_DOMAIN}'
+        status, result = session.json_rpc('/plealtad/check_email', {'email': email})
+        return status == 200 and 'error' not in result
+    return call
+
+
+def _scenario_get_states(base_url, db, logins, password, run_tag, counter):
+    # Los países se leen con un usuario portal; la petición medida es anónima
+    reader = Session(base_url, db)
+    reader.authenticate(logins[0], password)
+    status, result = reader.json_rpc('/web/dataset/call_kw/res.country/search', {
+        'model': 'res.country', 'method': 'search', 'args': [[]], 'kwargs': {},
+    })
+    country_ids = result.get('result') or []
+    if status != 200 or not country_ids:
+        raise RuntimeError('No se pudieron leer los países')
+    session = Session(base_url, db)
+
+    def call():
+        country_id = country_ids[next(counter) % len(country_ids)]
+        status, result = session.json_rpc('/plealtad/get_states', {'country_id': country_id})
+        return status == 200 and 'error' not in result
+    return call
+
+
+def _scenario_my_loyalty(base_url, db, logins, password, run_tag, counter):
+    session = Session(base_url, db)
+    session.authenticate(logins[next(counter) % len(logins)], password)
+
+    def call():
+        status, __, __ = session.request('/my/loyalty')
+        return status == 200
+    return call
+
+
+SCENARIOS = {
+    'register_submit': _scenario_register_submit,
+    'login': _scenario_login,
+    'check_email': _scenario_check_email,
+    'get_states': _scenario_get_states,
+    'my_loyalty': _scenario_my_loyalty,
+}
+
+
+# =========================================================================
+# Ejecución y reporte
+# =========================================================================
+def percentile(sorted_values, fraction):
+    """Percentil por rango más cercano de una lista ordenada"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _run_route(route, base_url, db, logins, password, concurrency, requests, run_tag):
+    """
+    Ejecuta ``requests`` peticiones a una ruta con ``concurrency`` hilos.
+
+    Returns:
+        dict: Latencias, rendimiento y errores de la ruta
+    """
+    counter = itertools.count()
+    remaining = itertools.count()
+    latencies = []
+    errors = {'count': 0, 'samples': []}
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            call = SCENARIOS[route](base_url, db, logins, password, run_tag, counter)
+        except Exception as e:
+            with lock:
+                errors['samples'].append(f'preparación: {e}')
+            return
+        while next(remaining) < requests:
+            started = time.perf_counter()
+            try:
+                result = call()
+                ok, elapsed = result if isinstance(result, tuple) else (result, time.perf_counter() - started)
+                error = None if ok else 'respuesta inválida'
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                error = str(e)
+            with lock:
+                latencies.append(elapsed)
+                if error:
+                    errors['count'] += 1
+                    if len(errors['samples']) < 5:
+                        errors['samples'].append(error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for __ in range(concurrency):
+            executor.submit(worker)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies)
+    return {
+        'route': route,
+        'requests': total,
+        'errors': errors['count'],
+        'error_rate': errors['count'] / total if total else 1.0,
+        'throughput_rps': (total - errors['count']) / wall if wall else 0.0,
+        'p50_ms': (percentile(latencies, 0.50) or 0) * 1000,
+        'p95_ms': (percentile(latencies, 0.95) or 0) * 1000,
+        'p99_ms': (percentile(latencies, 0.99) or 0) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0) * 1000,
+        'seconds': wall,
+        'error_samples': errors['samples'],
+    }
+
+
+def run_load_test(base_url, db, logins, password=LOAD_TEST_PASSWORD, concurrency=8, requests_per_route=200,
+                  routes=ROUTES, smtp_port=2525, output_path=None):
+    """
+    Ejecuta la prueba de carga ruta por ruta.
+
+    Args:
+        base_url (str): URL de la instancia de Odoo
+        db (str): Base de datos
+        logins (list): Logins de usuarios portal (``prepare_users``)
+        password (str): Contraseña de los usuarios
+        concurrency (int): Peticiones simultáneas
+        requests_per_route (int): Peticiones medidas por ruta
+        routes (tuple): Rutas a probar, de ``ROUTES``
+        smtp_port (int, optional): Puerto del servidor SMTP local; None si
+            ya hay uno en ejecución
+        output_path (str, optional): Archivo JSON de resultados
+
+    Returns:
+        dict: Parámetros, resultados por ruta y correos recibidos
+    """
+    sink = SmtpSink(port=smtp_port).start() if smtp_port else None
+    run_tag = f'{int(time.time()) % 16 ** 6:06x}'
+    report = {
+        'base_url': base_url,
+        'database': db,
+        'concurrency': concurrency,
+        'requests_per_route': requests_per_route,
+        'routes': [],
+    }
+    try:
+        for route in routes:
+            result = _run_route(route, base_url, db, logins, password, concurrency, requests_per_route, run_tag)
+            report['routes'].append(result)
+            _logger.warning(
+                f'[carga] {route}: p50 {result["p50_ms"]:.0f}ms, p95 {result["p95_ms"]:.0f}ms, '
+                f'p99 {result["p99_ms"]:.0f}ms, {result["throughput_rps"]:.1f} req/s, '
+                f'errores {result["error_rate"]:.1%}'
+            )
+    finally:
+        if sink:
+            report['mails_received'] = sink.messages
+            sink.stop()
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+    return report
+
+
+def main():
+    """Ejecución como script independiente"""
+    parser = argparse.ArgumentParser(description='Prueba de carga HTTP del programa de lealtad')
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--users', type=int, default=50, help='Usuarios creados con prepare_users')
+    parser.add_argument('--users-prefix', default=LOAD_TEST_USER_PREFIX)
+    parser.add_argument('--password', default=LOAD_TEST_PASSWORD)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por ruta')
+    parser.add_argument('--routes', default=','.join(ROUTES))
+    parser.add_argument('--smtp-port', type=int, default=2525, help='0 para no iniciar el servidor SMTP local')
+    parser.add_argument('--output', help='Archivo JSON de resultados')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    logins = [f'{args.users_prefix}.{index}@{LOAD_TEST_EMAIL_DOMAIN}' for index in range(args.users)]
+    report = run_load_test(
+        args.url, args.db, logins,
+        password=args.password,
+        concurrency=args.concurrency,
+        requests_per_route=args.requests,
+        routes=tuple(route for route in args.routes.split(',') if route),
+        smtp_port=args.smtp_port or None,
+        output_path=args.output,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
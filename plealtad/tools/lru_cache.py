@@ -0,0 +1,53 @@
+"""
+Caché en memoria de tamaño acotado, compartida por los hilos de un worker.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Diccionario con tamaño máximo que desaloja el elemento usado hace más tiempo.
+
+    Args:
+        max_size (int): Número máximo de elementos
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Obtiene un elemento y lo marca como el más reciente"""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key, value):
+        """Guarda un elemento desalojando el menos usado si se excede el tamaño"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Elimina un elemento de la caché"""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._data.clear()
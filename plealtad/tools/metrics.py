@@ -0,0 +1,215 @@
+"""
+Métricas de los puntos críticos del programa de lealtad.
+
+Cada worker acumula en memoria contadores e histogramas de latencia y los
+suma periódicamente a la tabla ``loyalty_metric`` con un upsert, por lo que
+``/plealtad/metrics`` publica los totales de todos los workers. Registrar una
+medición sólo actualiza un diccionario bajo un lock; el acceso a base de
+datos ocurre, como mucho, una vez cada ``FLUSH_INTERVAL`` segundos.
+"""
+import functools
+import logging
+import threading
+import time
+
+from psycopg2 import errors
+
+_logger = logging.getLogger(__name__)
+
+# Segundos entre escrituras de las métricas pendientes de cada worker
+FLUSH_INTERVAL = 10
+
+# Límites superiores (segundos) de los histogramas de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Familias publicadas: {nombre: (tipo, descripción)}
+METRIC_FAMILIES = {
+    'plealtad_method_calls_total': ('counter', 'Llamadas a métodos del programa de lealtad'),
+    'plealtad_method_duration_seconds': ('histogram', 'Duración de los métodos del programa de lealtad'),
+    'plealtad_http_requests_total': ('counter', 'Peticiones HTTP a las rutas de lealtad'),
+    'plealtad_http_request_duration_seconds': ('histogram', 'Duración de las peticiones HTTP a las rutas de lealtad'),
+    'plealtad_points_expired_lots_total': ('counter', 'Lotes de puntos expirados'),
+    'plealtad_order_queue_pending': ('gauge', 'Pedidos pendientes de acreditar puntos'),
+    'plealtad_order_queue_failed': ('gauge', 'Pedidos cuya acreditación falló definitivamente'),
+    'plealtad_order_queue_lag_seconds': ('gauge', 'Antigüedad del pedido pendiente más antiguo'),
+}
+
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+def format_labels(labels):
+    """
+    Serializa las etiquetas en el formato de texto de Prometheus.
+
+    Args:
+        labels (dict): {etiqueta: valor}
+
+    Returns:
+        str: ``a="x",b="y"`` ordenado por etiqueta
+    """
+    if not labels:
+        return ''
+    return ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in sorted(labels.items())
+    )
+
+
+def format_bucket(bound):
+    """Valor de la etiqueta ``le`` de un límite del histograma"""
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class MetricsRegistry:
+    """
+    Acumulador de métricas de un worker, separado por base de datos.
+
+    Los histogramas se guardan ya acumulados por límite (``_bucket``), más
+    su ``_sum`` y ``_count``, para que la suma entre workers sea directa.
+
+    Args:
+        flush_interval (float): Segundos entre escrituras en base de datos
+        buckets (tuple): Límites de los histogramas
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, buckets=DEFAULT_BUCKETS):
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _add(self, dbname, samples):
+        with self._lock:
+            pending = self._pending.setdefault(dbname, {})
+            for key, value in samples:
+                pending[key] = pending.get(key, 0.0) + value
+
+    def inc(self, dbname, name, labels=None, value=1.0):
+        """Incrementa un contador"""
+        self._add(dbname, [((name, format_labels(labels)), value)])
+
+    def observe(self, dbname, name, value, labels=None):
+        """Registra una observación en un histograma"""
+        labels = dict(labels or {})
+        samples = [
+            ((f'{name}_bucket', format_labels(dict(labels, le=format_bucket(bound)))), 1.0 if value <= bound else 0.0)
+            for bound in self.buckets
+        ]
+        label_text = format_labels(labels)
+        samples.append(((f'{name}_sum', label_text), value))
+        samples.append(((f'{name}_count', label_text), 1.0))
+        self._add(dbname, samples)
+
+    def get_pending(self, dbname):
+        """Copia de las métricas aún no guardadas de una base de datos"""
+        with self._lock:
+            return dict(self._pending.get(dbname, {}))
+
+    def _take(self, dbname):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            return self._pending.pop(dbname, {})
+
+    def flush(self, dbname):
+        """
+        Suma las métricas pendientes del worker a ``loyalty_metric`` en una
+        transacción propia, independiente de la petición en curso.
+
+        Si la escritura falla las métricas vuelven a quedar pendientes, salvo
+        que la tabla aún no exista (módulo en instalación).
+        """
+        pending = self._take(dbname)
+        if not pending:
+            return
+        from odoo.sql_db import db_connect
+        keys = sorted(pending)
+        try:
+            with db_connect(dbname).cursor() as cr:
+                # Orden fijo de las filas: dos workers no se bloquean mutuamente
+                cr.execute("""
+                    INSERT INTO loyalty_metric (name, labels, value)
+                    SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::float[])
+                        ON CONFLICT (name, labels) DO UPDATE SET
+                           value = loyalty_metric.value + EXCLUDED.value
+                """, ([name for name, __ in keys], [labels for __, labels in keys], [pending[key] for key in keys]))
+        except errors.UndefinedTable:
+            return
+        except Exception as e:
+            _logger.warning(f'No se pudieron guardar las métricas de lealtad: {str(e)}')
+            self._add(dbname, pending.items())
+
+    def maybe_flush(self, dbname):
+        """Guarda las métricas pendientes si ya pasó el intervalo"""
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush(dbname)
+
+
+METRICS = MetricsRegistry()
+
+
+def timed(method):
+    """
+    Decorador que cuenta las llamadas a un método de modelo y mide su
+    duración, etiquetadas con ``method`` y el resultado (``ok``/``error``).
+
+    Args:
+        method (str): Nombre publicado del método
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                result = func(self, *args, **kwargs)
+                status = 'ok'
+                return result
+            finally:
+                dbname = self.env.cr.dbname
+                METRICS.inc(dbname, 'plealtad_method_calls_total', {'method': method, 'status': status})
+                METRICS.observe(dbname, 'plealtad_method_duration_seconds',
+                                time.perf_counter() - started, {'method': method})
+                METRICS.maybe_flush(dbname)
+        return wrapper
+    return decorator
+
+
+def render(samples):
+    """
+    Genera el formato de texto de Prometheus.
+
+    Args:
+        samples (list): Tuplas (nombre, etiquetas serializadas, valor)
+
+    Returns:
+        str: Cuerpo de la respuesta
+    """
+    families = {}
+    for name, labels, value in samples:
+        family = name
+        for suffix in HISTOGRAM_SUFFIXES:
+            base = name[:-len(suffix)]
+            if name.endswith(suffix) and METRIC_FAMILIES.get(base, ('',))[0] == 'histogram':
+                family = base
+                break
+        families.setdefault(family, []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(families):
+        kind, help_text = METRIC_FAMILIES.get(family, ('untyped', family))
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(families[family], key=_sample_order):
+            lines.append(f'{name}{{{labels}}} {value!r}' if labels else f'{name} {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def _sample_order(sample):
+    """Orden de las muestras: por serie y, en los histogramas, por límite"""
+    name, labels, __ = sample
+    bound = float('inf')
+    if 'le="' in labels:
+        bound = float(labels.split('le="', 1)[1].split('"', 1)[0])
+    series = ','.join(part for part in labels.split(',') if not part.startswith('le='))
+    return (name, series, bound)
@@ -0,0 +1,138 @@
+"""
+Conteo de consultas SQL por página del portal.
+
+Renderiza una página del portal dentro del mismo proceso (sin servidor HTTP)
+con la sesión de un usuario portal y cuenta las consultas ejecutadas, antes
+y después de los valores perezosos del layout de lealtad:
+
+    >>> from odoo.addons.plealtad.tools import portal_queries
+    >>> portal_queries.compare_portal_queries(env, 'portal', path='/my/orders')
+
+La variante "antes" reemplaza temporalmente
+``LoyaltyPortal._prepare_portal_layout_values`` por el cálculo anterior.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from werkzeug.test import Client
+
+import odoo
+from odoo import api
+from odoo.http import request
+from odoo.service import security
+from odoo.addons.plealtad.controllers.portal import LoyaltyPortal
+
+_logger = logging.getLogger(__name__)
+
+
+def _legacy_prepare_portal_layout_values(self):
+    """Reproduce el layout anterior: valores calculados en cada página."""
+    values = super(LoyaltyPortal, self)._prepare_portal_layout_values()
+    partner = request.env.user.partner_id
+    values.update({
+        'loyalty_points': getattr(partner, 'loyalty_points', 0),
+        'is_loyalty_active': partner.is_loyalty_active,
+        'loyalty_program': partner.loyalty_program_id,
+        'page_name': 'loyalty'
+    })
+    return values
+
+
+@contextmanager
+def _legacy_layout():
+    """Sustituye temporalmente el layout perezoso por el cálculo anterior."""
+    current = LoyaltyPortal._prepare_portal_layout_values
+    LoyaltyPortal._prepare_portal_layout_values = _legacy_prepare_portal_layout_values
+    try:
+        yield
+    finally:
+        LoyaltyPortal._prepare_portal_layout_values = current
+
+
+def _portal_session(env, login):
+    """
+    Crea y guarda una sesión autenticada del usuario indicado.
+
+    Args:
+        env: Entorno de Odoo
+        login (str): Login del usuario portal
+
+    Returns:
+        str: Identificador de la sesión
+    """
+    user = env['res.users'].sudo().search([('login', '=', login)], limit=1)
+    if not user:
+        raise ValueError(f'No existe el usuario {login}')
+    user_env = api.Environment(env.cr, user.id, {})
+
+    session = odoo.http.root.session_store.new()
+    session.update(odoo.http.get_default_session(), db=env.cr.dbname)
+    session.uid = user.id
+    session.login = login
+    session.session_token = security.compute_session_token(session, user_env)
+    session.context = dict(user_env['res.users'].context_get())
+    odoo.http.root.session_store.save(session)
+
+    return session.sid
+
+
+def count_portal_queries(session_id, path, runs=5):
+    """
+    Renderiza una ruta varias veces y cuenta sus consultas.
+
+    Args:
+        session_id (str): Sesión autenticada
+        path (str): Ruta del portal a renderizar
+        runs (int): Número de renderizados
+
+    Returns:
+        list: Consultas ejecutadas en cada renderizado
+    """
+    client = Client(odoo.http.root)
+    headers = {'Cookie': f'session_id={session_id}'}
+    counts = []
+    thread = threading.current_thread()
+    for _i in range(runs):
+        response = client.get(path, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} respondió {response.status_code}')
+        counts.append(getattr(thread, 'query_count', 0))
+    return counts
+
+
+def compare_portal_queries(env, login, path='/my/orders', runs=5):
+    """
+    Compara las consultas por renderizado antes y después del layout perezoso.
+
+    Las peticiones usan su propio cursor, por lo que los datos de la base
+    deben estar confirmados antes de llamar a esta función.
+
+    Args:
+        env: Entorno de Odoo
+        login (str): Login del usuario portal
+        path (str): Ruta del portal a medir
+        runs (int): Renderizados por variante; el primero calienta cachés
+
+    Returns:
+        dict: Consultas de cada variante (mínimo de los renderizados)
+    """
+    session_id = _portal_session(env, login)
+    env.cr.commit()
+
+    with _legacy_layout():
+        before = count_portal_queries(session_id, path, runs)
+    after = count_portal_queries(session_id, path, runs)
+
+    result = {
+        'path': path,
+        'before_queries': min(before),
+        'after_queries': min(after),
+        'before_runs': before,
+        'after_runs': after,
+    }
+    _logger.warning(
+        f'[portal] {path}: {result["before_queries"]} consultas antes, '
+        f'{result["after_queries"]} después'
+    )
+    return result
@@ -0,0 +1,112 @@
+"""
+Pruebas de estrés de los movimientos de puntos.
+
+Se ejecutan desde ``odoo-bin shell`` sobre una base de datos de pruebas:
+
+    >>> from odoo.addons.plealtad.tools import stress
+    >>> stress.stress_card_mutations(env, workers=8, operations=200)
+
+Cada operación corre en su propio cursor y transacción, igual que dos
+peticiones o trabajos simultáneos sobre el mismo cliente.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from odoo import api, SUPERUSER_ID
+from odoo.exceptions import ValidationError
+from odoo.addons.plealtad.tools.concurrency import retry_on_concurrency
+
+_logger = logging.getLogger(__name__)
+
+
+def stress_card_mutations(env, workers=8, operations=200, points=10.0, cleanup=True):
+    """
+    Acredita y redime puntos en paralelo sobre una misma tarjeta y verifica
+    que no se pierdan actualizaciones ni se redima más de lo disponible.
+
+    Args:
+        env: Entorno de Odoo
+        workers (int): Hilos concurrentes
+        operations (int): Operaciones por hilo, alternando abono y redención
+        points (float): Puntos por abono; cada redención usa 1.5 veces esta cantidad
+        cleanup (bool): Eliminar el cliente de prueba al terminar
+
+    Returns:
+        dict: Totales esperados, saldo final y si la prueba fue consistente
+    """
+    registry = env.registry
+
+    with registry.cursor() as cr:
+        setup_env = api.Environment(cr, SUPERUSER_ID, {})
+        program = setup_env.ref('plealtad.default_loyalty_program')
+        partner = setup_env['res.partner'].create({'name': 'Prueba de Estrés Lealtad'})
+        card = setup_env['loyalty.card'].create({
+            'partner_id': partner.id,
+            'program_id': program.id,
+            'points': 0,
+        })
+        partner_id, card_id = partner.id, card.id
+
+    def worker(index):
+        totals = {'earned': 0.0, 'redeemed': 0.0, 'rejected': 0}
+        for operation in range(operations):
+            with registry.cursor() as cr:
+                worker_env = api.Environment(cr, SUPERUSER_ID, {})
+
+                def earn():
+                    worker_env.invalidate_all()
+                    worker_env['res.partner'].browse(partner_id).add_loyalty_points(
+                        points, 'Prueba de estrés', f'STRESS-{index}-{operation}'
+                    )
+
+                def redeem():
+                    worker_env.invalidate_all()
+                    worker_env['res.partner'].browse(partner_id).redeem_points(
+                        points * 1.5, f'STRESS-{index}-{operation}'
+                    )
+
+                if operation % 2 == 0:
+                    retry_on_concurrency(cr, earn)
+                    totals['earned'] += points
+                else:
+                    try:
+                        retry_on_concurrency(cr, redeem)
+                        totals['redeemed'] += points * 1.5
+                    except ValidationError:
+                        cr.rollback()
+                        totals['rejected'] += 1
+        return totals
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(worker, range(workers)))
+
+    earned = sum(r['earned'] for r in results)
+    redeemed = sum(r['redeemed'] for r in results)
+    rejected = sum(r['rejected'] for r in results)
+
+    with registry.cursor() as cr:
+        check_env = api.Environment(cr, SUPERUSER_ID, {})
+        final_points = check_env['loyalty.card'].browse(card_id).points
+        ledger_balance = check_env['loyalty.history'].get_partner_balance(partner_id)
+        if cleanup:
+            check_env['res.partner'].browse(partner_id).unlink()
+
+    expected = earned - redeemed
+    consistent = (
+        abs(final_points - expected) < 0.001
+        and abs(ledger_balance - expected) < 0.001
+        and final_points >= 0
+    )
+    result = {
+        'workers': workers,
+        'operations': workers * operations,
+        'earned': earned,
+        'redeemed': redeemed,
+        'rejected_redemptions': rejected,
+        'expected_points': expected,
+        'card_points': final_points,
+        'ledger_balance': ledger_balance,
+        'consistent': consistent,
+    }
+    log = _logger.warning if consistent else _logger.error
+    log(f'[estrés] {result}')
+    return result
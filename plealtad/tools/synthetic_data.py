@@ -0,0 +1,334 @@
+"""
+Generador de datos sintéticos del programa de lealtad.
+
+Carga partners, tarjetas e historial con ``COPY`` por bloques y después
+reconstruye los datos derivados (resúmenes, lotes de puntos y puntos de
+control) con las mismas rutinas por lotes del módulo. Se ejecuta desde
+``odoo-bin shell`` sobre una base de datos de pruebas:
+
+    >>> from odoo.addons.plealtad.tools import synthetic_data
+    >>> synthetic_data.generate(env, scale='100k')
+    >>> env.cr.commit()
+
+Con la misma semilla los datos generados son idénticos (salvo los IDs), por
+lo que dos ejecuciones de los benchmarks son comparables. Los partners
+sintéticos usan el dominio de correo ``SYNTHETIC_EMAIL_DOMAIN`` y se
+eliminan con ``purge(env)``.
+"""
+import io
+import logging
+import random
+import time
+from datetime import timedelta
+
+from odoo import fields
+from odoo.addons.plealtad.models.res_partner import normalize_phone
+
+_logger = logging.getLogger(__name__)
+
+# Número de partners por escala
+SCALES = {
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+
+SYNTHETIC_EMAIL_DOMAIN = 'bench.plealtad.test'
+SYNTHETIC_REASON = 'Datos sintéticos'
+
+# Partners por bloque de COPY
+COPY_CHUNK_SIZE = 20000
+
+# Movimientos promedio por partner y antigüedad máxima del historial
+HISTORY_PER_PARTNER = 5
+HISTORY_DAYS = 730
+
+
+def _reserve_ids(cr, table, count):
+    """
+    Reserva un rango consecutivo de IDs de la secuencia de una tabla.
+
+    Returns:
+        int: Primer ID del rango
+    """
+    sequence = f'{table}_id_seq'
+    cr.execute("SELECT nextval(%s)", (sequence,))
+    first = cr.fetchone()[0]
+    cr.execute("SELECT setval(%s, %s)", (sequence, first + count - 1))
+    return first
+
+
+def _copy_value(value):
+    """Valor en el formato de texto de COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value)
+
+
+def _copy(cr, table, columns, rows):
+    """
+    Carga filas con ``COPY ... FROM STDIN``.
+
+    Args:
+        cr: Cursor de base de datos
+        table (str): Tabla destino
+        columns (list): Columnas en el orden de cada fila
+        rows (list): Tuplas de valores sin tabuladores ni saltos de línea
+    """
+    if not rows:
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cr.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer)
+
+
+def _stored_columns(model, columns):
+    """Columnas de la lista que existen como campos guardados del modelo"""
+    return [
+        column for column in columns
+        if column == 'id' or (column in model._fields and model._fields[column].store)
+    ]
+
+
+def _partner_movements(rng, now, history_per_partner):
+    """
+    Genera los movimientos de un partner en orden cronológico.
+
+    Returns:
+        list: Tuplas (fecha, tipo, puntos, importe)
+    """
+    count = rng.randint(1, 2 * history_per_partner - 1)
+    dates = sorted(
+        now - timedelta(seconds=rng.randint(0, HISTORY_DAYS * 86400))
+        for __ in range(count)
+    )
+    balance = 0.0
+    movements = []
+    for date in dates:
+        if balance >= 50 and rng.random() < 0.25:
+            points = float(rng.randint(1, int(balance // 10)) * 10)
+            movements.append((date, 'redeem', points, None))
+            balance -= points
+        else:
+            amount = round(rng.uniform(50, 2000), 2)
+            points = round(amount * 5, 2)
+            movements.append((date, 'earn', points, amount))
+            balance += points
+    return movements
+
+
+def generate(env, scale='10k', history_per_partner=HISTORY_PER_PARTNER, seed=42, chunk_size=COPY_CHUNK_SIZE):
+    """
+    Genera partners con tarjeta de lealtad e historial de movimientos.
+
+    Args:
+        env: Entorno de Odoo
+        scale (str|int): Escala de ``SCALES`` o número de partners
+        history_per_partner (int): Movimientos promedio por partner
+        seed (int): Semilla del generador aleatorio
+        chunk_size (int): Partners por bloque de COPY
+
+    Returns:
+        dict: Rango de IDs de partners y número de filas generadas
+    """
+    started = time.perf_counter()
+    partner_count = SCALES[scale] if isinstance(scale, str) else int(scale)
+    rng = random.Random(seed)
+    cr = env.cr
+    Partner = env['res.partner'].sudo()
+    Card = env['loyalty.card'].sudo()
+    History = env['loyalty.history'].sudo()
+    program = env.ref('plealtad.default_loyalty_program')
+    company_id = program.company_id.id or env.company.id
+    policy, country_prefix = Partner._get_phone_normalization_policy()
+    now = fields.Datetime.now()
+    uid = env.uid
+
+    env.flush_all()
+    first_partner_id = _reserve_ids(cr, 'res_partner', partner_count)
+    first_card_id = _reserve_ids(cr, 'loyalty_card', partner_count)
+    run_tag = f'{first_partner_id:x}'
+
+    partner_columns = _stored_columns(Partner, [
+        'id', 'name', 'complete_name', 'email', 'email_normalized', 'email_key',
+        'phone', 'phone_normalized', 'active', 'type', 'is_company', 'partner_share',
+        'commercial_partner_id', 'points', 'is_loyalty_active', 'loyalty_program_id',
+        'loyalty_snapshot_version', 'last_points_update', 'first_purchase_made',
+        'is_loyalty_registration', 'create_uid', 'create_date', 'write_uid', 'write_date',
+    ])
+    card_columns = _stored_columns(Card, [
+        'id', 'partner_id', 'program_id', 'company_id', 'code', 'points',
+        'create_uid', 'create_date', 'write_uid', 'write_date',
+    ])
+    history_columns = _stored_columns(History, [
+        'partner_id', 'card_id', 'points', 'transaction_type', 'reason', 'date',
+        'amount', 'order_reference', 'points_balance', 'company_id',
+        'create_uid', 'create_date', 'write_uid', 'write_date',
+    ])
+
+    history_count = 0
+    for offset in range(0, partner_count, chunk_size):
+        partner_rows = []
+        card_rows = []
+        history_rows = []
+        for index in range(offset, min(offset + chunk_size, partner_count)):
+            partner_id = first_partner_id + index
+            card_id = first_card_id + index
+            balance = 0.0
+            for number, (date, transaction_type, points, amount) in enumerate(
+                    _partner_movements(rng, now, history_per_partner)):
+                balance += points if transaction_type == 'earn' else -points
+                history = {
+                    'partner_id': partner_id,
+                    'card_id': card_id,
+                    'points': points,
+                    'transaction_type': transaction_type,
+                    'reason': SYNTHETIC_REASON,
+                    'date': date,
+                    'amount': amount,
+                    'order_reference': f'SYN-{run_tag}-{index}-{number}',
+                    'points_balance': balance,
+                    'company_id': company_id,
+                    'create_uid': uid, 'create_date': now, 'write_uid': uid, 'write_date': now,
+                }
+                history_rows.append(tuple(history[column] for column in history_columns))
+                last_date = date
+
+            name = f'Cliente Sintético {run_tag}-{index}'
+            email = f'cliente.{run_tag}.{index}@{SYNTHETIC_EMAIL_DOMAIN}'
+            phone = f'55{partner_id % 10 ** 8:08d}'
+            partner = {
+                'id': partner_id,
+                'name': name,
+                'complete_name': name,
+                'email': email,
+                'email_normalized': email,
+                'email_key': email,
+                'phone': phone,
+                'phone_normalized': normalize_phone(phone, policy, country_prefix) or None,
+                'active': True,
+                'type': 'contact',
+                'is_company': False,
+                'partner_share': True,
+                'commercial_partner_id': partner_id,
+                'points': balance,
+                'is_loyalty_active': True,
+                'loyalty_program_id': program.id,
+                'loyalty_snapshot_version': 0,
+                'last_points_update': last_date,
+                'first_purchase_made': True,
+                'is_loyalty_registration': True,
+                'create_uid': uid, 'create_date': now, 'write_uid': uid, 'write_date': now,
+            }
+            partner_rows.append(tuple(partner[column] for column in partner_columns))
+            card = {
+                'id': card_id,
+                'partner_id': partner_id,
+                'program_id': program.id,
+                'company_id': company_id,
+                'code': f'SYN-{run_tag}-{index}',
+                'points': balance,
+                'create_uid': uid, 'create_date': now, 'write_uid': uid, 'write_date': now,
+            }
+            card_rows.append(tuple(card[column] for column in card_columns))
+
+        _copy(cr, 'res_partner', partner_columns, partner_rows)
+        _copy(cr, 'loyalty_card', card_columns, card_rows)
+        _copy(cr, 'loyalty_history', history_columns, history_rows)
+        history_count += len(history_rows)
+
+        # Datos derivados del bloque con las rutinas del módulo
+        partner_ids = list(range(first_partner_id + offset, first_partner_id + offset + len(partner_rows)))
+        env['loyalty.ledger.summary']._rebuild_partners(partner_ids)
+        env['loyalty.point.lot']._rebuild_partners(partner_ids)
+        _logger.info(f'Datos sintéticos: {offset + len(partner_rows)} de {partner_count} partners')
+
+    last_partner_id = first_partner_id + partner_count - 1
+    _refresh_checkpoints(env, first_partner_id, last_partner_id)
+    env.invalidate_all()
+
+    elapsed = time.perf_counter() - started
+    _logger.warning(
+        f'Datos sintéticos generados: {partner_count} partners, {history_count} movimientos en {elapsed:.1f}s'
+    )
+    return {
+        'scale': scale,
+        'partners': partner_count,
+        'cards': partner_count,
+        'history': history_count,
+        'first_partner_id': first_partner_id,
+        'last_partner_id': last_partner_id,
+        'seconds': elapsed,
+    }
+
+
+def _refresh_checkpoints(env, first_partner_id, last_partner_id):
+    """
+    Genera los puntos de control de los periodos existentes para un rango de
+    partners nuevos, acumulando los movimientos mensuales con una ventana.
+    """
+    first, last = env['loyalty.balance.checkpoint']._get_periods()
+    if not last:
+        return
+    env.cr.execute("""
+        WITH monthly AS (
+            SELECT partner_id,
+                   date_trunc('month', date) + interval '1 month' AS period,
+                   SUM(CASE
+                           WHEN transaction_type = 'earn' THEN points
+                           WHEN transaction_type IN ('redeem', 'expire') THEN -points
+                           ELSE 0
+                       END) AS points
+              FROM loyalty_history
+             WHERE partner_id BETWEEN %(first_id)s AND %(last_id)s
+          GROUP BY 1, 2
+        ), opening AS (
+            SELECT partner_id, SUM(points) AS points
+              FROM monthly
+             WHERE period <= %(first)s
+          GROUP BY partner_id
+        ), grid AS (
+            SELECT p.partner_id, s.period,
+                   COALESCE(o.points, 0) + COALESCE(m.points, 0) AS points
+              FROM (SELECT DISTINCT partner_id FROM monthly) p
+        CROSS JOIN generate_series(%(first)s::timestamp, %(last)s::timestamp, interval '1 month') AS s(period)
+         LEFT JOIN opening o ON o.partner_id = p.partner_id AND s.period = %(first)s
+         LEFT JOIN monthly m ON m.partner_id = p.partner_id AND m.period = s.period AND s.period > %(first)s
+        )
+        INSERT INTO loyalty_balance_checkpoint (
+            partner_id, date, points_balance,
+            create_uid, create_date, write_uid, write_date
+        )
+        SELECT partner_id, period,
+               SUM(points) OVER (PARTITION BY partner_id ORDER BY period),
+               %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+          FROM grid
+            ON CONFLICT (partner_id, date) DO UPDATE SET
+               points_balance = EXCLUDED.points_balance
+    """, {'first_id': first_partner_id, 'last_id': last_partner_id, 'first': first, 'last': last, 'uid': env.uid})
+
+
+def purge(env):
+    """
+    Elimina los partners sintéticos y todos sus datos.
+
+    Returns:
+        int: Número de partners eliminados
+    """
+    cr = env.cr
+    env.flush_all()
+    cr.execute("SELECT id FROM res_partner WHERE email LIKE %s", (f'%@{SYNTHETIC_EMAIL_DOMAIN}',))
+    partner_ids = [row[0] for row in cr.fetchall()]
+    if partner_ids:
+        for table in ('loyalty_point_lot', 'loyalty_ledger_summary', 'loyalty_balance_checkpoint',
+                      'loyalty_history', 'loyalty_card', 'res_partner'):
+            column = 'id' if table == 'res_partner' else 'partner_id'
+            cr.execute(f'DELETE FROM {table} WHERE {column} = ANY(%s)', (partner_ids,))
+    env.invalidate_all()
+    _logger.warning(f'Datos sintéticos eliminados: {len(partner_ids)} partners')
+    return len(partner_ids)